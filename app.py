@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
 import os, sys, json, threading
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, Menu
 import tkinter.scrolledtext as st
 
 from common import *
-from dialogs import open_api_settings_dialog, open_crop_selector, reset_crop_regions, show_pdf_type_info
+from dialogs import open_api_settings_dialog, open_performance_settings_dialog, open_crop_selector, reset_crop_regions, show_pdf_type_info
 from gemini_engine import extract_gemini_task
+from rendering import configure_render_cache
 from engines import (
     merge_pdfs, split_pdfs, rotate_pdfs,
-    extract_text_internal, convert_to_excel_internal, convert_to_csv_internal,
+    extract_internal_task,
     convert_to_image_jpg, convert_to_image_png, convert_to_dxf,
     convert_to_image_tiff, convert_to_image_bmp, convert_to_svg,
     extract_tesseract_task, aggregate_local_task, combine_local_task
@@ -39,6 +41,11 @@ def show_message(msg, color=PRIMARY):
     state.root.after(0, _task)
 
 class UIController:
+    def __init__(self):
+        self.reports = []
+    def add_report(self, text):
+        """処理完了時にまとめて表示する報告（スキャンPDFの検出など）を追加する"""
+        self.reports.append(text)
     def update_overall(self, step, max_val=None, text=None):
         def _task():
             if processing_popup and processing_popup.winfo_exists():
@@ -123,6 +130,7 @@ def run_task(func, task_name):
         api_key = state.api_key_free_var.get().strip() if is_free else state.api_key_paid_var.get().strip()
         model = state.gemini_model_free_var.get() if is_free else state.gemini_model_paid_var.get()
         rpm = state.api_rpm_free_var.get() if is_free else state.api_rpm_paid_var.get()
+        tpm = state.api_tpm_free_var.get() if is_free else state.api_tpm_paid_var.get()
         
         options = {
             "rotate_deg": state.rotate_option.get(), "crop_regions": state.selected_crop_regions, "out_format": state.output_format_var.get(),
@@ -131,14 +139,38 @@ def run_task(func, task_name):
             "models_to_try": [model] if state.engine_var.get() == "Gemini" else [],
             "api_plan": plan,
             "api_rpm": rpm,
+            "api_tpm": tpm,
             "temperature": state.temperature_free_var.get() if is_free else state.temperature_paid_var.get(),
             "disable_safety": state.safety_free_var.get() if is_free else state.safety_paid_var.get(),
             "max_tokens": state.max_tokens_free_var.get() if is_free else state.max_tokens_paid_var.get(),
             "custom_prompt": state.custom_prompt_free_var.get() if is_free else state.custom_prompt_paid_var.get(),
             "threads": state.threads_free_var.get() if is_free else state.threads_paid_var.get(),
-            "extract_mode": state.extract_mode_var.get()
+            "extract_mode": state.extract_mode_var.get(),
+            "internal_workers": state.internal_workers_var.get(),
+            "internal_backend": state.internal_backend_var.get(),
+            "tesseract_workers": state.tesseract_workers_var.get(),
+            "tesseract_single_pass": state.tesseract_single_pass_var.get(),
+            "tesseract_backend": state.tesseract_backend_var.get(),
+            "tesseract_hybrid": state.tesseract_hybrid_var.get(),
+            "tesseract_adaptive_dpi": state.tesseract_adaptive_dpi_var.get(),
+            "native_images": state.native_images_var.get(),
+            "output_grouping": state.output_grouping_var.get(),
+            "gemini_resume": state.gemini_resume_var.get(),
+            "gemini_async": state.gemini_async_var.get(),
+            "gemini_async_concurrency": state.gemini_async_concurrency_var.get(),
+            "gemini_pipeline": state.gemini_pipeline_var.get(),
+            "gemini_prefetch": state.gemini_prefetch_var.get(),
+            "gemini_write_queue": state.gemini_write_queue_var.get(),
+            "gemini_render_workers": state.gemini_render_workers_var.get(),
+            "out_formats": resolve_out_formats(),
+            "result_cache": state.result_cache_var.get(),
+            "cache_max_mb": state.cache_max_mb_var.get(),
+            "render_cache_mb": state.render_cache_mb_var.get(),
+            "render_cache_spill": state.render_cache_spill_var.get()
         }
-        func(files, save_dir, options, UIController())
+        configure_render_cache(options["render_cache_mb"], options["render_cache_spill"], options["cache_max_mb"])
+        ui = UIController()
+        func(files, save_dir, options, ui)
         close_processing()
         
         def _end_status():
@@ -148,6 +180,8 @@ def run_task(func, task_name):
             else:
                 show_message("✅ 処理が完了しました", SUCCESS)
                 if state.status_label: state.status_label.config(text=f"ステータス: {task_name} が完了しました", foreground=SUCCESS)
+            if ui.reports:
+                messagebox.showinfo("処理結果の報告", "\n\n".join(ui.reports), parent=state.root)
         state.root.after(0, _end_status)
         
     except Exception as e:
@@ -169,11 +203,19 @@ def safe_run(func, task_name="処理"):
     show_processing(len(files))
     threading.Thread(target=run_task, args=(func, task_name), daemon=True).start()
 
+def resolve_out_formats():
+    """メインの出力形式に「同時に出力する形式」を加えた出力形式のリストを返す（表データ形式のみ複数指定可）"""
+    fmt = state.output_format_var.get()
+    if fmt not in TABLE_OUTPUT_FORMATS: return [fmt]
+    extras = [f for f in state.extra_formats_var.get().split(",") if f in TABLE_OUTPUT_FORMATS]
+    return list(dict.fromkeys([fmt] + extras))
+
 def run_selected_extraction():
     engine = state.engine_var.get(); fmt = state.output_format_var.get()
+    out_formats = resolve_out_formats()
     
     engine_ja = {"Internal": "標準ライブラリ", "Tesseract": "Tesseract OCR", "Gemini": "Gemini API"}.get(engine, engine)
-    task_name = f"抽出・変換 ({engine_ja} -> {fmt.upper()})"
+    task_name = f"抽出・変換 ({engine_ja} -> {'+'.join(f.upper() for f in out_formats)})"
     
     if fmt == "jpg": safe_run(convert_to_image_jpg, task_name)
     elif fmt == "png": safe_run(convert_to_image_png, task_name)
@@ -182,12 +224,8 @@ def run_selected_extraction():
     elif fmt == "svg": safe_run(convert_to_svg, task_name)
     elif fmt == "dxf": safe_run(convert_to_dxf, task_name)
     elif engine == "Internal":
-        if fmt == "txt": safe_run(extract_text_internal, task_name)
-        elif fmt == "xlsx": safe_run(convert_to_excel_internal, task_name)
-        elif fmt == "csv": safe_run(convert_to_csv_internal, task_name)
-        elif fmt in ["json", "md", "docx"]: 
-            messagebox.showinfo("情報", "標準ライブラリ（Internal）はJSON / Markdown / Word出力に未対応です。\nExcelやCSV、またはAIエンジンを使用してください。")
-            return
+        # 1回の解析結果を、指定された全ての形式 (xlsx / csv / txt / json / md / docx) へ同時に書き込む
+        safe_run(extract_internal_task, task_name)
     elif engine == "Tesseract": safe_run(extract_tesseract_task, task_name)
     elif engine == "Gemini":
         plan = state.api_plan_var.get()
@@ -225,6 +263,8 @@ def load_settings():
 
             if "api_rpm_free_var" in settings: state.api_rpm_free_var.set(settings["api_rpm_free_var"])
             if "api_rpm_paid_var" in settings: state.api_rpm_paid_var.set(settings["api_rpm_paid_var"])
+            if "api_tpm_free_var" in settings: state.api_tpm_free_var.set(settings["api_tpm_free_var"])
+            if "api_tpm_paid_var" in settings: state.api_tpm_paid_var.set(settings["api_tpm_paid_var"])
 
             if "temperature_free_var" in settings: state.temperature_free_var.set(settings["temperature_free_var"])
             if "temperature_paid_var" in settings: state.temperature_paid_var.set(settings["temperature_paid_var"])
@@ -236,6 +276,27 @@ def load_settings():
             if "custom_prompt_paid_var" in settings: state.custom_prompt_paid_var.set(settings["custom_prompt_paid_var"])
             if "threads_free_var" in settings: state.threads_free_var.set(settings["threads_free_var"])
             if "threads_paid_var" in settings: state.threads_paid_var.set(settings["threads_paid_var"])
+            if "internal_workers_var" in settings: state.internal_workers_var.set(settings["internal_workers_var"])
+            if settings.get("internal_backend_var") in [key for key, _ in INTERNAL_BACKENDS]: state.internal_backend_var.set(settings["internal_backend_var"])
+            if "tesseract_workers_var" in settings: state.tesseract_workers_var.set(settings["tesseract_workers_var"])
+            if "tesseract_single_pass_var" in settings: state.tesseract_single_pass_var.set(settings["tesseract_single_pass_var"])
+            if "tesseract_backend_var" in settings: state.tesseract_backend_var.set(settings["tesseract_backend_var"])
+            if "tesseract_hybrid_var" in settings: state.tesseract_hybrid_var.set(settings["tesseract_hybrid_var"])
+            if "tesseract_adaptive_dpi_var" in settings: state.tesseract_adaptive_dpi_var.set(settings["tesseract_adaptive_dpi_var"])
+            if "native_images_var" in settings: state.native_images_var.set(settings["native_images_var"])
+            if "output_grouping_var" in settings: state.output_grouping_var.set(settings["output_grouping_var"])
+            if "gemini_resume_var" in settings: state.gemini_resume_var.set(settings["gemini_resume_var"])
+            if "gemini_async_var" in settings: state.gemini_async_var.set(settings["gemini_async_var"])
+            if "gemini_async_concurrency_var" in settings: state.gemini_async_concurrency_var.set(settings["gemini_async_concurrency_var"])
+            if "gemini_pipeline_var" in settings: state.gemini_pipeline_var.set(settings["gemini_pipeline_var"])
+            if "gemini_prefetch_var" in settings: state.gemini_prefetch_var.set(settings["gemini_prefetch_var"])
+            if "gemini_write_queue_var" in settings: state.gemini_write_queue_var.set(settings["gemini_write_queue_var"])
+            if "gemini_render_workers_var" in settings: state.gemini_render_workers_var.set(settings["gemini_render_workers_var"])
+            if "extra_formats_var" in settings: state.extra_formats_var.set(settings["extra_formats_var"])
+            if "result_cache_var" in settings: state.result_cache_var.set(settings["result_cache_var"])
+            if "cache_max_mb_var" in settings: state.cache_max_mb_var.set(settings["cache_max_mb_var"])
+            if "render_cache_mb_var" in settings: state.render_cache_mb_var.set(settings["render_cache_mb_var"])
+            if "render_cache_spill_var" in settings: state.render_cache_spill_var.set(settings["render_cache_spill_var"])
             
             if "saved_custom_prompts" in settings:
                 state.saved_custom_prompts = settings["saved_custom_prompts"]
@@ -275,6 +336,8 @@ def save_settings():
         "gemini_model_paid_var": state.gemini_model_paid_var.get(),
         "api_rpm_free_var": state.api_rpm_free_var.get(),
         "api_rpm_paid_var": state.api_rpm_paid_var.get(),
+        "api_tpm_free_var": state.api_tpm_free_var.get(),
+        "api_tpm_paid_var": state.api_tpm_paid_var.get(),
         "temperature_free_var": state.temperature_free_var.get(),
         "temperature_paid_var": state.temperature_paid_var.get(),
         "safety_free_var": state.safety_free_var.get(),
@@ -285,6 +348,27 @@ def save_settings():
         "custom_prompt_paid_var": state.custom_prompt_paid_var.get(),
         "threads_free_var": state.threads_free_var.get(),
         "threads_paid_var": state.threads_paid_var.get(),
+        "internal_workers_var": state.internal_workers_var.get(),
+        "internal_backend_var": state.internal_backend_var.get(),
+        "tesseract_workers_var": state.tesseract_workers_var.get(),
+        "tesseract_single_pass_var": state.tesseract_single_pass_var.get(),
+        "tesseract_backend_var": state.tesseract_backend_var.get(),
+        "tesseract_hybrid_var": state.tesseract_hybrid_var.get(),
+        "tesseract_adaptive_dpi_var": state.tesseract_adaptive_dpi_var.get(),
+        "native_images_var": state.native_images_var.get(),
+        "output_grouping_var": state.output_grouping_var.get(),
+        "gemini_resume_var": state.gemini_resume_var.get(),
+        "gemini_async_var": state.gemini_async_var.get(),
+        "gemini_async_concurrency_var": state.gemini_async_concurrency_var.get(),
+        "gemini_pipeline_var": state.gemini_pipeline_var.get(),
+        "gemini_prefetch_var": state.gemini_prefetch_var.get(),
+        "gemini_write_queue_var": state.gemini_write_queue_var.get(),
+        "gemini_render_workers_var": state.gemini_render_workers_var.get(),
+        "extra_formats_var": state.extra_formats_var.get(),
+        "result_cache_var": state.result_cache_var.get(),
+        "cache_max_mb_var": state.cache_max_mb_var.get(),
+        "render_cache_mb_var": state.render_cache_mb_var.get(),
+        "render_cache_spill_var": state.render_cache_spill_var.get(),
         "saved_custom_prompts": state.saved_custom_prompts,
         "window_width": root.winfo_width(),
         "window_height": root.winfo_height()
@@ -445,220 +529,248 @@ def _on_mousewheel(event):
 # ==============================
 # アプリケーション初期化とUI構築
 # ==============================
-root = tk.Tk(); root.title(f"{APP_TITLE} {VERSION}")
-icon_path = resource_path("icon.ico")
-if os.path.exists(icon_path):
-    try:
-        root.iconphoto(True, tk.PhotoImage(file=icon_path))
-    except Exception as e:
-        try:
-            root.iconbitmap(icon_path)
-        except Exception as e2:
-            print(f"Failed to set icon: {e}, {e2}")
-root.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}+0+0")
-root.minsize(width=720, height=580) 
-root.configure(bg=BG_COLOR)
-root.bind_all("<MouseWheel>", _on_mousewheel)
-state.root = root
-
-style = ttk.Style(); style.theme_use("clam") if "clam" in style.theme_names() else None
-style.configure(".", background=BG_COLOR, font=("Segoe UI", 9))
-style.configure("Main.TFrame", background=BG_COLOR)
-style.configure("Card.TFrame", background=CARD_BG)
-style.configure("Card.TLabelframe", background=CARD_BG, borderwidth=1, bordercolor=BORDER_COLOR)
-style.configure("Card.TLabelframe.Label", background=CARD_BG, foreground=PRIMARY, font=("Segoe UI", 10, "bold"))
-style.configure("TButton", padding=4, font=("Segoe UI", 9), background="#E9ECEF", foreground=TEXT_COLOR, borderwidth=1)
-style.map("TButton", background=[("active", "#DEE2E6")])
-style.configure("Primary.TButton", background=PRIMARY, foreground="white", borderwidth=0)
-style.map("Primary.TButton", background=[("active", PRIMARY_HOVER)])
-style.configure("Warning.TButton", background=COLOR_WARNING, foreground="black", borderwidth=0)
-style.map("Warning.TButton", background=[("active", COLOR_WARNING_HOVER)])
-style.configure("Danger.TButton", background=COLOR_DANGER, foreground="white", borderwidth=0)
-style.map("Danger.TButton", background=[("active", COLOR_DANGER_HOVER)])
-style.configure("Purple.TButton", background=COLOR_PURPLE, foreground="white", borderwidth=0)
-style.map("Purple.TButton", background=[("active", COLOR_PURPLE_HOVER)])
-style.configure("TRadiobutton", background=CARD_BG, font=("Segoe UI", 9), foreground=TEXT_COLOR, padding=(8, 4))
-style.map("TRadiobutton", 
-    background=[("selected", "#E7F1FF"), ("active", "#F8F9FA")],
-    foreground=[("selected", PRIMARY), ("active", PRIMARY)],
-    font=[("selected", ("Segoe UI", 9, "bold"))]
-)
-style.configure("TCheckbutton", background=CARD_BG, font=("Segoe UI", 9), foreground=TEXT_COLOR, padding=(8, 4))
-style.map("TCheckbutton", 
-    background=[("selected", "#E7F1FF"), ("active", "#F8F9FA")],
-    foreground=[("selected", PRIMARY), ("active", PRIMARY)],
-    font=[("selected", ("Segoe UI", 9, "bold"))]
-)
-
-menubar = Menu(root)
-help_menu = Menu(menubar, tearoff=0)
-help_menu.add_command(label="PDFの内部データ構造について", command=lambda: show_text_window("PDFの内部データ構造について", PDF_TYPE_HELP_TEXT.strip()))
-help_menu.add_command(label="AI抽出の準備 (使い方)", command=lambda: show_text_window("AI抽出の準備 (使い方)", AI_HELP_TEXT.strip()))
-help_menu.add_separator()
-help_menu.add_command(label="Readmeを表示", command=show_readme)
-help_menu.add_command(label="バージョン履歴", command=show_history)
-help_menu.add_separator()
-help_menu.add_command(label="バージョン情報", command=show_version_info)
-menubar.add_cascade(label="ヘルプ", menu=help_menu)
-root.config(menu=menubar)
-
-state.rotate_option, state.save_option = tk.IntVar(value=270), tk.IntVar(value=1)
-state.engine_var, state.output_format_var = tk.StringVar(value="Internal"), tk.StringVar(value="xlsx")
-state.extract_mode_var = tk.StringVar(value="table")
-state.api_plan_var = tk.StringVar(value="free")
-state.api_key_free_var = tk.StringVar(value=get_api_key() or "")
-state.api_key_paid_var = tk.StringVar(value=get_api_key() or "")
-state.gemini_model_free_var = tk.StringVar(value="gemini-2.5-flash")
-state.gemini_model_paid_var = tk.StringVar(value="gemini-2.5-flash")
-state.api_rpm_free_var = tk.IntVar(value=12)
-state.api_rpm_paid_var = tk.IntVar(value=300)
-state.temperature_free_var = tk.DoubleVar(value=0.0)
-state.temperature_paid_var = tk.DoubleVar(value=0.0)
-state.safety_free_var = tk.BooleanVar(value=True)
-state.safety_paid_var = tk.BooleanVar(value=True)
-state.max_tokens_free_var = tk.IntVar(value=8192)
-state.max_tokens_paid_var = tk.IntVar(value=8192)
-state.custom_prompt_free_var = tk.StringVar(value="")
-state.custom_prompt_paid_var = tk.StringVar(value="")
-state.threads_free_var = tk.IntVar(value=1)
-state.threads_paid_var = tk.IntVar(value=5)
-
-main_outer = ttk.Frame(root)
-main_outer.pack(fill=tk.BOTH, expand=True)
-
-canvas = tk.Canvas(main_outer, bg=BG_COLOR, highlightthickness=0)
-scrollbar = ttk.Scrollbar(main_outer, orient=tk.VERTICAL, command=canvas.yview)
-
-main_container = ttk.Frame(canvas, padding=8, style="Main.TFrame")
-canvas_frame_id = canvas.create_window((0, 0), window=main_container, anchor="nw")
-
-def on_canvas_configure(event): canvas.itemconfig(canvas_frame_id, width=event.width)
-canvas.bind('<Configure>', on_canvas_configure)
-
-def on_frame_configure(event): canvas.configure(scrollregion=canvas.bbox("all"))
-main_container.bind('<Configure>', on_frame_configure)
-
-canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-title_frame = ttk.Frame(main_container, style="Main.TFrame"); title_frame.pack(fill=tk.X, pady=(0, 2))
-ttk.Label(title_frame, text=APP_TITLE, font=("Segoe UI", 16, "bold"), foreground=PRIMARY, background=BG_COLOR).pack(side=tk.LEFT)
-ttk.Label(title_frame, text=f" {VERSION}", font=("Segoe UI", 10), foreground=MUTED_TEXT, background=BG_COLOR).pack(side=tk.LEFT, pady=(6, 0))
-
-file_card = ttk.Frame(main_container, style="Card.TFrame", padding=5); file_card.pack(fill=tk.X, pady=2)
-btn_frame = ttk.Frame(file_card, style="Card.TFrame"); btn_frame.pack()
-ttk.Button(btn_frame, text="📄 ファイルを選択", command=select_files, width=20, style="Primary.TButton").grid(row=0, column=0, padx=8)
-ttk.Button(btn_frame, text="📁 フォルダを選択", command=select_folder, width=20, style="Primary.TButton").grid(row=0, column=1, padx=8)
-state.path_label = ttk.Label(file_card, text="未選択", background=CARD_BG, foreground=TEXT_COLOR, wraplength=580, justify="center"); state.path_label.pack(pady=(4, 0))
-
-settings_grid = ttk.Frame(main_container, style="Main.TFrame"); settings_grid.pack(fill=tk.X, pady=2); settings_grid.columnconfigure(0, weight=1); settings_grid.columnconfigure(1, weight=1)
-save_frame = ttk.LabelFrame(settings_grid, text=" 保存先設定 ", style="Card.TLabelframe", padding=4); save_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 8))
-ttk.Radiobutton(save_frame, text="元のファイルと同じフォルダ", variable=state.save_option, value=1, command=on_save_mode_change).pack(anchor="w", pady=1)
-ttk.Radiobutton(save_frame, text="任意のフォルダを指定", variable=state.save_option, value=2, command=on_save_mode_change).pack(anchor="w", pady=1)
-ttk.Button(save_frame, text="📂 フォルダ参照", command=select_save_dir).pack(pady=(2, 2))
-state.save_label = ttk.Label(save_frame, text="同じフォルダ", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 9)); state.save_label.pack()
-
-rotate_frame = ttk.LabelFrame(settings_grid, text=" 回転設定 ", style="Card.TLabelframe", padding=4); rotate_frame.grid(row=0, column=1, sticky="nsew", padx=(8, 0))
-for t, v in [("左（270°）", 270), ("上下（180°）", 180), ("右（90°）", 90)]: ttk.Radiobutton(rotate_frame, text=t, variable=state.rotate_option, value=v).pack(anchor="w", pady=1)
-
-extract_frame = ttk.LabelFrame(main_container, text=" ⚙️ データ抽出・変換設定 ", style="Card.TLabelframe", padding=5); extract_frame.pack(fill=tk.X, pady=4)
-
-engine_frame = ttk.Frame(extract_frame, style="Card.TFrame"); engine_frame.pack(fill=tk.X, pady=(0, 2))
-ttk.Label(engine_frame, text="① エンジン:", width=12, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
-engine_inner = ttk.Frame(engine_frame, style="Card.TFrame"); engine_inner.pack(anchor="w", fill=tk.X)
-for text, val in [("Python標準ライブラリ (高速・オフライン) - テキストデータ入りPDF向け（文字選択できるPDF用）", "Internal"), ("Tesseract (ローカルOCR) - ラスターデータ向け（スキャンされた印刷活字のPDF用）", "Tesseract"), ("Gemini API (超高精度AI) - ラスターデータ向け（スキャンされた手書き文字や複雑な表のPDF用）", "Gemini")]:
-    ttk.Radiobutton(engine_inner, text=text, variable=state.engine_var, value=val).pack(anchor="w", pady=1)
-
-ttk.Separator(extract_frame, orient="horizontal").pack(fill=tk.X, pady=4)
-
-format_frame = ttk.Frame(extract_frame, style="Card.TFrame"); format_frame.pack(fill=tk.X, pady=0)
-ttk.Label(format_frame, text="② 出力形式:", width=12, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
-
-formats_row1 = [("Excel (.xlsx)", "xlsx"), ("CSV (.csv)", "csv"), ("Text (.txt)", "txt"), ("JSON (.json)", "json"), ("Markdown (.md)", "md"), ("Word (.docx)", "docx")]
-formats_row2 = [("JPEG (.jpg)", "jpg"), ("PNG (.png)", "png"), ("SVG (.svg)", "svg"), ("TIFF (.tiff)", "tiff"), ("BMP (.bmp)", "bmp"), ("DXF (.dxf)", "dxf")]
-
-format_inner1 = ttk.Frame(format_frame, style="Card.TFrame"); format_inner1.pack(anchor="w", fill=tk.X)
-for text, val in formats_row1:
-    rb = ttk.Radiobutton(format_inner1, text=text, variable=state.output_format_var, value=val); rb.pack(side=tk.LEFT, padx=(0, 10)); format_radiobuttons[val] = rb
-format_inner2 = ttk.Frame(format_frame, style="Card.TFrame"); format_inner2.pack(anchor="w", fill=tk.X, pady=(2, 0))
-for text, val in formats_row2:
-    rb = ttk.Radiobutton(format_inner2, text=text, variable=state.output_format_var, value=val); rb.pack(side=tk.LEFT, padx=(0, 10)); format_radiobuttons[val] = rb
-
-ttk.Separator(extract_frame, orient="horizontal").pack(fill=tk.X, pady=4)
-
-extract_mode_frame = ttk.Frame(extract_frame, style="Card.TFrame")
-extract_mode_frame.pack(fill=tk.X, pady=(0, 2))
-ttk.Label(extract_mode_frame, text="③ 抽出モード:", width=12, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
-rb_table_mode = ttk.Radiobutton(extract_mode_frame, text="表として抽出 (セルごとに分割)", variable=state.extract_mode_var, value="table")
-rb_table_mode.pack(side=tk.LEFT, padx=(0, 10))
-rb_text_mode = ttk.Radiobutton(extract_mode_frame, text="テキストのみ抽出 (横に1行で出力)", variable=state.extract_mode_var, value="text")
-rb_text_mode.pack(side=tk.LEFT)
-
-ttk.Separator(extract_frame, orient="horizontal").pack(fill=tk.X, pady=4)
-
-api_settings_frame = ttk.Frame(extract_frame, style="Card.TFrame")
-api_settings_frame.pack(fill=tk.X, pady=2)
-ttk.Label(api_settings_frame, text="[AI用] API設定:", width=14, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
-state.btn_api_settings = ttk.Button(api_settings_frame, text="⚙️ 詳細設定 (APIキー / モデル / 制限)", command=open_api_settings_dialog, style="Primary.TButton")
-state.btn_api_settings.pack(side=tk.LEFT)
-
-state.plan_indicator = ttk.Label(api_settings_frame, text="", font=("Segoe UI", 9, "bold"), background=CARD_BG)
-state.plan_indicator.pack(side=tk.LEFT, padx=(12, 0))
-
-global crop_frame, pdf_check_frame
-crop_frame = ttk.Frame(extract_frame, style="Card.TFrame"); crop_frame.pack(fill=tk.X, pady=(4, 0))
-ttk.Label(crop_frame, text="抽出範囲:", width=14, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
-state.btn_select_crop = ttk.Button(crop_frame, text="抽出範囲を選択", command=open_crop_selector); state.btn_select_crop.pack(side=tk.LEFT)
-btn_reset_crop = ttk.Button(crop_frame, text="全体に戻す", command=reset_crop_regions, style="Warning.TButton"); btn_reset_crop.pack(side=tk.LEFT, padx=(5, 5))
-
-ttk.Label(crop_frame, text=" | プリセット:", background=CARD_BG, font=("Segoe UI", 9)).pack(side=tk.LEFT)
-ttk.Button(crop_frame, text="💾 保存", command=save_crop_preset, width=8).pack(side=tk.LEFT, padx=2)
-ttk.Button(crop_frame, text="📂 読込", command=load_crop_preset, width=8).pack(side=tk.LEFT, padx=2)
-state.preset_filename_label = ttk.Label(crop_frame, text="未読込", background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=COLOR_PURPLE)
-state.preset_filename_label.pack(side=tk.LEFT, padx=(5, 0))
-
-pdf_check_frame = ttk.Frame(extract_frame, style="Card.TFrame")
-pdf_check_frame.pack(fill=tk.X, pady=(4, 0))
-ttk.Label(pdf_check_frame, text="データ確認:", width=14, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
-btn_check_pdf = ttk.Button(pdf_check_frame, text="🔍 選択中のPDFデータ構造を確認", command=show_pdf_type_info, style="Primary.TButton")
-btn_check_pdf.pack(side=tk.LEFT)
-
-save_settings_frame = ttk.Frame(extract_frame, style="Card.TFrame")
-save_settings_frame.pack(fill=tk.X, pady=(6, 0))
-btn_save_settings = ttk.Button(save_settings_frame, text="💾 現在の選択項目を保存", command=save_settings)
-btn_save_settings.pack(side=tk.RIGHT)
+# プロセスプールのワーカー（spawn方式）としてこのモジュールが読み込まれた場合は、UIを構築しない
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
 
-action_container = ttk.Frame(main_container, style="Main.TFrame"); action_container.pack(fill=tk.BOTH, expand=True, pady=2)
-action_container.columnconfigure(0, weight=1); action_container.columnconfigure(1, weight=1)
+    root = tk.Tk(); root.title(f"{APP_TITLE} {VERSION}")
+    icon_path = resource_path("icon.ico")
+    if os.path.exists(icon_path):
+        try:
+            root.iconphoto(True, tk.PhotoImage(file=icon_path))
+        except Exception as e:
+            try:
+                root.iconbitmap(icon_path)
+            except Exception as e2:
+                print(f"Failed to set icon: {e}, {e2}")
+    root.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}+0+0")
+    root.minsize(width=720, height=580) 
+    root.configure(bg=BG_COLOR)
+    root.bind_all("<MouseWheel>", _on_mousewheel)
+    state.root = root
+
+    style = ttk.Style(); style.theme_use("clam") if "clam" in style.theme_names() else None
+    style.configure(".", background=BG_COLOR, font=("Segoe UI", 9))
+    style.configure("Main.TFrame", background=BG_COLOR)
+    style.configure("Card.TFrame", background=CARD_BG)
+    style.configure("Card.TLabelframe", background=CARD_BG, borderwidth=1, bordercolor=BORDER_COLOR)
+    style.configure("Card.TLabelframe.Label", background=CARD_BG, foreground=PRIMARY, font=("Segoe UI", 10, "bold"))
+    style.configure("TButton", padding=4, font=("Segoe UI", 9), background="#E9ECEF", foreground=TEXT_COLOR, borderwidth=1)
+    style.map("TButton", background=[("active", "#DEE2E6")])
+    style.configure("Primary.TButton", background=PRIMARY, foreground="white", borderwidth=0)
+    style.map("Primary.TButton", background=[("active", PRIMARY_HOVER)])
+    style.configure("Warning.TButton", background=COLOR_WARNING, foreground="black", borderwidth=0)
+    style.map("Warning.TButton", background=[("active", COLOR_WARNING_HOVER)])
+    style.configure("Danger.TButton", background=COLOR_DANGER, foreground="white", borderwidth=0)
+    style.map("Danger.TButton", background=[("active", COLOR_DANGER_HOVER)])
+    style.configure("Purple.TButton", background=COLOR_PURPLE, foreground="white", borderwidth=0)
+    style.map("Purple.TButton", background=[("active", COLOR_PURPLE_HOVER)])
+    style.configure("TRadiobutton", background=CARD_BG, font=("Segoe UI", 9), foreground=TEXT_COLOR, padding=(8, 4))
+    style.map("TRadiobutton", 
+        background=[("selected", "#E7F1FF"), ("active", "#F8F9FA")],
+        foreground=[("selected", PRIMARY), ("active", PRIMARY)],
+        font=[("selected", ("Segoe UI", 9, "bold"))]
+    )
+    style.configure("TCheckbutton", background=CARD_BG, font=("Segoe UI", 9), foreground=TEXT_COLOR, padding=(8, 4))
+    style.map("TCheckbutton", 
+        background=[("selected", "#E7F1FF"), ("active", "#F8F9FA")],
+        foreground=[("selected", PRIMARY), ("active", PRIMARY)],
+        font=[("selected", ("Segoe UI", 9, "bold"))]
+    )
 
-pdf_action_frame = ttk.LabelFrame(action_container, text=" ✂️ PDF編集 ", style="Card.TLabelframe", padding=4); pdf_action_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 8))
-btn_merge = ttk.Button(pdf_action_frame, text="結合 (フォルダ)", command=lambda: safe_run(merge_pdfs, "PDF結合"), style="Primary.TButton"); btn_merge.pack(fill=tk.X, pady=2)
-btn_split = ttk.Button(pdf_action_frame, text="分割", command=lambda: safe_run(split_pdfs, "PDF分割"), style="Primary.TButton"); btn_split.pack(fill=tk.X, pady=2)
-btn_rotate = ttk.Button(pdf_action_frame, text="回転", command=lambda: safe_run(rotate_pdfs, "PDF回転"), style="Primary.TButton"); btn_rotate.pack(fill=tk.X, pady=2)
-
-data_action_frame = ttk.LabelFrame(action_container, text=" 📊 データ操作 ", style="Card.TLabelframe", padding=4); data_action_frame.grid(row=0, column=1, sticky="nsew", padx=(8, 0))
-btn_extract = ttk.Button(data_action_frame, text="🚀 選択した抽出・変換を実行", command=run_selected_extraction, style="Danger.TButton"); btn_extract.pack(fill=tk.X, pady=(2, 4), ipady=4) 
-btn_aggregate_local = ttk.Button(data_action_frame, text="🧩 データ集約", command=lambda: safe_run(aggregate_local_task, "データ集約"), style="Purple.TButton")
-btn_aggregate_local.pack(fill=tk.X, pady=(2, 0))
-ttk.Label(data_action_frame, text="※列名を自動認識して賢く名寄せ・結合します", font=("Segoe UI", 8), foreground=MUTED_TEXT, background=CARD_BG).pack(pady=(0, 4))
-
-global btn_combine_local
-btn_combine_local = ttk.Button(data_action_frame, text="🔗 データ単純結合", command=lambda: safe_run(combine_local_task, "データ単純結合"), style="Primary.TButton")
-btn_combine_local.pack(fill=tk.X, pady=(2, 0))
-ttk.Label(data_action_frame, text="※同じ列構成のファイルをそのまま縦に繋げます", font=("Segoe UI", 8), foreground=MUTED_TEXT, background=CARD_BG).pack(pady=(0, 4))
-
-status_frame = ttk.Frame(main_container, style="Main.TFrame")
-status_frame.pack(fill=tk.X, pady=(2, 0))
-state.status_label = ttk.Label(status_frame, text="ステータス: 待機中", font=("Segoe UI", 9), foreground=MUTED_TEXT, background=BG_COLOR)
-state.status_label.pack(side=tk.LEFT, padx=5)
-
-state.engine_var.trace("w", toggle_extraction_settings)
-state.output_format_var.trace("w", toggle_extraction_settings)
+    menubar = Menu(root)
+    help_menu = Menu(menubar, tearoff=0)
+    help_menu.add_command(label="PDFの内部データ構造について", command=lambda: show_text_window("PDFの内部データ構造について", PDF_TYPE_HELP_TEXT.strip()))
+    help_menu.add_command(label="AI抽出の準備 (使い方)", command=lambda: show_text_window("AI抽出の準備 (使い方)", AI_HELP_TEXT.strip()))
+    help_menu.add_separator()
+    help_menu.add_command(label="Readmeを表示", command=show_readme)
+    help_menu.add_command(label="バージョン履歴", command=show_history)
+    help_menu.add_separator()
+    help_menu.add_command(label="バージョン情報", command=show_version_info)
+    menubar.add_cascade(label="ヘルプ", menu=help_menu)
+    root.config(menu=menubar)
+
+    state.rotate_option, state.save_option = tk.IntVar(value=270), tk.IntVar(value=1)
+    state.engine_var, state.output_format_var = tk.StringVar(value="Internal"), tk.StringVar(value="xlsx")
+    state.extract_mode_var = tk.StringVar(value="table")
+    state.api_plan_var = tk.StringVar(value="free")
+    state.api_key_free_var = tk.StringVar(value=get_api_key() or "")
+    state.api_key_paid_var = tk.StringVar(value=get_api_key() or "")
+    state.gemini_model_free_var = tk.StringVar(value="gemini-2.5-flash")
+    state.gemini_model_paid_var = tk.StringVar(value="gemini-2.5-flash")
+    state.api_rpm_free_var = tk.IntVar(value=12)
+    state.api_rpm_paid_var = tk.IntVar(value=300)
+    state.api_tpm_free_var = tk.IntVar(value=0)
+    state.api_tpm_paid_var = tk.IntVar(value=0)
+    state.temperature_free_var = tk.DoubleVar(value=0.0)
+    state.temperature_paid_var = tk.DoubleVar(value=0.0)
+    state.safety_free_var = tk.BooleanVar(value=True)
+    state.safety_paid_var = tk.BooleanVar(value=True)
+    state.max_tokens_free_var = tk.IntVar(value=8192)
+    state.max_tokens_paid_var = tk.IntVar(value=8192)
+    state.custom_prompt_free_var = tk.StringVar(value="")
+    state.custom_prompt_paid_var = tk.StringVar(value="")
+    state.threads_free_var = tk.IntVar(value=1)
+    state.threads_paid_var = tk.IntVar(value=5)
+    state.internal_workers_var = tk.IntVar(value=1)
+    state.internal_backend_var = tk.StringVar(value=INTERNAL_BACKENDS[0][0])
+    state.tesseract_workers_var = tk.IntVar(value=1)
+    state.tesseract_single_pass_var = tk.BooleanVar(value=False)
+    state.tesseract_backend_var = tk.StringVar(value="pytesseract")
+    state.tesseract_hybrid_var = tk.BooleanVar(value=False)
+    state.tesseract_adaptive_dpi_var = tk.BooleanVar(value=False)
+    state.native_images_var = tk.BooleanVar(value=True)
+    state.output_grouping_var = tk.StringVar(value="page")
+    state.gemini_resume_var = tk.BooleanVar(value=True)
+    state.gemini_async_var = tk.BooleanVar(value=False)
+    state.gemini_async_concurrency_var = tk.IntVar(value=50)
+    state.gemini_pipeline_var = tk.BooleanVar(value=False)
+    state.gemini_prefetch_var = tk.IntVar(value=4)
+    state.gemini_write_queue_var = tk.IntVar(value=8)
+    state.gemini_render_workers_var = tk.IntVar(value=2)
+    state.extra_formats_var = tk.StringVar(value="")
+    state.result_cache_var = tk.BooleanVar(value=True)
+    state.cache_max_mb_var = tk.IntVar(value=1024)
+    state.render_cache_mb_var = tk.IntVar(value=256)
+    state.render_cache_spill_var = tk.BooleanVar(value=False)
+
+    main_outer = ttk.Frame(root)
+    main_outer.pack(fill=tk.BOTH, expand=True)
+
+    canvas = tk.Canvas(main_outer, bg=BG_COLOR, highlightthickness=0)
+    scrollbar = ttk.Scrollbar(main_outer, orient=tk.VERTICAL, command=canvas.yview)
+
+    main_container = ttk.Frame(canvas, padding=8, style="Main.TFrame")
+    canvas_frame_id = canvas.create_window((0, 0), window=main_container, anchor="nw")
+
+    def on_canvas_configure(event): canvas.itemconfig(canvas_frame_id, width=event.width)
+    canvas.bind('<Configure>', on_canvas_configure)
+
+    def on_frame_configure(event): canvas.configure(scrollregion=canvas.bbox("all"))
+    main_container.bind('<Configure>', on_frame_configure)
+
+    canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    title_frame = ttk.Frame(main_container, style="Main.TFrame"); title_frame.pack(fill=tk.X, pady=(0, 2))
+    ttk.Label(title_frame, text=APP_TITLE, font=("Segoe UI", 16, "bold"), foreground=PRIMARY, background=BG_COLOR).pack(side=tk.LEFT)
+    ttk.Label(title_frame, text=f" {VERSION}", font=("Segoe UI", 10), foreground=MUTED_TEXT, background=BG_COLOR).pack(side=tk.LEFT, pady=(6, 0))
+
+    file_card = ttk.Frame(main_container, style="Card.TFrame", padding=5); file_card.pack(fill=tk.X, pady=2)
+    btn_frame = ttk.Frame(file_card, style="Card.TFrame"); btn_frame.pack()
+    ttk.Button(btn_frame, text="📄 ファイルを選択", command=select_files, width=20, style="Primary.TButton").grid(row=0, column=0, padx=8)
+    ttk.Button(btn_frame, text="📁 フォルダを選択", command=select_folder, width=20, style="Primary.TButton").grid(row=0, column=1, padx=8)
+    state.path_label = ttk.Label(file_card, text="未選択", background=CARD_BG, foreground=TEXT_COLOR, wraplength=580, justify="center"); state.path_label.pack(pady=(4, 0))
+
+    settings_grid = ttk.Frame(main_container, style="Main.TFrame"); settings_grid.pack(fill=tk.X, pady=2); settings_grid.columnconfigure(0, weight=1); settings_grid.columnconfigure(1, weight=1)
+    save_frame = ttk.LabelFrame(settings_grid, text=" 保存先設定 ", style="Card.TLabelframe", padding=4); save_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 8))
+    ttk.Radiobutton(save_frame, text="元のファイルと同じフォルダ", variable=state.save_option, value=1, command=on_save_mode_change).pack(anchor="w", pady=1)
+    ttk.Radiobutton(save_frame, text="任意のフォルダを指定", variable=state.save_option, value=2, command=on_save_mode_change).pack(anchor="w", pady=1)
+    ttk.Button(save_frame, text="📂 フォルダ参照", command=select_save_dir).pack(pady=(2, 2))
+    state.save_label = ttk.Label(save_frame, text="同じフォルダ", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 9)); state.save_label.pack()
+
+    rotate_frame = ttk.LabelFrame(settings_grid, text=" 回転設定 ", style="Card.TLabelframe", padding=4); rotate_frame.grid(row=0, column=1, sticky="nsew", padx=(8, 0))
+    for t, v in [("左（270°）", 270), ("上下（180°）", 180), ("右（90°）", 90)]: ttk.Radiobutton(rotate_frame, text=t, variable=state.rotate_option, value=v).pack(anchor="w", pady=1)
+
+    extract_frame = ttk.LabelFrame(main_container, text=" ⚙️ データ抽出・変換設定 ", style="Card.TLabelframe", padding=5); extract_frame.pack(fill=tk.X, pady=4)
+
+    engine_frame = ttk.Frame(extract_frame, style="Card.TFrame"); engine_frame.pack(fill=tk.X, pady=(0, 2))
+    ttk.Label(engine_frame, text="① エンジン:", width=12, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
+    engine_inner = ttk.Frame(engine_frame, style="Card.TFrame"); engine_inner.pack(anchor="w", fill=tk.X)
+    for text, val in [("Python標準ライブラリ (高速・オフライン) - テキストデータ入りPDF向け（文字選択できるPDF用）", "Internal"), ("Tesseract (ローカルOCR) - ラスターデータ向け（スキャンされた印刷活字のPDF用）", "Tesseract"), ("Gemini API (超高精度AI) - ラスターデータ向け（スキャンされた手書き文字や複雑な表のPDF用）", "Gemini")]:
+        ttk.Radiobutton(engine_inner, text=text, variable=state.engine_var, value=val).pack(anchor="w", pady=1)
+
+    ttk.Separator(extract_frame, orient="horizontal").pack(fill=tk.X, pady=4)
+
+    format_frame = ttk.Frame(extract_frame, style="Card.TFrame"); format_frame.pack(fill=tk.X, pady=0)
+    ttk.Label(format_frame, text="② 出力形式:", width=12, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
+
+    formats_row1 = [("Excel (.xlsx)", "xlsx"), ("CSV (.csv)", "csv"), ("Text (.txt)", "txt"), ("JSON (.json)", "json"), ("Markdown (.md)", "md"), ("Word (.docx)", "docx")]
+    formats_row2 = [("JPEG (.jpg)", "jpg"), ("PNG (.png)", "png"), ("SVG (.svg)", "svg"), ("TIFF (.tiff)", "tiff"), ("BMP (.bmp)", "bmp"), ("DXF (.dxf)", "dxf")]
+
+    format_inner1 = ttk.Frame(format_frame, style="Card.TFrame"); format_inner1.pack(anchor="w", fill=tk.X)
+    for text, val in formats_row1:
+        rb = ttk.Radiobutton(format_inner1, text=text, variable=state.output_format_var, value=val); rb.pack(side=tk.LEFT, padx=(0, 10)); format_radiobuttons[val] = rb
+    format_inner2 = ttk.Frame(format_frame, style="Card.TFrame"); format_inner2.pack(anchor="w", fill=tk.X, pady=(2, 0))
+    for text, val in formats_row2:
+        rb = ttk.Radiobutton(format_inner2, text=text, variable=state.output_format_var, value=val); rb.pack(side=tk.LEFT, padx=(0, 10)); format_radiobuttons[val] = rb
+
+    ttk.Separator(extract_frame, orient="horizontal").pack(fill=tk.X, pady=4)
+
+    extract_mode_frame = ttk.Frame(extract_frame, style="Card.TFrame")
+    extract_mode_frame.pack(fill=tk.X, pady=(0, 2))
+    ttk.Label(extract_mode_frame, text="③ 抽出モード:", width=12, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
+    rb_table_mode = ttk.Radiobutton(extract_mode_frame, text="表として抽出 (セルごとに分割)", variable=state.extract_mode_var, value="table")
+    rb_table_mode.pack(side=tk.LEFT, padx=(0, 10))
+    rb_text_mode = ttk.Radiobutton(extract_mode_frame, text="テキストのみ抽出 (横に1行で出力)", variable=state.extract_mode_var, value="text")
+    rb_text_mode.pack(side=tk.LEFT)
+
+    ttk.Separator(extract_frame, orient="horizontal").pack(fill=tk.X, pady=4)
+
+    api_settings_frame = ttk.Frame(extract_frame, style="Card.TFrame")
+    api_settings_frame.pack(fill=tk.X, pady=2)
+    ttk.Label(api_settings_frame, text="[AI用] API設定:", width=14, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
+    state.btn_api_settings = ttk.Button(api_settings_frame, text="⚙️ 詳細設定 (APIキー / モデル / 制限)", command=open_api_settings_dialog, style="Primary.TButton")
+    state.btn_api_settings.pack(side=tk.LEFT)
+
+    state.plan_indicator = ttk.Label(api_settings_frame, text="", font=("Segoe UI", 9, "bold"), background=CARD_BG)
+    state.plan_indicator.pack(side=tk.LEFT, padx=(12, 0))
+
+    global crop_frame, pdf_check_frame
+    crop_frame = ttk.Frame(extract_frame, style="Card.TFrame"); crop_frame.pack(fill=tk.X, pady=(4, 0))
+    ttk.Label(crop_frame, text="抽出範囲:", width=14, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
+    state.btn_select_crop = ttk.Button(crop_frame, text="抽出範囲を選択", command=open_crop_selector); state.btn_select_crop.pack(side=tk.LEFT)
+    btn_reset_crop = ttk.Button(crop_frame, text="全体に戻す", command=reset_crop_regions, style="Warning.TButton"); btn_reset_crop.pack(side=tk.LEFT, padx=(5, 5))
+
+    ttk.Label(crop_frame, text=" | プリセット:", background=CARD_BG, font=("Segoe UI", 9)).pack(side=tk.LEFT)
+    ttk.Button(crop_frame, text="💾 保存", command=save_crop_preset, width=8).pack(side=tk.LEFT, padx=2)
+    ttk.Button(crop_frame, text="📂 読込", command=load_crop_preset, width=8).pack(side=tk.LEFT, padx=2)
+    state.preset_filename_label = ttk.Label(crop_frame, text="未読込", background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=COLOR_PURPLE)
+    state.preset_filename_label.pack(side=tk.LEFT, padx=(5, 0))
+
+    pdf_check_frame = ttk.Frame(extract_frame, style="Card.TFrame")
+    pdf_check_frame.pack(fill=tk.X, pady=(4, 0))
+    ttk.Label(pdf_check_frame, text="データ確認:", width=14, background=CARD_BG, font=("Segoe UI", 9, "bold"), foreground=TEXT_COLOR).pack(side=tk.LEFT)
+    btn_check_pdf = ttk.Button(pdf_check_frame, text="🔍 選択中のPDFデータ構造を確認", command=show_pdf_type_info, style="Primary.TButton")
+    btn_check_pdf.pack(side=tk.LEFT)
 
+    save_settings_frame = ttk.Frame(extract_frame, style="Card.TFrame")
+    save_settings_frame.pack(fill=tk.X, pady=(6, 0))
+    btn_save_settings = ttk.Button(save_settings_frame, text="💾 現在の選択項目を保存", command=save_settings)
+    btn_save_settings.pack(side=tk.RIGHT)
+    btn_perf_settings = ttk.Button(save_settings_frame, text="⚡ 処理性能の設定", command=open_performance_settings_dialog)
+    btn_perf_settings.pack(side=tk.RIGHT, padx=(0, 5))
+
+    action_container = ttk.Frame(main_container, style="Main.TFrame"); action_container.pack(fill=tk.BOTH, expand=True, pady=2)
+    action_container.columnconfigure(0, weight=1); action_container.columnconfigure(1, weight=1)
+
+    pdf_action_frame = ttk.LabelFrame(action_container, text=" ✂️ PDF編集 ", style="Card.TLabelframe", padding=4); pdf_action_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 8))
+    btn_merge = ttk.Button(pdf_action_frame, text="結合 (フォルダ)", command=lambda: safe_run(merge_pdfs, "PDF結合"), style="Primary.TButton"); btn_merge.pack(fill=tk.X, pady=2)
+    btn_split = ttk.Button(pdf_action_frame, text="分割", command=lambda: safe_run(split_pdfs, "PDF分割"), style="Primary.TButton"); btn_split.pack(fill=tk.X, pady=2)
+    btn_rotate = ttk.Button(pdf_action_frame, text="回転", command=lambda: safe_run(rotate_pdfs, "PDF回転"), style="Primary.TButton"); btn_rotate.pack(fill=tk.X, pady=2)
+
+    data_action_frame = ttk.LabelFrame(action_container, text=" 📊 データ操作 ", style="Card.TLabelframe", padding=4); data_action_frame.grid(row=0, column=1, sticky="nsew", padx=(8, 0))
+    btn_extract = ttk.Button(data_action_frame, text="🚀 選択した抽出・変換を実行", command=run_selected_extraction, style="Danger.TButton"); btn_extract.pack(fill=tk.X, pady=(2, 4), ipady=4) 
+    btn_aggregate_local = ttk.Button(data_action_frame, text="🧩 データ集約", command=lambda: safe_run(aggregate_local_task, "データ集約"), style="Purple.TButton")
+    btn_aggregate_local.pack(fill=tk.X, pady=(2, 0))
+    ttk.Label(data_action_frame, text="※列名を自動認識して賢く名寄せ・結合します", font=("Segoe UI", 8), foreground=MUTED_TEXT, background=CARD_BG).pack(pady=(0, 4))
+
+    global btn_combine_local
+    btn_combine_local = ttk.Button(data_action_frame, text="🔗 データ単純結合", command=lambda: safe_run(combine_local_task, "データ単純結合"), style="Primary.TButton")
+    btn_combine_local.pack(fill=tk.X, pady=(2, 0))
+    ttk.Label(data_action_frame, text="※同じ列構成のファイルをそのまま縦に繋げます", font=("Segoe UI", 8), foreground=MUTED_TEXT, background=CARD_BG).pack(pady=(0, 4))
+
+    status_frame = ttk.Frame(main_container, style="Main.TFrame")
+    status_frame.pack(fill=tk.X, pady=(2, 0))
+    state.status_label = ttk.Label(status_frame, text="ステータス: 待機中", font=("Segoe UI", 9), foreground=MUTED_TEXT, background=BG_COLOR)
+    state.status_label.pack(side=tk.LEFT, padx=5)
+
+    state.engine_var.trace("w", toggle_extraction_settings)
+    state.output_format_var.trace("w", toggle_extraction_settings)
 
 
-load_settings()
-update_ui()
 
-if __name__ == "__main__":
+    load_settings()
+    update_ui()
+
     root.mainloop()
\ No newline at end of file
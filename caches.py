@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import os, json, time, hashlib, threading
+
+from common import APP_DIR
+
+# 抽出結果キャッシュの保存先
+CACHE_DIR = os.path.join(APP_DIR, "cache")
+
+# キャッシュ内容の形式を変えた場合に上げる（古いキャッシュを自動的に無効化する）
+CACHE_FORMAT_VERSION = 2
+
+# ==============================
+# ファイル内容のハッシュ
+# ==============================
+_DIGEST_MEMO = {}
+_DIGEST_LOCK = threading.Lock()
+
+def file_digest(path):
+    """
+    ファイル内容のSHA-256を返す。同じファイル（パス・サイズ・更新日時が同じ）は再計算しない。
+    ファイル名や保存場所が変わっても内容が同じなら同じ値になるため、キャッシュのキーに使う。
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _DIGEST_LOCK:
+        if memo_key in _DIGEST_MEMO: return _DIGEST_MEMO[memo_key]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""): h.update(chunk)
+    digest = h.hexdigest()
+    with _DIGEST_LOCK: _DIGEST_MEMO[memo_key] = digest
+    return digest
+
+# ==============================
+# ディスクキャッシュ
+# ==============================
+class DiskCache:
+    """
+    JSONで表現できる値を、キーごとに1ファイルとして保存するディスクキャッシュ。
+    キーは任意のJSON化可能な値（タプル・リスト等）で、内容のハッシュをファイル名にする。
+    書き込みは一時ファイルからの置き換えで行うため、複数スレッド・プロセスから同時に使ってもファイルが壊れない。
+    evict() で、保存期間を過ぎたものと、合計サイズの上限を超えた分を古い順に削除する。
+    """
+    def __init__(self, namespace, max_bytes=1024 * 1024 * 1024, max_age_days=30, directory=None):
+        self.directory = os.path.join(directory or CACHE_DIR, namespace)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return self.file_path(key, ".json")
+
+    def file_path(self, key, suffix):
+        """キーに対応する保存先のパス（JSON以外の形式で保存する場合に使う。evict() の対象になる）"""
+        raw = json.dumps([CACHE_FORMAT_VERSION, key], ensure_ascii=False, sort_keys=True, default=str)
+        name = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name[:2], f"{name}{suffix}")
+
+    def get(self, key):
+        """キャッシュされた値を返す（無い場合・読めない場合は None）"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f: value = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # 使用されたものを新しい扱いにし、容量超過時に削除されにくくする
+        try: os.utime(path, None)
+        except OSError: pass
+        self.hits += 1
+        return value
+
+    def contains(self, key):
+        """値を読み込まずに、キャッシュの有無だけを確認する"""
+        return os.path.exists(self._path(key))
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f: json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def delete(self, key):
+        """キーのエントリを削除する（無い場合は何もしない）"""
+        try: os.remove(self._path(key))
+        except OSError: pass
+
+    def evict(self):
+        """保存期間切れのエントリを削除し、合計サイズが上限を超えていれば古い順に削除する"""
+        now = time.time()
+        entries, total = [], 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try: st = os.stat(path)
+                except OSError: continue
+                if now - st.st_mtime > self.max_age or name.endswith(".tmp") and now - st.st_mtime > 3600:
+                    try: os.remove(path)
+                    except OSError: pass
+                    continue
+                entries.append((st.st_mtime, st.st_size, path)); total += st.st_size
+        if total <= self.max_bytes: return
+        # 上限ぎりぎりで毎回削除が走らないよう、上限の9割まで減らす
+        for _, size, path in sorted(entries):
+            try: os.remove(path)
+            except OSError: continue
+            total -= size
+            if total <= self.max_bytes * 0.9: break
+
+    def clear(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                try: os.remove(os.path.join(root, name))
+                except OSError: pass
+
+def open_result_cache(namespace, options):
+    """オプションで結果キャッシュが有効な場合に DiskCache を返す（無効な場合は None）"""
+    if not options.get("result_cache", True): return None
+    try: return DiskCache(namespace, max_bytes=max(1, int(options.get("cache_max_mb", 1024))) * 1024 * 1024)
+    except OSError: return None
+
+def clear_all_caches():
+    """全ての抽出結果キャッシュを削除する"""
+    if not os.path.isdir(CACHE_DIR): return
+    for namespace in os.listdir(CACHE_DIR):
+        if os.path.isdir(os.path.join(CACHE_DIR, namespace)): DiskCache(namespace).clear()
@@ -4,7 +4,6 @@ import sys
 import re
 import ast
 import jaconv
-from openpyxl.utils import get_column_letter
 
 # ==============================
 # 基本設定 & カラーパレット
@@ -33,6 +32,12 @@ if not os.path.exists(APP_DIR):
 API_KEY_FILE = os.path.join(APP_DIR, ".pdfeditmiya_api_key.txt")
 SETTINGS_FILE = os.path.join(APP_DIR, ".pdfeditmiya_settings.json") 
 
+# 表データとして出力できる形式（1回の抽出で複数形式へ同時出力できる）
+TABLE_OUTPUT_FORMATS = ["xlsx", "csv", "txt", "json", "md", "docx"]
+
+# 標準ライブラリ抽出のバックエンド (設定値, 表示名)。先頭が既定値
+INTERNAL_BACKENDS = [("pdfplumber", "pdfplumber (標準)"), ("pymupdf", "PyMuPDF (高速)")]
+
 # ==============================
 # ヘルプ・履歴テキスト
 # ==============================
@@ -171,18 +176,10 @@ def sanitize_excel_text(text):
     text = normalize_text(str(text))
     return re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', text)
 
-def auto_adjust_excel_column_width(ws):
-    for col in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(col[0].column)
-        for cell in col:
-            try:
-                if cell.value:
-                    for line in str(cell.value).split('\n'):
-                        length = sum(2 if ord(c) > 255 else 1 for c in line)
-                        if length > max_length: max_length = length
-            except: pass
-        ws.column_dimensions[column_letter].width = min(max_length + 2, 60)
+def excel_text_width(text):
+    """セルの表示幅（全角文字は2、半角文字は1として数えた最長行の長さ）を返す"""
+    if not text: return 0
+    return max(sum(2 if ord(c) > 255 else 1 for c in line) for line in str(text).split('\n'))
 
 def analyze_column_profile(col_data):
     if not col_data: return {"pure_num_ratio": 0.0, "fraction_ratio": 0.0, "avg_num_len": 0.0, "is_text": True}
@@ -310,6 +307,8 @@ class SharedState:
         self.gemini_model_paid_var = None
         self.api_rpm_free_var = None
         self.api_rpm_paid_var = None
+        self.api_tpm_free_var = None
+        self.api_tpm_paid_var = None
         
         self.temperature_free_var = None
         self.temperature_paid_var = None
@@ -322,5 +321,28 @@ class SharedState:
         self.threads_free_var = None
         self.threads_paid_var = None
 
+        # 処理性能（高速化）設定
+        self.internal_workers_var = None
+        self.internal_backend_var = None
+        self.tesseract_workers_var = None
+        self.tesseract_single_pass_var = None
+        self.tesseract_backend_var = None
+        self.tesseract_hybrid_var = None
+        self.tesseract_adaptive_dpi_var = None
+        self.native_images_var = None
+        self.output_grouping_var = None
+        self.gemini_resume_var = None
+        self.gemini_async_var = None
+        self.gemini_async_concurrency_var = None
+        self.gemini_pipeline_var = None
+        self.gemini_prefetch_var = None
+        self.gemini_write_queue_var = None
+        self.gemini_render_workers_var = None
+        self.extra_formats_var = None
+        self.result_cache_var = None
+        self.cache_max_mb_var = None
+        self.render_cache_mb_var = None
+        self.render_cache_spill_var = None
+
 # グローバルな状態インスタンス
 state = SharedState()
\ No newline at end of file
@@ -11,6 +11,8 @@ warnings.filterwarnings("ignore", category=FutureWarning)
 import google.generativeai as genai
 
 from common import *
+from caches import clear_all_caches
+from rendering import render_page_cached, configure_render_cache
 
 MODELS_FILE = os.path.join(USER_HOME, ".pdfeditmiya_models.json")
 
@@ -170,6 +172,7 @@ def open_api_settings_dialog():
         "key_free": state.api_key_free_var.get(), "key_paid": state.api_key_paid_var.get(),
         "model_free": state.gemini_model_free_var.get(), "model_paid": state.gemini_model_paid_var.get(),
         "rpm_free": state.api_rpm_free_var.get(), "rpm_paid": state.api_rpm_paid_var.get(),
+        "tpm_free": state.api_tpm_free_var.get(), "tpm_paid": state.api_tpm_paid_var.get(),
         "temp_free": state.temperature_free_var.get(), "temp_paid": state.temperature_paid_var.get(),
         "safety_free": state.safety_free_var.get(), "safety_paid": state.safety_paid_var.get(),
         "tokens_free": state.max_tokens_free_var.get(), "tokens_paid": state.max_tokens_paid_var.get(),
@@ -195,6 +198,8 @@ def open_api_settings_dialog():
         if state.gemini_model_paid_var.get() != original_values["model_paid"]: return True
         if state.api_rpm_free_var.get() != original_values["rpm_free"]: return True
         if state.api_rpm_paid_var.get() != original_values["rpm_paid"]: return True
+        if state.api_tpm_free_var.get() != original_values["tpm_free"]: return True
+        if state.api_tpm_paid_var.get() != original_values["tpm_paid"]: return True
         if state.temperature_free_var.get() != original_values["temp_free"]: return True
         if state.temperature_paid_var.get() != original_values["temp_paid"]: return True
         if state.safety_free_var.get() != original_values["safety_free"]: return True
@@ -220,6 +225,8 @@ def open_api_settings_dialog():
         state.gemini_model_paid_var.set(original_values["model_paid"])
         state.api_rpm_free_var.set(original_values["rpm_free"])
         state.api_rpm_paid_var.set(original_values["rpm_paid"])
+        state.api_tpm_free_var.set(original_values["tpm_free"])
+        state.api_tpm_paid_var.set(original_values["tpm_paid"])
         state.temperature_free_var.set(original_values["temp_free"])
         state.temperature_paid_var.set(original_values["temp_paid"])
         state.safety_free_var.set(original_values["safety_free"])
@@ -315,6 +322,7 @@ def open_api_settings_dialog():
         key_var = state.api_key_free_var if is_free else state.api_key_paid_var
         model_var = state.gemini_model_free_var if is_free else state.gemini_model_paid_var
         rpm_var = state.api_rpm_free_var if is_free else state.api_rpm_paid_var
+        tpm_var = state.api_tpm_free_var if is_free else state.api_tpm_paid_var
         temp_var = state.temperature_free_var if is_free else state.temperature_paid_var
         safety_var = state.safety_free_var if is_free else state.safety_paid_var
         tokens_var = state.max_tokens_free_var if is_free else state.max_tokens_paid_var
@@ -500,12 +508,17 @@ def open_api_settings_dialog():
         speed_inner.pack(fill=tk.X, pady=2)
         
         ttk.Label(speed_inner, text="RPM:", width=5, background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT)
-        spin_rpm = ttk.Spinbox(speed_inner, from_=1, to=2000, textvariable=rpm_var, width=5)
+        spin_rpm = ttk.Spinbox(speed_inner, from_=0, to=10000, textvariable=rpm_var, width=5)
         spin_rpm.pack(side=tk.LEFT, padx=(0, 2))
         
+        ttk.Label(speed_inner, text="TPM:", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(10, 2))
+        spin_tpm = ttk.Spinbox(speed_inner, from_=0, to=100000000, increment=10000, textvariable=tpm_var, width=9)
+        spin_tpm.pack(side=tk.LEFT, padx=(0, 2))
+        
         ttk.Label(speed_inner, text="スレッド:", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(10, 2))
         spin_threads = ttk.Spinbox(speed_inner, from_=1, to=20, textvariable=threads_var, width=4)
         spin_threads.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(perf_frame, text="※RPM・TPMを0にすると、モデルごとの利用枠（無料枠 / 有料 Tier 1 の公開値）を自動で使います。0以外の設定値が優先されます", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w")
         
         perf_action_inner = ttk.Frame(perf_frame, style="Card.TFrame")
         perf_action_inner.pack(fill=tk.X, pady=(10, 0))
@@ -789,6 +802,179 @@ def open_api_settings_dialog():
     else:
         notebook.select(tab_paid)
 
+# ==============================
+# 処理性能（高速化）設定ダイアログ
+# ==============================
+def open_performance_settings_dialog():
+    dialog = tk.Toplevel(state.root)
+    dialog.title("⚡ 処理性能の設定")
+    dialog.configure(bg=BG_COLOR)
+    dialog.resizable(False, False)
+    dialog.grab_set()
+
+    x = state.root.winfo_x() + (WINDOW_WIDTH // 2) - 260
+    y = state.root.winfo_y() + 80
+    dialog.geometry(f"+{x}+{y}")
+
+    perf_vars = {
+        "internal_workers": state.internal_workers_var,
+        "internal_backend": state.internal_backend_var,
+        "tesseract_workers": state.tesseract_workers_var,
+        "tesseract_single_pass": state.tesseract_single_pass_var,
+        "tesseract_backend": state.tesseract_backend_var,
+        "tesseract_hybrid": state.tesseract_hybrid_var,
+        "tesseract_adaptive_dpi": state.tesseract_adaptive_dpi_var,
+        "native_images": state.native_images_var,
+        "output_grouping": state.output_grouping_var,
+        "gemini_resume": state.gemini_resume_var,
+        "gemini_async": state.gemini_async_var,
+        "gemini_async_concurrency": state.gemini_async_concurrency_var,
+        "gemini_pipeline": state.gemini_pipeline_var,
+        "gemini_prefetch": state.gemini_prefetch_var,
+        "gemini_write_queue": state.gemini_write_queue_var,
+        "gemini_render_workers": state.gemini_render_workers_var,
+        "extra_formats": state.extra_formats_var,
+        "result_cache": state.result_cache_var,
+        "cache_max_mb": state.cache_max_mb_var,
+        "render_cache_mb": state.render_cache_mb_var,
+        "render_cache_spill": state.render_cache_spill_var,
+    }
+    original_values = {k: v.get() for k, v in perf_vars.items()}
+
+    def cancel_and_close():
+        for k, v in perf_vars.items(): v.set(original_values[k])
+        dialog.destroy()
+
+    dialog.protocol("WM_DELETE_WINDOW", cancel_and_close)
+
+    ttk.Label(dialog, text="処理性能の設定", font=("Segoe UI", 14, "bold"), background=BG_COLOR, foreground=PRIMARY).pack(pady=(10, 5))
+
+    # --- 標準ライブラリ (Internal) ---
+    internal_frame = ttk.LabelFrame(dialog, text=" 標準ライブラリ (Internal) ", style="Card.TLabelframe", padding=8)
+    internal_frame.pack(fill=tk.X, padx=15, pady=5)
+
+    row_workers = ttk.Frame(internal_frame, style="Card.TFrame")
+    row_workers.pack(fill=tk.X, pady=2)
+    ttk.Label(row_workers, text="並列プロセス数:", width=16, background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT)
+    ttk.Spinbox(row_workers, from_=0, to=max(1, os.cpu_count() or 1), increment=1, textvariable=state.internal_workers_var, width=5).pack(side=tk.LEFT)
+    ttk.Label(row_workers, text="※0で自動 (CPUコア数-1)。ページを分割して複数のプロセスで同時に抽出します", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(side=tk.LEFT, padx=(8, 0))
+
+    row_backend = ttk.Frame(internal_frame, style="Card.TFrame")
+    row_backend.pack(fill=tk.X, pady=2)
+    ttk.Label(row_backend, text="抽出バックエンド:", width=16, background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT)
+    for backend, label in INTERNAL_BACKENDS:
+        ttk.Radiobutton(row_backend, text=label, variable=state.internal_backend_var, value=backend).pack(side=tk.LEFT)
+    ttk.Label(internal_frame, text="※PyMuPDF は高速ですが、表の区切り方が pdfplumber と異なる場合があります（回転したページの範囲指定は行単位で抽出します）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    # --- Tesseract OCR ---
+    tesseract_frame = ttk.LabelFrame(dialog, text=" Tesseract OCR ", style="Card.TLabelframe", padding=8)
+    tesseract_frame.pack(fill=tk.X, padx=15, pady=5)
+
+    row_tess_workers = ttk.Frame(tesseract_frame, style="Card.TFrame")
+    row_tess_workers.pack(fill=tk.X, pady=2)
+    ttk.Label(row_tess_workers, text="並列プロセス数:", width=16, background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT)
+    ttk.Spinbox(row_tess_workers, from_=0, to=max(1, os.cpu_count() or 1), increment=1, textvariable=state.tesseract_workers_var, width=5).pack(side=tk.LEFT)
+    ttk.Label(row_tess_workers, text="※0で自動 (CPUコア数-1)。複数ページの描画・OCRを同時に実行します", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(side=tk.LEFT, padx=(8, 0))
+
+    row_tess_backend = ttk.Frame(tesseract_frame, style="Card.TFrame")
+    row_tess_backend.pack(fill=tk.X, pady=2)
+    ttk.Label(row_tess_backend, text="OCRバックエンド:", width=16, background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT)
+    ttk.Radiobutton(row_tess_backend, text="pytesseract (標準)", variable=state.tesseract_backend_var, value="pytesseract").pack(side=tk.LEFT)
+    ttk.Radiobutton(row_tess_backend, text="tesserocr (高速・要追加インストール)", variable=state.tesseract_backend_var, value="tesserocr").pack(side=tk.LEFT)
+    ttk.Label(tesseract_frame, text="※tesserocr は言語データを1回だけ読み込み、プロセス内で繰り返しOCRします（未インストールの場合は自動で pytesseract を使用）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    ttk.Checkbutton(tesseract_frame, text="デジタルPDFのページはOCRせず、埋め込みテキストを使う (ハイブリッド)", variable=state.tesseract_hybrid_var).pack(anchor="w", pady=(4, 0))
+    ttk.Checkbutton(tesseract_frame, text="文字の大きさに合わせて解像度を自動調整する (150〜400dpi)", variable=state.tesseract_adaptive_dpi_var).pack(anchor="w", pady=(4, 0))
+    ttk.Checkbutton(tesseract_frame, text="ページごとに1回だけOCRし、単語を各抽出範囲に振り分ける (範囲が多い場合に高速)", variable=state.tesseract_single_pass_var).pack(anchor="w", pady=(4, 0))
+    ttk.Label(tesseract_frame, text="※認識の信頼度が低いページを処理結果に表示します。範囲ごとに文字の配置が大きく異なる場合は従来方式の方が高精度です", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    # --- Gemini API ---
+    gemini_frame = ttk.LabelFrame(dialog, text=" Gemini API (AI抽出) ", style="Card.TLabelframe", padding=8)
+    gemini_frame.pack(fill=tk.X, padx=15, pady=5)
+
+    row_async = ttk.Frame(gemini_frame, style="Card.TFrame")
+    row_async.pack(fill=tk.X, pady=2)
+    ttk.Checkbutton(row_async, text="非同期モードで送信する", variable=state.gemini_async_var).pack(side=tk.LEFT)
+    ttk.Label(row_async, text="同時リクエスト数:", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(15, 4))
+    ttk.Spinbox(row_async, from_=1, to=200, increment=10, textvariable=state.gemini_async_concurrency_var, width=5).pack(side=tk.LEFT)
+    ttk.Label(gemini_frame, text="※有料プラン向け。スレッド数の代わりに同時リクエスト数まで並行して送信します（送信間隔はRPM / TPMの設定に従います）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    ttk.Checkbutton(gemini_frame, text="描画・送信・書き込みを分けて並行処理する (パイプライン)", variable=state.gemini_pipeline_var).pack(anchor="w", pady=(4, 0))
+    row_pipeline = ttk.Frame(gemini_frame, style="Card.TFrame")
+    row_pipeline.pack(fill=tk.X, pady=2)
+    ttk.Label(row_pipeline, text="先読み:", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(20, 4))
+    ttk.Spinbox(row_pipeline, from_=1, to=64, increment=1, textvariable=state.gemini_prefetch_var, width=4).pack(side=tk.LEFT)
+    ttk.Label(row_pipeline, text="書き込み待ち:", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(10, 4))
+    ttk.Spinbox(row_pipeline, from_=1, to=256, increment=1, textvariable=state.gemini_write_queue_var, width=4).pack(side=tk.LEFT)
+    ttk.Label(row_pipeline, text="描画スレッド:", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(10, 4))
+    ttk.Spinbox(row_pipeline, from_=1, to=4, increment=1, textvariable=state.gemini_render_workers_var, width=4).pack(side=tk.LEFT)
+    ttk.Label(gemini_frame, text="※送信中に次のページの画像を先読みします。各段の待ち行列の長さは進捗と処理結果に表示されます（描画スレッドは最大4で、非同期モードにも適用）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    # --- スキャンPDF ---
+    scan_frame = ttk.LabelFrame(dialog, text=" スキャンPDF (Tesseract / Gemini) ", style="Card.TLabelframe", padding=8)
+    scan_frame.pack(fill=tk.X, padx=15, pady=5)
+    ttk.Checkbutton(scan_frame, text="ページ全体が画像1枚のページは、再描画せずに埋め込み画像をそのまま使う", variable=state.native_images_var).pack(anchor="w")
+    ttk.Label(scan_frame, text="※JPEG画像は可能な場合、元のデータのままGeminiへ送信します", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    # --- OCR / AI抽出の出力単位 ---
+    output_frame = ttk.LabelFrame(dialog, text=" OCR / AI抽出の出力単位 ", style="Card.TLabelframe", padding=8)
+    output_frame.pack(fill=tk.X, padx=15, pady=5)
+
+    row_grouping = ttk.Frame(output_frame, style="Card.TFrame")
+    row_grouping.pack(fill=tk.X, pady=2)
+    ttk.Radiobutton(row_grouping, text="ページごと", variable=state.output_grouping_var, value="page").pack(side=tk.LEFT)
+    ttk.Radiobutton(row_grouping, text="PDFごとに1ファイル", variable=state.output_grouping_var, value="document").pack(side=tk.LEFT)
+    ttk.Radiobutton(row_grouping, text="全体で1ファイル", variable=state.output_grouping_var, value="job").pack(side=tk.LEFT)
+    ttk.Label(output_frame, text="※まとめる場合はページ順に1つのファイルへ逐次追記します（json形式はJSONLで出力）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+    ttk.Checkbutton(output_frame, text="中断したAI抽出 (Gemini) を再実行した場合、完了済みのページを飛ばして続きから再開する", variable=state.gemini_resume_var).pack(anchor="w", pady=(4, 0))
+    ttk.Label(output_frame, text="※出力先フォルダに再開用の記録（AI抽出_再開用記録.jsonl）を保存し、最後まで完了した時点で削除します", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    # --- 同時に出力する形式 ---
+    formats_frame = ttk.LabelFrame(dialog, text=" 同時に出力する形式 ", style="Card.TLabelframe", padding=8)
+    formats_frame.pack(fill=tk.X, padx=15, pady=5)
+
+    selected_extras = set(f for f in state.extra_formats_var.get().split(",") if f)
+    extra_vars = {fmt: tk.BooleanVar(value=fmt in selected_extras) for fmt in TABLE_OUTPUT_FORMATS}
+    def sync_extra_formats():
+        state.extra_formats_var.set(",".join(fmt for fmt in TABLE_OUTPUT_FORMATS if extra_vars[fmt].get()))
+
+    row_formats = ttk.Frame(formats_frame, style="Card.TFrame")
+    row_formats.pack(fill=tk.X, pady=2)
+    for fmt in TABLE_OUTPUT_FORMATS:
+        ttk.Checkbutton(row_formats, text=fmt, variable=extra_vars[fmt], command=sync_extra_formats).pack(side=tk.LEFT, padx=(0, 8))
+    ttk.Label(formats_frame, text="※メインの出力形式に加えて、1回の抽出結果をチェックした形式にも書き出します", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    # --- 抽出結果のキャッシュ ---
+    cache_frame = ttk.LabelFrame(dialog, text=" キャッシュ (抽出結果・ページ画像) ", style="Card.TLabelframe", padding=8)
+    cache_frame.pack(fill=tk.X, padx=15, pady=5)
+
+    def clear_cache():
+        if not messagebox.askyesno("確認", "保存されている抽出結果のキャッシュを全て削除しますか？", parent=dialog): return
+        clear_all_caches()
+        messagebox.showinfo("完了", "キャッシュを削除しました。", parent=dialog)
+
+    row_cache = ttk.Frame(cache_frame, style="Card.TFrame")
+    row_cache.pack(fill=tk.X, pady=2)
+    ttk.Checkbutton(row_cache, text="キャッシュを使用する", variable=state.result_cache_var).pack(side=tk.LEFT)
+    ttk.Label(row_cache, text="上限(MB):", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(15, 4))
+    ttk.Spinbox(row_cache, from_=64, to=65536, increment=256, textvariable=state.cache_max_mb_var, width=7).pack(side=tk.LEFT)
+    ttk.Button(row_cache, text="キャッシュを削除", command=clear_cache).pack(side=tk.RIGHT)
+    ttk.Label(cache_frame, text="※同じ内容のPDFを同じ設定で再処理する場合、保存済みのページ結果を再利用します（Gemini API は同じ画像・プロンプト・モデルの応答を再利用し、再送信しません）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    row_render_cache = ttk.Frame(cache_frame, style="Card.TFrame")
+    row_render_cache.pack(fill=tk.X, pady=(6, 2))
+    ttk.Label(row_render_cache, text="ページ画像(MB):", background=CARD_BG, font=("Segoe UI", 9, "bold")).pack(side=tk.LEFT, padx=(0, 4))
+    ttk.Spinbox(row_render_cache, from_=0, to=16384, increment=64, textvariable=state.render_cache_mb_var, width=7).pack(side=tk.LEFT)
+    ttk.Checkbutton(row_render_cache, text="ディスクにも保存する", variable=state.render_cache_spill_var).pack(side=tk.LEFT, padx=(15, 0))
+    ttk.Label(cache_frame, text="※プレビュー・画像変換・OCR・AI抽出で描画したページ画像をメモリに保持し、同じページの再描画を省きます（0で無効）", background=CARD_BG, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(anchor="w", pady=(2, 0))
+
+    ttk.Label(dialog, text="※設定を次回以降も使う場合は、メイン画面の「現在の選択項目を保存」を押してください。", background=BG_COLOR, foreground=MUTED_TEXT, font=("Segoe UI", 8)).pack(padx=15, pady=(5, 0), anchor="w")
+
+    btn_action_frame = ttk.Frame(dialog, style="Main.TFrame")
+    btn_action_frame.pack(fill=tk.X, pady=(10, 15))
+    ttk.Button(btn_action_frame, text="キャンセル", command=cancel_and_close, width=15).pack(side=tk.RIGHT, padx=(5, 15))
+    ttk.Button(btn_action_frame, text="設定を適用して閉じる", command=dialog.destroy, style="Primary.TButton", width=25).pack(side=tk.RIGHT, padx=5)
+
 # ==============================
 # クロップ(範囲指定)関連
 # ==============================
@@ -801,7 +987,10 @@ class CropSelector:
 
         self.pdf_path = pdf_path
         self.zoom = 1.0
+        # プレビューの描画結果は、抽出処理（Tesseract / Gemini 等）と共有の描画キャッシュに保持する
+        configure_render_cache(state.render_cache_mb_var.get(), state.render_cache_spill_var.get(), state.cache_max_mb_var.get())
         self.zoom_mode = False # 範囲指定ズームモード
+        self.column_mode = False # 列区切りの追加モード（表モードのみ）
         # 抽出モードに応じて線モード（水平線選択）か矩形モードかを判定
         self.is_line_mode = (state.extract_mode_var.get() == "text")
         
@@ -845,6 +1034,13 @@ class CropSelector:
             ttk.Radiobutton(dir_grp, text="横書き (水平線)", variable=self.line_dir, value="h", command=self.update_help_text).pack(side=tk.LEFT, padx=5)
             ttk.Radiobutton(dir_grp, text="縦書き (垂直線)", variable=self.line_dir, value="v", command=self.update_help_text).pack(side=tk.LEFT, padx=5)
 
+        # 列区切り (表モード時のみ)
+        if not self.is_line_mode:
+            col_grp = ttk.LabelFrame(toolbar, text=" 列区切り ", padding=8)
+            col_grp.pack(side=tk.LEFT, padx=5)
+            self.btn_column = ttk.Button(col_grp, text="┃ 列区切りを追加", command=self.toggle_column_mode, width=16)
+            self.btn_column.pack(side=tk.LEFT, padx=2)
+
         # 確定・中止
         app_grp = ttk.Frame(toolbar, padding=(5, 10))
         app_grp.pack(side=tk.RIGHT, padx=5)
@@ -916,26 +1112,39 @@ class CropSelector:
 
     def draw_image(self):
         self.set_status("🖼️ プレビュー画像を生成中...")
-        mat = fitz.Matrix(self.zoom, self.zoom); pix = self.page.get_pixmap(matrix=mat)
-        self.tk_image = ImageTk.PhotoImage(Image.frombytes("RGB", [pix.width, pix.height], pix.samples))
+        # キャッシュから縮小して得た画像は Pixmap を伴わないため、大きさは画像配列から取る
+        img_array, _pix = render_page_cached(self.page, zoom=self.zoom)
+        self.tk_image = ImageTk.PhotoImage(Image.fromarray(img_array))
+        self.img_h, self.img_w = img_array.shape[:2]
         self.canvas.delete("all"); self.canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_image)
-        self.canvas.config(scrollregion=(0, 0, pix.width, pix.height))
-        self.img_w, self.img_h = pix.width, pix.height
+        self.canvas.config(scrollregion=(0, 0, self.img_w, self.img_h))
         self.set_status("✏️ 選択範囲を再描画中...")
-        for r in self.rectangles:
-            if r.get('is_line'):
-                if r.get('is_vertical'):
-                    # 垂直線
-                    mid_x = r['rx1']*self.img_w + (r['rx2']-r['rx1'])*0.5*self.img_w
-                    r['id'] = self.canvas.create_line(mid_x, r['ry1']*self.img_h, mid_x, r['ry2']*self.img_h, fill="red", width=2)
-                else:
-                    # 水平線
-                    mid_y = r['ry1']*self.img_h + (r['ry2']-r['ry1'])*0.5*self.img_h
-                    r['id'] = self.canvas.create_line(r['rx1']*self.img_w, mid_y, r['rx2']*self.img_w, mid_y, fill="red", width=2)
-            else:
-                r['id'] = self.canvas.create_rectangle(r['rx1']*self.img_w, r['ry1']*self.img_h, r['rx2']*self.img_w, r['ry2']*self.img_h, outline="red", width=2)
+        for r in self.rectangles: self.draw_item(r)
         self.set_status("")
 
+    def draw_item(self, r):
+        """選択範囲・線・列区切りを現在のズーム倍率でキャンバスに描画する"""
+        if r.get('is_column'):
+            # 列区切り（親の矩形の高さいっぱいに引く）
+            parent = r['parent']
+            r['id'] = self.canvas.create_line(r['rx']*self.img_w, parent['ry1']*self.img_h, r['rx']*self.img_w, parent['ry2']*self.img_h, fill=PRIMARY, width=2, dash=(6, 3))
+        elif r.get('is_line'):
+            if r.get('is_vertical'):
+                # 垂直線
+                mid_x = r['rx1']*self.img_w + (r['rx2']-r['rx1'])*0.5*self.img_w
+                r['id'] = self.canvas.create_line(mid_x, r['ry1']*self.img_h, mid_x, r['ry2']*self.img_h, fill="red", width=2)
+            else:
+                # 水平線
+                mid_y = r['ry1']*self.img_h + (r['ry2']-r['ry1'])*0.5*self.img_h
+                r['id'] = self.canvas.create_line(r['rx1']*self.img_w, mid_y, r['rx2']*self.img_w, mid_y, fill="red", width=2)
+        else:
+            r['id'] = self.canvas.create_rectangle(r['rx1']*self.img_w, r['ry1']*self.img_h, r['rx2']*self.img_w, r['ry2']*self.img_h, outline="red", width=2)
+
+    def toggle_column_mode(self):
+        self.column_mode = not self.column_mode
+        self.btn_column.config(style="Primary.TButton" if self.column_mode else "TButton")
+        self.update_help_text()
+
     def toggle_zoom_mode(self):
         self.zoom_mode = not self.zoom_mode
         self.btn_zoom_range.config(style="Primary.TButton" if self.zoom_mode else "TButton")
@@ -945,6 +1154,8 @@ class CropSelector:
     def update_help_text(self):
         if self.zoom_mode:
             text = "【ズーム】拡大したい範囲をマウスで囲んでください。"
+        elif self.column_mode:
+            text = "【列区切り】選択済みの範囲内をクリックして、列の境目（縦罫線）を指定します。"
         elif self.is_line_mode:
             if self.line_dir.get() == "v":
                 text = "【使い方】ドラッグで「垂直の線」を引き、抽出したい「列（縦書き）」の位置を指定します。"
@@ -1031,6 +1242,8 @@ class CropSelector:
         self.start_x, self.start_y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         if self.zoom_mode:
             self.current_rect = self.canvas.create_rectangle(self.start_x, self.start_y, self.start_x, self.start_y, outline=PRIMARY, width=2, dash=(4, 4))
+        elif self.column_mode:
+            self.current_rect = self.canvas.create_line(self.start_x, self.start_y, self.start_x, self.start_y, fill=PRIMARY, width=2, dash=(6, 3))
         elif self.is_line_mode:
             self.current_rect = self.canvas.create_line(self.start_x, self.start_y, self.start_x, self.start_y, fill="red", width=2, dash=(4, 4))
         else:
@@ -1040,6 +1253,8 @@ class CropSelector:
         cur_y = self.canvas.canvasy(event.y)
         if self.zoom_mode:
             self.canvas.coords(self.current_rect, self.start_x, self.start_y, cur_x, cur_y)
+        elif self.column_mode:
+            self.canvas.coords(self.current_rect, cur_x, self.start_y, cur_x, cur_y)
         elif self.is_line_mode:
             if self.line_dir.get() == "v":
                 self.canvas.coords(self.current_rect, self.start_x, self.start_y, self.start_x, cur_y)
@@ -1065,6 +1280,19 @@ class CropSelector:
             self.toggle_zoom_mode() # モード解除
             return
 
+        if self.column_mode:
+            self.canvas.delete(self.current_rect)
+            rx, ry = end_x / self.img_w, self.start_y / self.img_h
+            # クリック位置を含む矩形（重なっている場合は後から描いたもの）に列区切りを追加する
+            parent = next((r for r in reversed(self.rectangles) if not r.get('is_line') and not r.get('is_column')
+                           and r['rx1'] < rx < r['rx2'] and r['ry1'] <= ry <= r['ry2']), None)
+            if parent:
+                item = {'is_column': True, 'parent': parent, 'rx': rx}
+                self.draw_item(item)
+                self.rectangles.append(item)
+                self.redo_stack.clear()
+            return
+
         if self.is_line_mode:
             self.canvas.itemconfig(self.current_rect, dash=())
             is_vert = (self.line_dir.get() == "v")
@@ -1108,15 +1336,7 @@ class CropSelector:
     def redo(self):
         if self.redo_stack:
             rect = self.redo_stack.pop()
-            if rect.get('is_line'):
-                if rect.get('is_vertical'):
-                    mid_x = rect['rx1']*self.img_w + (rect['rx2']-rect['rx1'])*0.5*self.img_w
-                    rect['id'] = self.canvas.create_line(mid_x, rect['ry1']*self.img_h, mid_x, rect['ry2']*self.img_h, fill="red", width=2)
-                else:
-                    mid_y = rect['ry1']*self.img_h + (rect['ry2']-rect['ry1'])*0.5*self.img_h
-                    rect['id'] = self.canvas.create_line(rect['rx1']*self.img_w, mid_y, rect['rx2']*self.img_w, mid_y, fill="red", width=2)
-            else:
-                rect['id'] = self.canvas.create_rectangle(rect['rx1']*self.img_w, rect['ry1']*self.img_h, rect['rx2']*self.img_w, rect['ry2']*self.img_h, outline="red", width=2)
+            self.draw_item(rect)
             self.rectangles.append(rect)
 
     def clear_rects(self):
@@ -1124,7 +1344,14 @@ class CropSelector:
         self.rectangles.clear()
         self.redo_stack.clear()
     def save_and_close(self):
-        state.selected_crop_regions = [(r['rx1'], r['ry1'], r['rx2'], r['ry2'], r.get('is_vertical', False)) for r in self.rectangles]
+        regions = []
+        for r in self.rectangles:
+            if r.get('is_column'): continue
+            # 列区切りがある矩形は、6番目の要素として列区切りの相対X座標リストを保存する（プリセットにもそのまま保存される）
+            columns = sorted(c['rx'] for c in self.rectangles if c.get('is_column') and c['parent'] is r)
+            region = (r['rx1'], r['ry1'], r['rx2'], r['ry2'], r.get('is_vertical', False))
+            regions.append(region + (columns,) if columns else region)
+        state.selected_crop_regions = regions
         state.loaded_preset_name = "カスタム"
         if state.btn_select_crop:
             state.btn_select_crop.config(text=f"抽出範囲を選択 (設定済: {len(state.selected_crop_regions)}か所)" if state.selected_crop_regions else "抽出範囲を選択")
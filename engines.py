@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 import os, sys, cv2, csv, json, time, gc, re
+import collections
+import contextlib
+import concurrent.futures
 from PyPDF2 import PdfReader, PdfWriter
 import pdfplumber
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.pdfinterp import PDFPageInterpreter
 import fitz  # PyMuPDF
 import pytesseract
 import ezdxf
 import numpy as np
 import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Border, Side
 from PIL import Image
 
 try:
@@ -21,23 +24,59 @@ try:
 except ImportError:
     xlrd = None
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 from common import (
-    auto_adjust_excel_column_width,
-    sanitize_excel_text,
+    normalize_text,
     merge_2d_arrays_horizontally,
     parse_row_data,
-    apply_text_inheritance
+    apply_text_inheritance,
+    INTERNAL_BACKENDS
 )
+from writers import ExcelStreamWriter, PageTableOutput, ConsolidatedTableSink
+from caches import file_digest, open_result_cache
+from rendering import render_page_cached, native_page_image, native_page_array, configure_render_cache
 
 # ==============================
 # 画像前処理タスク (OCR精度向上・クロップ拡張)
 # ==============================
-def expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2):
+def find_object_boxes(img_array):
+    """
+    ページ画像を二値化し、文字や図形（外側の輪郭）の外接矩形を (N, 4) の配列 [x1, y1, x2, y2] で返す。
+    ページの半分を超える大きさのもの（外枠等）と、極小のノイズは除外済み。
+    同じページの全ての抽出範囲で使い回せるよう、expand_crop_rect_for_intersecting_objects の boxes に渡す。
+    """
+    h, w = img_array.shape[:2]
+    # CLAHE は新しい配列を返すため、グレースケール画像はそのまま使う（描画結果を直接参照した読み取り専用の配列でもよい）
+    if len(img_array.shape) == 3:
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    else:
+        gray = img_array
+
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    gray = clahe.apply(gray)
+    gray = cv2.medianBlur(gray, 3)
+
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours: return np.zeros((0, 4), dtype=np.int64)
+
+    rects = np.array([cv2.boundingRect(cnt) for cnt in contours], dtype=np.int64).reshape(-1, 4)
+    cw, ch = rects[:, 2], rects[:, 3]
+    keep = (cw <= w * 0.5) & (ch <= h * 0.5) & (cw >= 3) & (ch >= 3)
+    rects = rects[keep]
+    return np.column_stack([rects[:, 0], rects[:, 1], rects[:, 0] + rects[:, 2], rects[:, 1] + rects[:, 3]])
+
+def expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2, boxes=None):
     """
     指定された相対座標(rx1, ry1, rx2, ry2)のクロップ枠に対し、
     枠の境界に接している文字や図形（輪郭）が途切れないよう、
     輪郭が完全に含まれるようにピクセル座標レベルで枠を自動拡張して返す。
     水平に近い線（高さが極小）の場合は、左右(X)の拡張を抑え、上下(Y)の拡張を優先する。
+    boxes に find_object_boxes の結果を渡すと、ページ画像の二値化・輪郭抽出を省略する（同じページの複数範囲で共有する）。
     """
     h, w = img_array.shape[:2]
     x1, y1 = int(min(rx1, rx2) * w), int(min(ry1, ry2) * h)
@@ -50,52 +89,28 @@ def expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2):
     if x1 == 0 and y1 == 0 and x2 == w and y2 == h:
         return x1, y1, x2, y2
 
-    if len(img_array.shape) == 3:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_array.copy()
-
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    gray = clahe.apply(gray)
-    gray = cv2.medianBlur(gray, 3)
-
-    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if boxes is None: boxes = find_object_boxes(img_array)
+    cx1, cy1, cx2, cy2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
     
+    # 枠と重なる輪郭を、全輪郭に対して一括で判定する
+    hit = (cx1 <= x2) & (cx2 >= x1) & (cy1 <= y2) & (cy2 >= y1)
+    if is_h_line:
+        # 水平線モード：ユーザーの引いた「水平線（中心Y）」が文字の矩形と重なり、かつ文字の半分以上が枠内にある場合のみ
+        target_y = (y1 + y2) / 2
+        hit &= (cy1 <= target_y) & (target_y <= cy2) & ((np.minimum(cx2, x2) - np.maximum(cx1, x1)) >= (cx2 - cx1) * 0.5)
+    elif is_v_line:
+        # 垂直線モード：ユーザーの引いた「垂直線（中心X）」が文字の矩形と重なり、かつ文字の半分以上が枠内にある場合のみ
+        target_x = (x1 + x2) / 2
+        hit &= (cx1 <= target_x) & (target_x <= cx2) & ((np.minimum(cy2, y2) - np.maximum(cy1, y1)) >= (cy2 - cy1) * 0.5)
+
     new_x1, new_y1, new_x2, new_y2 = x1, y1, x2, y2
-    
-    for cnt in contours:
-        cx, cy, cw, ch = cv2.boundingRect(cnt)
-        cx1, cy1, cx2, cy2 = cx, cy, cx + cw, cy + ch
-        
-        if cw > w * 0.5 or ch > h * 0.5: continue
-        if cw < 3 or ch < 3: continue
-            
-        if (cx1 <= x2 and cx2 >= x1 and cy1 <= y2 and cy2 >= y1):
-            if is_h_line:
-                # 水平線モード：ユーザーの引いた「水平線（中心Y）」が文字の矩形と重なっている場合のみ
-                target_y = (y1 + y2) / 2
-                expand_needed = (cy1 <= target_y <= cy2)
-                if expand_needed:
-                    intersect_x1, intersect_x2 = max(cx1, x1), min(cx2, x2)
-                    if (intersect_x2 - intersect_x1) < cw * 0.5: expand_needed = False
-            elif is_v_line:
-                # 垂直線モード：ユーザーの引いた「垂直線（中心X）」が文字の矩形と重なっている場合のみ
-                target_x = (x1 + x2) / 2
-                expand_needed = (cx1 <= target_x <= cx2)
-                if expand_needed:
-                    intersect_y1, intersect_y2 = max(cy1, y1), min(cy2, y2)
-                    if (intersect_y2 - intersect_y1) < ch * 0.5: expand_needed = False
-            else:
-                expand_needed = True
-
-            if expand_needed:
-                if not is_v_line:
-                    new_x1 = min(new_x1, cx1)
-                    new_x2 = max(new_x2, cx2)
-                if not is_h_line:
-                    new_y1 = min(new_y1, cy1)
-                    new_y2 = max(new_y2, cy2)
+    if hit.any():
+        if not is_v_line:
+            new_x1 = min(new_x1, int(cx1[hit].min()))
+            new_x2 = max(new_x2, int(cx2[hit].max()))
+        if not is_h_line:
+            new_y1 = min(new_y1, int(cy1[hit].min()))
+            new_y2 = max(new_y2, int(cy2[hit].max()))
             
     margin = 4
     new_x1 = max(0, new_x1 - (0 if is_v_line else margin))
@@ -108,16 +123,64 @@ def expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2):
 # ==============================
 # コア処理関数群 (PDF編集・標準抽出)
 # ==============================
+# テキストレイヤー有無の判定結果キャッシュ {(絶対パス, サイズ, 更新日時): bool}
+_TEXT_LAYER_VERDICTS = {}
+
+def _text_layer_key(pdf_path):
+    st = os.stat(pdf_path)
+    return (os.path.abspath(pdf_path), st.st_size, st.st_mtime_ns)
+
+def get_cached_text_layer(pdf_path):
+    """過去の判定結果（True/False）を返す。未判定またはファイルが変更されている場合は None"""
+    try: return _TEXT_LAYER_VERDICTS.get(_text_layer_key(pdf_path))
+    except OSError: return None
+
+def remember_text_layer(pdf_path, has_text):
+    """抽出処理の中で得たテキストレイヤー有無の判定結果を記録する"""
+    try: _TEXT_LAYER_VERDICTS[_text_layer_key(pdf_path)] = bool(has_text)
+    except OSError: pass
+
 def check_pdf_has_text(pdf_path):
-    """PDFにテキストデータ（フォント情報）が含まれているか確認する"""
+    """PDFにテキストデータ（フォント情報）が含まれているか確認する（判定結果はキャッシュする）"""
+    cached = get_cached_text_layer(pdf_path)
+    if cached is not None: return cached
+    has_text = False
     try:
         with fitz.open(pdf_path) as doc:
             for page in doc:
                 if page.get_text().strip():
-                    return True
+                    has_text = True; break
     except Exception:
-        pass
-    return False
+        return False
+    remember_text_layer(pdf_path, has_text)
+    return has_text
+
+def _merge_layout_stats(stats, layout_stats):
+    """ページごとのレイアウト解析の集計（省いた図形・画像の数、比較計測した解析時間）を stats に加算する"""
+    for key, value in layout_stats.items():
+        stats[key] = stats.get(key, 0) + value
+
+def _report_skipped_objects(ui, stats):
+    if not stats.get("skipped_objects"): return
+    msg = f"テキストのみの解析により、ベクター図形・画像 {stats['skipped_objects']:,} 個の読み込みを省略しました。"
+    if stats.get("layout_sampled_pages"):
+        # 処理全体で最初に抽出した1ページを、通常の（図形を含む）解析でも処理して実測した比較
+        msg += (f"（実測 {stats['layout_sampled_pages']} ページ: 通常の解析 {stats['full_layout_seconds']:.2f} 秒 → "
+                f"テキストのみ {stats['text_layout_seconds']:.2f} 秒）")
+    ui.add_report(msg)
+
+def report_native_pages(ui, native_pages):
+    if native_pages:
+        ui.add_report(f"スキャン画像 {native_pages:,} ページは、ページを再描画せずに埋め込み画像をそのまま使用しました。")
+
+def _report_cached_pages(ui, cached_pages):
+    if cached_pages:
+        ui.add_report(f"前回の抽出結果キャッシュを利用し、{cached_pages:,} ページの再処理を省略しました。")
+
+def _report_scanned_files(ui, scanned_files):
+    if scanned_files:
+        ui.add_report("以下のファイルはスキャンされた画像（ラスターデータ）のため、標準ライブラリでは文字を抽出できませんでした。\n"
+                      "エンジンを「Gemini API」または「Tesseract」に変更して実行してください。\n" + "\n".join(f"・{name}" for name in scanned_files))
 
 def merge_pdfs(files, save_dir, options, ui):
     files = [f for f in files if f.lower().endswith(".pdf")]
@@ -159,337 +222,674 @@ def rotate_pdfs(files, save_dir, options, ui):
         base = os.path.splitext(os.path.basename(f))[0]
         with open(os.path.join(save_dir, f"{base}_Rotate.pdf"), "wb") as out: writer.write(out)
 
-def extract_text_internal(files, save_dir, options, ui):
-    files = [f for f in files if f.lower().endswith(".pdf")]
-    if not files: raise Exception("PDFファイルが含まれていません。")
-    
-    for f in files:
-        if not check_pdf_has_text(f):
-            raise Exception(f"ファイル「{os.path.basename(f)}」はスキャンされた画像（ラスターデータ）のため、標準ライブラリでは文字を抽出できません。\nエンジンを「Gemini API」または「Tesseract」に変更して実行してください。")
-            
-    crop_regions = options.get("crop_regions", [])
-    for i, f in enumerate(files, 1):
-        ui.update_overall(i, len(files), f"全体の進捗 ( {i} / {len(files)} ファイル )")
-        base = os.path.splitext(os.path.basename(f))[0]; text_list = []
-        is_scanned_pdf = False
-        with pdfplumber.open(f) as pdf:
-            for j, p in enumerate(pdf.pages, 1):
-                ui.set_determinate(j, len(pdf.pages), f"テキストを抽出中... ( {j} / {len(pdf.pages)} ページ )")
-                if not p.chars: is_scanned_pdf = True
-                
-                if crop_regions:
-                    page_texts = []
-                    for idx, region in enumerate(crop_regions, 1):
-                        rx1, ry1, rx2, ry2 = region[:4]
-                        is_vert = region[4] if len(region) > 4 else False
-                        # 水平・垂直線モードの判定（明示的なフラグがない場合のフォールバックも含む）
-                        is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
-                        
-                        m_y = 0.0 if (is_line and is_vert) else 0.005
-                        m_x = 0.0 if (is_line and not is_vert) else 0.005
-                        
-                        x0 = max(0, min(rx1, rx2) - m_x) * p.width
-                        top = max(0, min(ry1, ry2) - m_y) * p.height
-                        x1 = min(1, max(rx1, rx2) + m_x) * p.width
-                        bottom = min(1, max(ry1, ry2) + m_y) * p.height
-                        
-                        cropped_page = p.crop((x0, top, x1, bottom), strict=False)
-                        
-                        if is_line:
-                            if is_vert:
-                                target_x = (min(rx1, rx2) + max(rx1, rx2)) / 2 * p.width
-                                def filter_obj(obj):
-                                    if obj.get("object_type") == "char":
-                                        mid_y = (obj["top"] + obj["bottom"]) / 2
-                                        intersects_x = (obj["x0"] <= target_x <= obj["x1"])
-                                        return (top <= mid_y <= bottom) and intersects_x
-                                    return True
-                                cropped_page = cropped_page.filter(filter_obj)
-                            else:
-                                target_y = (min(ry1, ry2) + max(ry1, ry2)) / 2 * p.height
-                                def filter_obj(obj):
-                                    if obj.get("object_type") == "char":
-                                        mid_x = (obj["x0"] + obj["x1"]) / 2
-                                        intersects_y = (obj["top"] <= target_y <= obj["bottom"])
-                                        return (x0 <= mid_x <= x1) and intersects_y
-                                    return True
-                                cropped_page = cropped_page.filter(filter_obj)
-
-                        txt = cropped_page.extract_text(layout=True)
-                        if txt: page_texts.append(f"--- 範囲{idx} ---\n{txt}")
-                    if page_texts: text_list.append(f"【Page {j}】\n" + "\n".join(page_texts))
+# ==============================
+# 並列処理ヘルパー (プロセスプール)
+# ==============================
+def resolve_worker_count(value):
+    """設定値からワーカー数を決定する (0以下は CPUコア数-1 の自動設定)"""
+    try: value = int(value)
+    except (TypeError, ValueError): value = 1
+    if value <= 0: value = max(1, (os.cpu_count() or 2) - 1)
+    return value
+
+def iter_parallel_ordered(worker, jobs, max_workers, ui, initializer=None, initargs=()):
+    """
+    jobs（引数タプルのリスト）を worker でプロセスプール実行し、結果を投入順に返すジェネレータ。
+    max_workers が1以下、またはジョブが1件以下の場合はプールを使わず同一プロセスで順次実行する。
+    ui.is_cancelled() が立った時点で未着手のジョブを破棄して終了する。
+    """
+    if max_workers <= 1 or len(jobs) <= 1:
+        if initializer: initializer(*initargs)
+        for job in jobs:
+            if ui.is_cancelled(): return
+            yield worker(*job)
+        return
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+    pending = collections.deque()
+    job_iter = iter(jobs)
+    try:
+        # 結果の滞留でメモリを圧迫しないよう、投入済みジョブ数をワーカー数の2倍までに抑える
+        for job in job_iter:
+            pending.append(executor.submit(worker, *job))
+            if len(pending) >= max_workers * 2: break
+        while pending:
+            while True:
+                if ui.is_cancelled(): return
+                try:
+                    result = pending[0].result(timeout=0.2); break
+                except concurrent.futures.TimeoutError:
+                    continue
+            pending.popleft()
+            next_job = next(job_iter, None)
+            if next_job is not None: pending.append(executor.submit(worker, *next_job))
+            yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def memory_status_text():
+    """進捗表示用の現在のメモリ使用量（常駐セットサイズ）。psutil が無い場合は空文字"""
+    if psutil is None: return ""
+    try: return f" ｜ メモリ {psutil.Process().memory_info().rss / (1024 * 1024):.0f}MB"
+    except Exception: return ""
+
+# ==============================
+# 標準ライブラリ抽出 (ページ単位の処理)
+# ==============================
+class PageCharIndex:
+    """
+    ページ内の全文字の外接矩形をNumPy配列で保持する空間インデックス。
+    ページごとに1回だけ構築し、全ての抽出範囲（矩形・水平線・垂直線）の文字選択を1回のベクトル演算で行う。
+    x0 / top / x1 / bottom を持つ pdfplumber のオブジェクト（罫線・矩形・曲線等）の範囲選択にも使える。
+    """
+    def __init__(self, chars):
+        self.chars = chars
+        boxes = np.array([(c["x0"], c["top"], c["x1"], c["bottom"]) for c in chars], dtype=np.float64).reshape(-1, 4)
+        self.x0, self.top, self.x1, self.bottom = boxes.T
+        self.mid_x = (self.x0 + self.x1) / 2
+        self.mid_y = (self.top + self.bottom) / 2
+
+    def select(self, geom):
+        """抽出範囲の形状(geom)に該当する文字を、元の並び順のリストで返す"""
+        x0, top, x1, bottom = geom["bbox"]
+        if geom["is_line"] and geom["is_vert"]:
+            # 垂直線：線が文字に触れており、文字の中心が線の範囲内にあるもの
+            tx = geom["target"]
+            mask = (self.x0 <= tx) & (tx <= self.x1) & (top <= self.mid_y) & (self.mid_y <= bottom)
+        elif geom["is_line"]:
+            # 水平線：線が文字に触れており、文字の中心が線の範囲内にあるもの
+            ty = geom["target"]
+            mask = (self.top <= ty) & (ty <= self.bottom) & (x0 <= self.mid_x) & (self.mid_x <= x1)
+        else:
+            # 矩形：一部でも範囲に掛かっている文字 (page.crop(strict=False) と同じ判定)
+            ow = np.minimum(self.x1, x1) - np.maximum(self.x0, x0)
+            oh = np.minimum(self.bottom, bottom) - np.maximum(self.top, top)
+            mask = (ow >= 0) & (oh >= 0) & ((ow + oh) > 0)
+        return [self.chars[i] for i in np.flatnonzero(mask)]
+
+def _region_geometry(region, width, height):
+    """
+    相対座標の抽出範囲をページ座標に変換し、クロップ枠・線モード判定・線の位置・列区切りをまとめて返す。
+    抽出範囲は (rx1, ry1, rx2, ry2, 縦書きフラグ[, 列区切りの相対X座標リスト]) の形式。
+    """
+    rx1, ry1, rx2, ry2 = region[:4]
+    is_vert = region[4] if len(region) > 4 else False
+    col_xs = region[5] if len(region) > 5 and region[5] else []
+    # 水平・垂直線モードの判定（明示的なフラグがない場合のフォールバックも含む）
+    is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
+
+    m_y = 0.0 if (is_line and is_vert) else 0.005
+    m_x = 0.0 if (is_line and not is_vert) else 0.005
+
+    bbox = (
+        max(0, min(rx1, rx2) - m_x) * width,
+        max(0, min(ry1, ry2) - m_y) * height,
+        min(1, max(rx1, rx2) + m_x) * width,
+        min(1, max(ry1, ry2) + m_y) * height,
+    )
+    if is_line and is_vert: target = (min(rx1, rx2) + max(rx1, rx2)) / 2 * width
+    elif is_line: target = (min(ry1, ry2) + max(ry1, ry2)) / 2 * height
+    else: target = None
+    # 列区切りはクロップ枠の左右端を含む明示的な縦罫線として扱う
+    columns = [] if is_line or not col_xs else [bbox[0]] + sorted(min(max(cx * width, bbox[0]), bbox[2]) for cx in col_xs) + [bbox[2]]
+    return {"bbox": bbox, "is_line": is_line, "is_vert": is_vert, "target": target, "columns": columns}
+
+# ==============================
+# 標準ライブラリ抽出 (バックエンド別のページアダプタ)
+# ==============================
+def resolve_internal_backend(name):
+    """設定値から抽出バックエンドを決定する（不明な値は既定値、find_tables を持たない古い PyMuPDF では pdfplumber を使う）"""
+    names = [key for key, _ in INTERNAL_BACKENDS]
+    if name not in names: name = names[0]
+    if name == "pymupdf" and not hasattr(fitz.Page, "find_tables"): return "pdfplumber"
+    return name
+
+class _TextOnlyAggregator(PDFPageAggregator):
+    """線・曲線・矩形・画像を読み飛ばし、文字だけでページのレイアウトを構築する pdfminer のデバイス"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.skipped_objects = 0
+
+    def paint_path(self, gstate, stroke, fill, evenodd, path):
+        self.skipped_objects += 1
+
+    def render_image(self, name, stream):
+        self.skipped_objects += 1
+
+class _PlumberPage:
+    """
+    pdfplumber (pdfminer) のページを、抽出処理共通のインターフェースで包む。
+    text_only=True の場合は図形・画像を除いたレイアウトを事前に構築し、文字しか使わない処理で
+    CAD図面などの大量のベクター図形をオブジェクト化するコストを省く。
+    measure=True の場合は同じページを通常の解析でも処理し、両者の解析時間を layout_stats に記録する。
+    """
+    def __init__(self, page, text_only=False, measure=False):
+        self.page = page
+        self.width, self.height = page.width, page.height
+        self.layout_stats = {}
+        self._object_indexes = {}  # id(種類ごとのオブジェクトのリスト) -> PageCharIndex（ページにつき1回だけ構築し、全範囲で共有する）
+        if text_only: self._prime_text_only_layout(measure)
+
+    def _process_layout(self, device):
+        pdf = self.page.pdf
+        started = time.perf_counter()
+        PDFPageInterpreter(pdf.rsrcmgr, device).process_page(self.page.page_obj)
+        return device.get_result(), time.perf_counter() - started
+
+    def _prime_text_only_layout(self, measure=False):
+        try:
+            pdf = self.page.pdf
+            device = _TextOnlyAggregator(pdf.rsrcmgr, pageno=self.page.page_number, laparams=pdf.laparams)
+            self.page._layout, text_seconds = self._process_layout(device)
+            self.layout_stats = {"skipped_objects": device.skipped_objects}
+            if measure:
+                _, full_seconds = self._process_layout(PDFPageAggregator(pdf.rsrcmgr, pageno=self.page.page_number, laparams=pdf.laparams))
+                self.layout_stats.update(layout_sampled_pages=1, text_layout_seconds=text_seconds, full_layout_seconds=full_seconds)
+        except Exception:
+            # pdfplumber の内部構造が異なる版では通常の（図形を含む）解析に任せる
+            pass
+
+    @property
+    def chars(self):
+        return self.page.chars
+
+    def has_text(self):
+        return bool(self.page.chars)
+
+    def region_tables(self, geom, chars):
+        cropped_page = self._region_page(geom, chars)
+        if geom["columns"]:
+            # 列区切りが指定されている場合は、表検出を行わず1回の抽出で列を確定させる
+            tbl_settings = {"vertical_strategy": "explicit", "explicit_vertical_lines": geom["columns"], "horizontal_strategy": "text", "snap_tolerance": 3}
+            return cropped_page.extract_tables(table_settings=tbl_settings)
+        tbls = cropped_page.extract_tables()
+        if not tbls:
+            tbl_settings = {"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 3}
+            tbls = cropped_page.extract_tables(table_settings=tbl_settings)
+        return tbls
+
+    def page_tables(self):
+        return self.page.extract_tables()
+
+    def page_text(self):
+        return self.page.extract_text()
+
+    def _region_page(self, geom, chars):
+        """
+        表検出用に、抽出範囲でクロップしたページを返す。
+        範囲ごとにページの全オブジェクトを走査しないよう、文字は選択済みのもの（線モードでは選択した文字のみ）を、
+        罫線・図形等はページにつき1回だけ構築した空間インデックスで範囲に掛かるものを絞り込んでから、pdfplumber と同じ切り抜きを行う。
+        """
+        page_chars = self.page.objects.get("char")
+        query = {"bbox": geom["bbox"], "is_line": False}
+        def crop_indexed(objs, bbox):
+            if objs is page_chars: candidates = chars
+            else:
+                index = self._object_indexes.get(id(objs))
+                if index is None: index = self._object_indexes[id(objs)] = PageCharIndex(objs)
+                candidates = index.select(query)
+            return pdfplumber.utils.crop_to_bbox(candidates, bbox)
+        return pdfplumber.page.CroppedPage(self.page, geom["bbox"], crop_fn=crop_indexed, strict=False)
+
+    def release(self):
+        """解析済みのレイアウト・オブジェクトのキャッシュを解放する（処理済みページが文書全体分溜まり続けるのを防ぐ）"""
+        self._object_indexes.clear()  # キーは解放されるリストの id のため、必ず一緒に破棄する
+        close = getattr(self.page, "close", None) or getattr(self.page, "flush_cache", None)
+        if close: close()
+
+class _FitzPage:
+    """
+    PyMuPDF のページを、抽出処理共通のインターフェースで包む。
+    文字は rawdict から pdfplumber 互換のキーを持つ辞書に変換するため、文字インデックスやテキスト組み立ては共通の処理を使える。
+    """
+    def __init__(self, page):
+        self.page = page
+        self.width, self.height = page.rect.width, page.rect.height
+        self.layout_stats = {}
+        self._chars = None
+        self._text = None
+
+    @property
+    def chars(self):
+        if self._chars is None:
+            chars = []
+            # rawdict の座標は回転前のページのものなので、抽出範囲（表示上の向き）に合わせて回転後の座標に変換する
+            rotation = self.page.rotation_matrix if self.page.rotation else None
+            for block in self.page.get_text("rawdict")["blocks"]:
+                for line in block.get("lines", []):
+                    upright = abs(line["dir"][1]) < 1e-3
+                    if rotation is not None and self.page.rotation in (90, 270): upright = not upright
+                    for span in line["spans"]:
+                        for ch in span["chars"]:
+                            bbox = fitz.Rect(ch["bbox"])
+                            if rotation is not None: bbox = bbox * rotation
+                            x0, top, x1, bottom = bbox
+                            chars.append({"text": ch["c"], "x0": x0, "top": top, "x1": x1, "bottom": bottom, "doctop": top,
+                                          "upright": upright, "size": span["size"], "fontname": span["font"]})
+            self._chars = chars
+        return self._chars
+
+    def has_text(self):
+        if self._chars is not None: return bool(self._chars)
+        return bool(self.page_text().strip())
+
+    def _find_tables(self, clip=None, text_fallback=False):
+        tbls = [t.extract() for t in self.page.find_tables(clip=clip).tables]
+        if not tbls and text_fallback:
+            tbls = [t.extract() for t in self.page.find_tables(clip=clip, vertical_strategy="text", horizontal_strategy="text", snap_tolerance=3).tables]
+        return [t for t in tbls if t]
+
+    def region_tables(self, geom, chars):
+        # 回転したページは表検出の座標系が文字と一致しないため、共通のテキスト行フォールバックに任せる
+        if self.page.rotation: return []
+        if geom["is_line"]:
+            # 線モード: 範囲内の罫線・文字配置から表の枠を検出し、各セルには選択済みの文字だけを入れる（pdfplumber の線モードと同じ扱い）
+            tabs = self.page.find_tables(clip=fitz.Rect(geom["bbox"]))
+            if not tabs.tables: tabs = self.page.find_tables(clip=fitz.Rect(geom["bbox"]), vertical_strategy="text", horizontal_strategy="text", snap_tolerance=3)
+            return [t for t in (self._fill_cells(tab, chars) for tab in tabs.tables) if t]
+        if geom["columns"]:
+            # 列区切りが指定されている場合は、表検出を行わず1回の抽出で列を確定させる
+            tabs = self.page.find_tables(clip=fitz.Rect(geom["bbox"]), vertical_strategy="explicit", vertical_lines=geom["columns"], horizontal_strategy="text", snap_tolerance=3)
+            return [t for t in (tab.extract() for tab in tabs.tables) if t]
+        return self._find_tables(fitz.Rect(geom["bbox"]), text_fallback=True)
+
+    @staticmethod
+    def _fill_cells(table, chars):
+        """検出した表の各セルに、中心がセル内にある文字だけでテキストを組み立てる（文字の無い行は除く）"""
+        rows = []
+        for row in table.rows:
+            values = []
+            for cell in row.cells:
+                if cell is None: values.append(""); continue
+                x0, top, x1, bottom = cell
+                inside = [c for c in chars if x0 <= (c["x0"] + c["x1"]) / 2 < x1 and top <= (c["top"] + c["bottom"]) / 2 < bottom]
+                values.append(_chars_to_text(inside).strip())
+            if any(values): rows.append(values)
+        return rows
+
+    def page_tables(self):
+        return self._find_tables()
+
+    def page_text(self):
+        if self._text is None: self._text = self.page.get_text("text", sort=True)
+        return self._text
+
+    def release(self):
+        self._chars = self._text = None
+
+@contextlib.contextmanager
+def _open_internal_document(pdf_path, backend, text_only=False, measure_page=None):
+    """
+    バックエンドに応じてPDFを開き、(総ページ数, ページ番号(0始まり)からページアダプタを返す関数) を返す。
+    text_only は文字しか参照しない抽出（テキストモード）で図形の解析を省く指定（PyMuPDFは元々図形を解析しない）。
+    measure_page を指定すると、そのページだけは通常の解析でも処理し、省いた効果を実測する。
+    """
+    if backend == "pymupdf":
+        with fitz.open(pdf_path) as doc:
+            yield len(doc), lambda idx: _FitzPage(doc[idx])
+    else:
+        with pdfplumber.open(pdf_path) as pdf:
+            yield len(pdf.pages), lambda idx: _PlumberPage(pdf.pages[idx], text_only, measure=idx == measure_page)
+
+def _chars_to_text(chars, geom=None, layout=False):
+    """選択済みの文字リストからテキストを組み立てる"""
+    if not chars: return ""
+    if layout and geom:
+        x0, top, x1, bottom = geom["bbox"]
+        return pdfplumber.utils.extract_text(chars, layout=True, layout_bbox=geom["bbox"], layout_width=x1 - x0, layout_height=bottom - top)
+    return pdfplumber.utils.extract_text(chars)
+
+def _extract_regions_internal(page, crop_regions, extract_mode, layout_text=False):
+    """
+    ページ内の全抽出範囲を処理し、範囲ごとの結果をリストで返す。
+    文字インデックスはページにつき1回だけ構築し、全範囲で共有する。
+    表モードでは表データ（2次元配列）、テキストモードでは文字列を範囲ごとに返す。
+    """
+    index = PageCharIndex(page.chars)
+    results = []
+    for region in crop_regions:
+        geom = _region_geometry(region, page.width, page.height)
+        chars = index.select(geom)
+        if extract_mode == "text":
+            results.append(_chars_to_text(chars, geom, layout=layout_text))
+            continue
+
+        tbls = page.region_tables(geom, chars)
+        if not tbls:
+            txt = _chars_to_text(chars)
+            if txt and txt.strip():
+                lines = [line.strip() for line in txt.strip().split('\n') if line.strip()]
+                tbls = [[[line] for line in lines]]
+
+        region_table = []
+        if tbls:
+            for tbl in tbls: region_table.extend(tbl)
+        results.append(region_table)
+    return results
+
+def _extract_page_tables_internal(page, crop_regions, extract_mode):
+    """1ページ分の表データ（Excel/CSV共通）を抽出し、表のリストを返す"""
+    tables = []
+    if crop_regions:
+        region_results = _extract_regions_internal(page, crop_regions, extract_mode)
+        if extract_mode == "text":
+            merged_row = []
+            for txt in region_results:
+                lines = [line.strip() for line in txt.strip().split('\n') if line.strip()] if txt else []
+                merged_row.append("\n".join(lines))
+            merged_table = [merged_row] if merged_row else [[""]]
+        else:
+            merged_table = merge_2d_arrays_horizontally([r if r else [[""]] for r in region_results])
+
+        is_empty = True
+        for row in merged_table:
+            for cell in row:
+                if cell and str(cell).strip():
+                    is_empty = False; break
+            if not is_empty: break
+
+        if not is_empty: tables = [merged_table]
+    else:
+        if extract_mode != "text":
+            tables = page.page_tables()
+
+        if not tables:
+            txt = page.page_text()
+            if txt and txt.strip():
+                lines = [line.strip() for line in txt.strip().split('\n') if line.strip()]
+                if extract_mode == "text":
+                    tables = [[lines]]
                 else:
-                    txt = p.extract_text()
-                    if txt: text_list.append(f"【Page {j}】\n{txt}")
-        
-        if text_list:
-            output_content = normalize_text("\n\n".join(text_list))
+                    tables = [[[line] for line in lines]]
+    return tables
+
+def _extract_page_text_internal(page, page_no, crop_regions):
+    """1ページ分のテキストを抽出し、「【Page N】」見出し付きの文字列（無ければNone）を返す"""
+    if crop_regions:
+        region_texts = _extract_regions_internal(page, crop_regions, "text", layout_text=True)
+        page_texts = [f"--- 範囲{idx} ---\n{txt}" for idx, txt in enumerate(region_texts, 1) if txt]
+        if page_texts: return f"【Page {page_no}】\n" + "\n".join(page_texts)
+        return None
+    txt = page.page_text()
+    return f"【Page {page_no}】\n{txt}" if txt else None
+
+def _extract_page_internal(page, page_no, crop_regions, extract_mode, kind):
+    """
+    1ページ分を抽出し、(抽出結果, 文字データの有無, レイアウト解析の集計) を返す。ページのキャッシュは抽出後すぐに解放する。
+    kind が "both" の場合は、1回のページ解析から (テキスト, 表のリスト) の両方を抽出する。
+    """
+    try:
+        if kind == "text": payload = _extract_page_text_internal(page, page_no, crop_regions)
+        elif kind == "both": payload = (_extract_page_text_internal(page, page_no, crop_regions), _extract_page_tables_internal(page, crop_regions, extract_mode))
+        else: payload = _extract_page_tables_internal(page, crop_regions, extract_mode)
+        return payload, page.has_text(), page.layout_stats
+    finally:
+        page.release()
+
+def _internal_extract_worker(pdf_path, page_indices, crop_regions, extract_mode, kind, backend, measure_page=None):
+    """
+    担当ページ範囲を抽出するワーカー（プロセスプールから呼ばれるためモジュール直下に定義）。
+    PDFはワーカー自身で開き、(ページ番号, 抽出結果, 文字データの有無, レイアウト解析の集計) のリストを返す。
+    """
+    results = []
+    text_only = kind == "text" or extract_mode == "text"
+    with _open_internal_document(pdf_path, backend, text_only, measure_page) as (_, get_page):
+        for page_idx in page_indices:
+            payload, has_chars, layout_stats = _extract_page_internal(get_page(page_idx), page_idx + 1, crop_regions, extract_mode, kind)
+            results.append((page_idx + 1, payload, has_chars, layout_stats))
+    gc.collect()
+    return results
+
+def _iter_internal_pages(pdf_path, crop_regions, extract_mode, kind, workers, ui, backend="pdfplumber", stats=None, cache=None):
+    """
+    PDFの全ページを抽出し、ページ順に (ページ番号, 総ページ数, 抽出結果, 文字データの有無) を返すジェネレータ。
+    ワーカー数が2以上の場合は、ページを連続した範囲に分割して各ワーカープロセスで並列抽出する。
+    stats (dict) を渡すと、解析を省いた図形・画像の数を "skipped_objects" に、比較計測した解析時間を "text_layout_seconds" / "full_layout_seconds" に加算する。
+    cache (DiskCache) を渡すと、PDFの内容・ページ・抽出条件が同じページはキャッシュから返し、それ以外のページだけを抽出する。
+    """
+    if stats is None: stats = {}
+    stats.setdefault("skipped_objects", 0)
+    stats.setdefault("cached_pages", 0)
+    # テキストのみ必要な場合（テキストモード）は図形・画像を解析しない
+    text_only = kind == "text" or extract_mode == "text"
+
+    def compute(page_indices, total_hint=None):
+        """指定ページを抽出し、(ページ番号(0始まり), 総ページ数, 抽出結果, 文字データの有無) を昇順に返す"""
+        # 通常の解析との比較計測は、処理全体（stats を共有する全ファイル）で最初に抽出する1ページだけ行う
+        measure_page = None
+        if text_only and not stats.get("layout_sampled_pages"): measure_page = page_indices[0] if page_indices else 0
+        if workers <= 1 or len(page_indices) <= 1:
+            with _open_internal_document(pdf_path, backend, text_only, measure_page) as (total, get_page):
+                for n, page_idx in enumerate(page_indices if page_indices is not None else range(total)):
+                    if ui.is_cancelled(): return
+                    payload, has_chars, layout_stats = _extract_page_internal(get_page(page_idx), page_idx + 1, crop_regions, extract_mode, kind)
+                    _merge_layout_stats(stats, layout_stats)
+                    # pdfminerのオブジェクトは循環参照を持つため、一定ページごとに回収してピークメモリを抑える
+                    if n % 50 == 49: gc.collect()
+                    yield page_idx, total, payload, has_chars
+            return
+        # 進捗表示の粒度とプロセス間通信の回数のバランスを取り、1ワーカーあたり約4分割する
+        chunk_size = max(1, min(50, -(-len(page_indices) // (workers * 4))))
+        jobs = [(pdf_path, page_indices[s:s + chunk_size], crop_regions, extract_mode, kind, backend, measure_page) for s in range(0, len(page_indices), chunk_size)]
+        for chunk in iter_parallel_ordered(_internal_extract_worker, jobs, workers, ui):
+            for page_no, payload, has_chars, layout_stats in chunk:
+                _merge_layout_stats(stats, layout_stats)
+                yield page_no - 1, total_hint, payload, has_chars
+
+    digest = None
+    if cache is not None:
+        try: digest = file_digest(pdf_path)
+        except OSError: cache = None
+    if cache is None:
+        if workers <= 1:
+            for page_idx, total, payload, has_chars in compute(None):
+                yield page_idx + 1, total, payload, has_chars
+            return
+        with fitz.open(pdf_path) as doc: total = len(doc)
+        for page_idx, _, payload, has_chars in compute(list(range(total)), total):
+            yield page_idx + 1, total, payload, has_chars
+        return
+
+    # キャッシュのキー: PDFの内容・ページ・抽出範囲・抽出モード・抽出の種類・バックエンド
+    def cache_key(page_idx): return ["internal", digest, page_idx, crop_regions, extract_mode, kind, backend]
+    with fitz.open(pdf_path) as doc: total = len(doc)
+    misses = [idx for idx in range(total) if not cache.contains(cache_key(idx))]
+    computed = compute(misses, total) if misses else iter(())
+    misses = set(misses)
+    for page_idx in range(total):
+        if ui.is_cancelled(): return
+        entry = cache.get(cache_key(page_idx)) if page_idx not in misses else None
+        if entry is not None:
+            stats["cached_pages"] += 1
+            payload = tuple(entry["payload"]) if kind == "both" else entry["payload"]
+            yield page_idx + 1, total, payload, entry["has_chars"]
+            continue
+        # キャッシュが読めなかったページ（途中で削除された等）は、その場で抽出する
+        if page_idx in misses: result = next(computed, None)
+        else: result = next(compute([page_idx], total), None)
+        if result is None: return
+        _, _, payload, has_chars = result
+        cache.set(cache_key(page_idx), {"payload": payload, "has_chars": has_chars})
+        yield page_idx + 1, total, payload, has_chars
+
+# ==============================
+# 標準ライブラリ抽出 (出力形式ごとの書き込み先)
+# ==============================
+class _InternalTextSink:
+    """ページごとのテキストを {base}_Text.txt にまとめて書き込む"""
+    kind = "text"
+    def __init__(self, save_dir, base):
+        self.path = os.path.join(save_dir, f"{base}_Text.txt")
+        self.text_list = []
+
+    def add_page(self, page_no, total, page_text):
+        if page_text: self.text_list.append(page_text)
+
+    def finish(self, is_scanned_pdf):
+        if self.text_list:
+            output_content = normalize_text("\n\n".join(self.text_list))
         elif is_scanned_pdf:
             output_content = "このPDFは「画像（スキャンされたPDF）」として保存されており、標準ライブラリでは文字を読み取れません。\n「Gemini API」または「Tesseract」エンジンを使用して再試行してください。"
         else:
             output_content = "指定された範囲内にテキストデータが見つかりませんでした。枠を少し広げて選択するか、AIエンジンの使用を検討してください。"
-            
-        with open(os.path.join(save_dir, f"{base}_Text.txt"), "w", encoding="utf-8") as out: out.write(output_content)
+        with open(self.path, "w", encoding="utf-8") as out: out.write(output_content)
 
-def convert_to_excel_internal(files, save_dir, options, ui):
-    files = [f for f in files if f.lower().endswith(".pdf")]
-    if not files: raise Exception("PDFファイルが含まれていません。")
-    
-    for f in files:
-        if not check_pdf_has_text(f):
-            raise Exception(f"ファイル「{os.path.basename(f)}」はスキャンされた画像（ラスターデータ）のため、標準ライブラリではデータを抽出できません。\nエンジンを「Gemini API」または「Tesseract」に変更して実行してください。")
-            
-    border_style = Side(border_style="thin", color="000000")
-    crop_regions = options.get("crop_regions", [])
-    for i, pdf_path in enumerate(files, 1):
-        ui.update_overall(i, len(files), f"全体の進捗 ( {i} / {len(files)} ファイル )")
-        wb = Workbook(); wb.remove(wb.active)
-        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        
-        has_any_table = False
-        is_scanned_pdf = False
-        with pdfplumber.open(pdf_path) as pdf:
-            digits = max(2, len(str(len(pdf.pages))))
-            for page_idx, page in enumerate(pdf.pages, 1):
-                ui.set_determinate(page_idx, len(pdf.pages), f"表データを抽出中... ( {page_idx} / {len(pdf.pages)} ページ )")
-                if not page.chars: is_scanned_pdf = True
-                
-                tables = []
-                if crop_regions:
-                    all_regions_data = []
-                    for region in crop_regions:
-                        rx1, ry1, rx2, ry2 = region[:4]
-                        is_vert = region[4] if len(region) > 4 else False
-                        is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
-                        
-                        m_y = 0.0 if (is_line and is_vert) else 0.005
-                        m_x = 0.0 if (is_line and not is_vert) else 0.005
-                        
-                        x0 = max(0, min(rx1, rx2) - m_x) * page.width
-                        top = max(0, min(ry1, ry2) - m_y) * page.height
-                        x1 = min(1, max(rx1, rx2) + m_x) * page.width
-                        bottom = min(1, max(ry1, ry2) + m_y) * page.height
-                        
-                        cropped_page = page.crop((x0, top, x1, bottom), strict=False)
-                        
-                        if is_line:
-                            if is_vert:
-                                target_x = (min(rx1, rx2) + max(rx1, rx2)) / 2 * page.width
-                                def filter_obj(obj):
-                                    if obj.get("object_type") == "char":
-                                        mid_y = (obj["top"] + obj["bottom"]) / 2
-                                        intersects_x = (obj["x0"] <= target_x <= obj["x1"])
-                                        return (top <= mid_y <= bottom) and intersects_x
-                                    return True
-                                cropped_page = cropped_page.filter(filter_obj)
-                            else:
-                                target_y = (min(ry1, ry2) + max(ry1, ry2)) / 2 * page.height
-                                def filter_obj(obj):
-                                    if obj.get("object_type") == "char":
-                                        mid_x = (obj["x0"] + obj["x1"]) / 2
-                                        intersects_y = (obj["top"] <= target_y <= obj["bottom"])
-                                        return (x0 <= mid_x <= x1) and intersects_y
-                                    return True
-                                cropped_page = cropped_page.filter(filter_obj)
-                        
-                        tbls = []
-                        if options.get("extract_mode") != "text":
-                            tbls = cropped_page.extract_tables()
-                            if not tbls:
-                                tbl_settings = {"vertical_strategy": "text", "horizontal_strategy": "text", "snap_tolerance": 3}
-                                tbls = cropped_page.extract_tables(table_settings=tbl_settings)
-                        
-                        if not tbls:
-                            txt = cropped_page.extract_text()
-                            if txt and txt.strip():
-                                lines = [line.strip() for line in txt.strip().split('\n') if line.strip()]
-                                dummy_table = [[line] for line in lines]
-                                tbls = [dummy_table]
-                                
-                        region_table = []
-                        if tbls:
-                            for tbl in tbls: region_table.extend(tbl)
-                        
-                        if not region_table: region_table = [[""]]
-                        all_regions_data.append(region_table)
-                        
-                    if options.get("extract_mode") == "text":
-                        merged_row = []
-                        for region_data in all_regions_data:
-                            region_texts = []
-                            for r in region_data:
-                                for c in r:
-                                    if str(c).strip(): region_texts.append(str(c).strip())
-                            merged_row.append("\n".join(region_texts) if region_texts else "")
-                        merged_table = [merged_row] if merged_row else [[""]]
-                    else:
-                        merged_table = merge_2d_arrays_horizontally(all_regions_data)
-                        
-                    is_empty = True
-                    for row in merged_table:
-                        for cell in row:
-                            if cell and str(cell).strip():
-                                is_empty = False; break
-                        if not is_empty: break
-                            
-                    if not is_empty: tables = [merged_table]
-                else: 
-                    tables = []
-                    if options.get("extract_mode") != "text":
-                        tables = page.extract_tables()
-                        
-                    if not tables:
-                        txt = page.extract_text()
-                        if txt and txt.strip():
-                            lines = [line.strip() for line in txt.strip().split('\n') if line.strip()]
-                            if options.get("extract_mode") == "text":
-                                tables = [[lines]]
-                            else:
-                                dummy_table = [[line] for line in lines]
-                                tables = [dummy_table]
-                
-                if not tables: continue
-                has_any_table = True
-                ws = wb.create_sheet(f"Page_{str(page_idx).zfill(digits)}"); current_row = 1
-                for table in tables:
-                    for row_data in table:
-                        for col_idx, cell_value in enumerate(row_data, 1):
-                            clean_value = sanitize_excel_text(cell_value)
-                            cell = ws.cell(row=current_row, column=col_idx, value=clean_value if clean_value else "")
-                            cell.border = Border(left=border_style, right=border_style, top=border_style, bottom=border_style)
-                        current_row += 1
-                    current_row += 2
-                auto_adjust_excel_column_width(ws)
-        
-        if has_any_table:
-            wb.save(os.path.join(save_dir, f"{base_name}_Excel.xlsx"))
-        else:
-            empty_wb = Workbook(); ws = empty_wb.active; ws.title = "No_Data"
-            if is_scanned_pdf: msg = "このPDFは「スキャンされた画像」です。Gemini APIまたはTesseractを使用してください。"
-            else: msg = "指定範囲内に表構造やテキストデータが見つかりませんでした。"
-            ws.cell(row=1, column=1, value=msg)
-            empty_wb.save(os.path.join(save_dir, f"{base_name}_Excel_NoData.xlsx"))
+    def close(self):
+        pass
 
-def convert_to_csv_internal(files, save_dir, options, ui):
+class _InternalExcelSink:
+    """ページごとの表を {base}_Excel.xlsx のページ別シートへ逐次書き込む"""
+    kind = "table"
+    def __init__(self, save_dir, base):
+        self.save_dir, self.base = save_dir, base
+        self.writer = None
+
+    def add_page(self, page_no, total, tables):
+        if not tables: return
+        # 表が見つかった時点で初めてファイルを作成し、ページごとのシートへ逐次書き込む
+        if self.writer is None: self.writer = ExcelStreamWriter(os.path.join(self.save_dir, f"{self.base}_Excel.xlsx"))
+        digits = max(2, len(str(total)))
+        self.writer.add_sheet(f"Page_{str(page_no).zfill(digits)}")
+        for table in tables:
+            self.writer.write_rows(table, bordered=True)
+            self.writer.skip_rows(2)
+
+    def finish(self, is_scanned_pdf):
+        if self.writer is not None: return
+        if is_scanned_pdf: msg = "このPDFは「スキャンされた画像」です。Gemini APIまたはTesseractを使用してください。"
+        else: msg = "指定範囲内に表構造やテキストデータが見つかりませんでした。"
+        with ExcelStreamWriter(os.path.join(self.save_dir, f"{self.base}_Excel_NoData.xlsx")) as empty_writer:
+            empty_writer.add_sheet("No_Data")
+            empty_writer.write_row([msg])
+
+    def close(self):
+        if self.writer: self.writer.close()
+
+class _InternalCsvSink:
+    """ページごとの表を {base}_Page_XX_CSV.csv へ書き込む"""
+    kind = "table"
+    def __init__(self, save_dir, base):
+        self.save_dir, self.base = save_dir, base
+        self.has_any_table = False
+
+    def add_page(self, page_no, total, tables):
+        if not tables: return
+        self.has_any_table = True
+        digits = max(2, len(str(total)))
+        with open(os.path.join(self.save_dir, f"{self.base}_Page_{str(page_no).zfill(digits)}_CSV.csv"), "w", encoding="utf-8-sig", newline="") as f_out:
+            writer = csv.writer(f_out)
+            for table in tables:
+                for row_data in table: writer.writerow([str(cell).strip() if cell else "" for cell in row_data])
+                writer.writerow([]) 
+
+    def finish(self, is_scanned_pdf):
+        if self.has_any_table: return
+        with open(os.path.join(self.save_dir, f"{self.base}_NoData_CSV.txt"), "w", encoding="utf-8") as f_out:
+            f_out.write("データが見つかりませんでした。PDFがスキャン形式であるか、範囲が狭すぎる可能性があります。")
+
+    def close(self):
+        pass
+
+class _InternalTableFileSink:
+    """
+    ページごとの表を、PDFごとに1つのファイル（{base}_JSON.jsonl / {base}_Markdown.md / {base}_Word.docx）へまとめて書き込む。
+    各表の先頭行を見出しとして扱う（json は表ごとに1行、ページ番号と表の番号を付ける）。
+    """
+    kind = "table"
+    SUFFIXES = {"json": "_JSON", "md": "_Markdown", "docx": "_Word"}
+    def __init__(self, save_dir, base, out_format):
+        self.save_dir, self.base, self.out_format = save_dir, base, out_format
+        self.sink = None
+        self._seq = 0
+
+    def add_page(self, page_no, total, tables):
+        if not tables: return
+        # 表が見つかった時点で初めてファイルを作成する
+        if self.sink is None: self.sink = ConsolidatedTableSink(os.path.join(self.save_dir, f"{self.base}{self.SUFFIXES[self.out_format]}"), self.out_format)
+        for table_no, table in enumerate(tables, 1):
+            rows = [[str(cell).strip() if cell else "" for cell in row_data] for row_data in table]
+            self.sink.write_page(self._seq, rows, {"page": page_no, "table": table_no})
+            self._seq += 1
+
+    def finish(self, is_scanned_pdf):
+        if self.sink is not None: return
+        with open(os.path.join(self.save_dir, f"{self.base}_NoData{self.SUFFIXES[self.out_format]}.txt"), "w", encoding="utf-8") as f_out:
+            f_out.write("データが見つかりませんでした。PDFがスキャン形式であるか、範囲が狭すぎる可能性があります。")
+
+    def close(self):
+        if self.sink: self.sink.close()
+
+_INTERNAL_SINKS = {"txt": _InternalTextSink, "xlsx": _InternalExcelSink, "csv": _InternalCsvSink,
+                   "json": _InternalTableFileSink, "md": _InternalTableFileSink, "docx": _InternalTableFileSink}
+
+def _open_internal_sink(fmt, save_dir, base):
+    sink_class = _INTERNAL_SINKS[fmt]
+    if sink_class is _InternalTableFileSink: return sink_class(save_dir, base, fmt)
+    return sink_class(save_dir, base)
+
+def extract_internal_task(files, save_dir, options, ui, formats=None):
+    """
+    標準ライブラリによる抽出。1回のページ解析の結果を、指定された全ての出力形式 (xlsx / csv / txt / json / md / docx) へ同時に書き込む。
+    formats を省略した場合は options["out_formats"]（無ければ options["out_format"]）を使う。
+    """
     files = [f for f in files if f.lower().endswith(".pdf")]
     if not files: raise Exception("PDFファイルが含まれていません。")
-    
-    for f in files:
-        if not check_pdf_has_text(f):
-            raise Exception(f"ファイル「{os.path.basename(f)}」はスキャンされた画像（ラスターデータ）のため、標準ライブラリではデータを抽出できません。\nエンジンを「Gemini API」または「Tesseract」に変更して実行してください。")
-            
+    if formats is None: formats = options.get("out_formats") or [options.get("out_format", "xlsx")]
+    formats = [fmt for fmt in dict.fromkeys(formats) if fmt in _INTERNAL_SINKS]
+    if not formats: raise Exception("標準ライブラリ（Internal）が対応している出力形式は Excel / CSV / Text / JSON / Markdown / Word です。")
+
+    kinds = {_INTERNAL_SINKS[fmt].kind for fmt in formats}
+    kind = kinds.pop() if len(kinds) == 1 else "both"
+    # テキストのみの出力では抽出モードを参照しない（図形の解析も省略される）
+    extract_mode = options.get("extract_mode") if kind != "text" else None
+    workers = resolve_worker_count(options.get("internal_workers", 1))
+    backend = resolve_internal_backend(options.get("internal_backend", "pdfplumber"))
+    cache = open_result_cache("internal", options)
+    scanned_files = []
+    stats = {}
+    try:
+        _run_internal_files(files, save_dir, options, ui, formats, kind, extract_mode, workers, backend, cache, scanned_files, stats)
+    finally:
+        if cache: cache.evict()
+    _report_scanned_files(ui, scanned_files)
+    _report_skipped_objects(ui, stats)
+    _report_cached_pages(ui, stats.get("cached_pages", 0))
+
+def _run_internal_files(files, save_dir, options, ui, formats, kind, extract_mode, workers, backend, cache, scanned_files, stats):
     crop_regions = options.get("crop_regions", [])
     for i, pdf_path in enumerate(files, 1):
+        if ui.is_cancelled(): return
         ui.update_overall(i, len(files), f"全体の進捗 ( {i} / {len(files)} ファイル )")
         base = os.path.splitext(os.path.basename(pdf_path))[0]
-        
-        has_any_table = False
-        with pdfplumber.open(pdf_path) as pdf:
-            digits = max(2, len(str(len(pdf.pages))))
-            for page_idx, page in enumerate(pdf.pages, 1):
-                ui.set_determinate(page_idx, len(pdf.pages), f"CSV変換中... ( {page_idx} / {len(pdf.pages)} ページ )")
-                tables = []
-                if crop_regions:
-                    all_regions_data = []
-                    for region in crop_regions:
-                        rx1, ry1, rx2, ry2 = region[:4]
-                        is_vert = region[4] if len(region) > 4 else False
-                        is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
-                        
-                        m_y = 0.0 if (is_line and is_vert) else 0.005
-                        m_x = 0.0 if (is_line and not is_vert) else 0.005
-                        
-                        x0 = max(0, min(rx1, rx2) - m_x) * page.width
-                        top = max(0, min(ry1, ry2) - m_y) * page.height
-                        x1 = min(1, max(rx1, rx2) + m_x) * page.width
-                        bottom = min(1, max(ry1, ry2) + m_y) * page.height
-                        
-                        cropped_page = page.crop((x0, top, x1, bottom), strict=False)
-                        
-                        if is_line:
-                            if is_vert:
-                                target_x = (min(rx1, rx2) + max(rx1, rx2)) / 2 * page.width
-                                def filter_obj(obj):
-                                    if obj.get("object_type") == "char":
-                                        mid_y = (obj["top"] + obj["bottom"]) / 2
-                                        intersects_x = (obj["x0"] <= target_x <= obj["x1"])
-                                        return (top <= mid_y <= bottom) and intersects_x
-                                    return True
-                                cropped_page = cropped_page.filter(filter_obj)
-                            else:
-                                target_y = (min(ry1, ry2) + max(ry1, ry2)) / 2 * page.height
-                                def filter_obj(obj):
-                                    if obj.get("object_type") == "char":
-                                        mid_x = (obj["x0"] + obj["x1"]) / 2
-                                        intersects_y = (obj["top"] <= target_y <= obj["bottom"])
-                                        return (x0 <= mid_x <= x1) and intersects_y
-                                    return True
-                                cropped_page = cropped_page.filter(filter_obj)
-                        
-                        tbls = []
-                        if options.get("extract_mode") != "text":
-                            tbls = cropped_page.extract_tables()
-                            if not tbls:
-                                tbls = cropped_page.extract_tables(table_settings={"vertical_strategy": "text", "horizontal_strategy": "text"})
-                        
-                        if not tbls:
-                            txt = cropped_page.extract_text()
-                            if txt and txt.strip():
-                                lines = [line.strip() for line in txt.strip().split('\n') if line.strip()]
-                                tbls = [[[line] for line in lines]]
-                                
-                        region_table = []
-                        if tbls:
-                            for tbl in tbls: region_table.extend(tbl)
-                                
-                        if not region_table: region_table = [[""]]
-                        all_regions_data.append(region_table)
-                        
-                    if options.get("extract_mode") == "text":
-                        merged_row = []
-                        for region_data in all_regions_data:
-                            region_texts = []
-                            for r in region_data:
-                                for c in r:
-                                    if str(c).strip(): region_texts.append(str(c).strip())
-                            merged_row.append("\n".join(region_texts) if region_texts else "")
-                        merged_table = [merged_row] if merged_row else [[""]]
-                    else:
-                        merged_table = merge_2d_arrays_horizontally(all_regions_data)
-                        
-                    is_empty = True
-                    for row in merged_table:
-                        for cell in row:
-                            if cell and str(cell).strip():
-                                is_empty = False; break
-                        if not is_empty: break
-                            
-                    if not is_empty: tables = [merged_table]
-                else: 
-                    tables = []
-                    if options.get("extract_mode") != "text":
-                        tables = page.extract_tables()
-                        
-                    if not tables:
-                        txt = page.extract_text()
-                        if txt and txt.strip():
-                            lines = [line.strip() for line in txt.strip().split('\n') if line.strip()]
-                            if options.get("extract_mode") == "text":
-                                tables = [[lines]]
-                            else:
-                                tables = [[[line] for line in lines]]
-                
-                if not tables: continue
-                has_any_table = True
-                with open(os.path.join(save_dir, f"{base}_Page_{str(page_idx).zfill(digits)}_CSV.csv"), "w", encoding="utf-8-sig", newline="") as f_out:
-                    writer = csv.writer(f_out)
-                    for table in tables:
-                        for row_data in table: writer.writerow([str(cell).strip() if cell else "" for cell in row_data])
-                        writer.writerow([]) 
-        
-        if not has_any_table:
-            with open(os.path.join(save_dir, f"{base}_NoData_CSV.txt"), "w", encoding="utf-8") as f_out:
-                f_out.write("データが見つかりませんでした。PDFがスキャン形式であるか、範囲が狭すぎる可能性があります。")
+        sinks = [_open_internal_sink(fmt, save_dir, base) for fmt in formats]
+
+        # テキストレイヤーの有無は事前に全ファイルを走査せず、抽出処理の中で判定する
+        known = get_cached_text_layer(pdf_path)
+        is_scanned_pdf, has_text = known is False, False
+        pages = () if known is False else _iter_internal_pages(pdf_path, crop_regions, extract_mode, kind, workers, ui, backend, stats, cache)
+        try:
+            for page_no, total, payload, has_chars in pages:
+                ui.set_determinate(page_no, total, f"データを抽出中... ( {page_no} / {total} ページ ){memory_status_text()}")
+                if has_chars: has_text = True
+                else: is_scanned_pdf = True
+                for sink in sinks:
+                    if kind == "both": sink.add_page(page_no, total, payload[0] if sink.kind == "text" else payload[1])
+                    else: sink.add_page(page_no, total, payload)
+        finally:
+            for sink in sinks: sink.close()
+        if ui.is_cancelled(): return
+        if known is None: remember_text_layer(pdf_path, has_text)
+        if not has_text: scanned_files.append(os.path.basename(pdf_path))
+        for sink in sinks: sink.finish(is_scanned_pdf)
+
+def extract_text_internal(files, save_dir, options, ui):
+    extract_internal_task(files, save_dir, options, ui, ["txt"])
+
+def convert_to_excel_internal(files, save_dir, options, ui):
+    extract_internal_task(files, save_dir, options, ui, ["xlsx"])
+
+def convert_to_csv_internal(files, save_dir, options, ui):
+    extract_internal_task(files, save_dir, options, ui, ["csv"])
 
 def convert_to_image_jpg(files, save_dir, options, ui): _convert_image(files, save_dir, options, ui, "jpg")
 def convert_to_image_png(files, save_dir, options, ui): _convert_image(files, save_dir, options, ui, "png")
@@ -508,17 +908,16 @@ def _convert_image(files, save_dir, options, ui, ext):
         for n, page in enumerate(doc, 1):
             ui.set_determinate(n, len(doc), f"画像へ変換中... ( {n} / {len(doc)} ページ )")
             n_str = str(n).zfill(digits)
-            pix = page.get_pixmap(dpi=200)
             if crop_regions:
-                img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-                if pix.n == 4: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-                elif pix.n == 1: img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
+                img_array, pix = render_page_cached(page, dpi=200)
                 h, w = img_array.shape[:2]
-                for idx, (rx1, ry1, rx2, ry2) in enumerate(crop_regions):
+                for idx, region in enumerate(crop_regions):
+                    rx1, ry1, rx2, ry2 = region[:4]
                     x1, y1 = int(min(rx1, rx2) * w), int(min(ry1, ry2) * h)
                     x2, y2 = int(max(rx1, rx2) * w), int(max(ry1, ry2) * h)
                     Image.fromarray(img_array[y1:y2, x1:x2]).save(os.path.join(save_dir, f"{base}_{n_str}_crop{idx+1}.{ext}"))
             else: 
+                pix = page.get_pixmap(dpi=200)
                 if ext in ["tiff", "bmp"]:
                     Image.frombytes("RGB" if pix.n >= 3 else "L", [pix.width, pix.height], pix.samples).save(os.path.join(save_dir, f"{base}_{n_str}.{ext}"))
                 else:
@@ -538,7 +937,8 @@ def convert_to_svg(files, save_dir, options, ui):
             n_str = str(n).zfill(digits)
             if crop_regions:
                 h, w = page.rect.height, page.rect.width
-                for idx, (rx1, ry1, rx2, ry2) in enumerate(crop_regions):
+                for idx, region in enumerate(crop_regions):
+                    rx1, ry1, rx2, ry2 = region[:4]
                     rect = fitz.Rect(min(rx1, rx2)*w, min(ry1, ry2)*h, max(rx1, rx2)*w, max(ry1, ry2)*h)
                     page.set_cropbox(rect)
                     svg_xml = page.get_svg_image()
@@ -556,7 +956,8 @@ def convert_to_dxf(files, save_dir, options, ui):
     crop_regions = options.get("crop_regions", [])
     def in_crop(x, y, w, h):
         if not crop_regions: return True
-        for (rx1, ry1, rx2, ry2) in crop_regions:
+        for region in crop_regions:
+            rx1, ry1, rx2, ry2 = region[:4]
             if min(rx1, rx2)*w <= x <= max(rx1, rx2)*w and min(ry1, ry2)*h <= y <= max(ry1, ry2)*h: return True
         return False
 
@@ -590,9 +991,10 @@ def convert_to_dxf(files, save_dir, options, ui):
 # ==============================
 # 画像前処理タスク (OCR精度向上)
 # ==============================
-def preprocess_image_for_ocr(img_array, is_digital=False):
+def preprocess_image_for_ocr(img_array, is_digital=False, dpi=400):
     """
     デジタルPDFとスキャンPDFで適切な前処理を自動で使い分ける
+    dpi は画像の解像度（適応的二値化のブロックサイズを、文字の太さに合わせて調整する）
     """
     if len(img_array.shape) == 3: gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
     else: gray = img_array
@@ -609,108 +1011,457 @@ def preprocess_image_for_ocr(img_array, is_digital=False):
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
         gray = clahe.apply(gray)
         # 解像度が高い(dpi=400)場合、文字の線が太くなるため、ブロックサイズを大きく(51)して太い文字の中抜けを防止します。
-        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 51, 15)
+        # 解像度を下げた場合は文字も細くなるため、ブロックサイズも比例して小さくします（奇数に丸める）。
+        block_size = max(11, int(51 * dpi / 400) | 1)
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block_size, 15)
         return binary
 
 # ==============================
 # ローカルOCR抽出タスク (Tesseract)
 # ==============================
-def check_tesseract_installation():
+def _configure_tesseract_cmd():
     if sys.platform.startswith("win"):
         tess_path = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
         if os.path.exists(tess_path): pytesseract.pytesseract.tesseract_cmd = tess_path
+
+def check_tesseract_installation():
+    # tesserocr を使う場合も、APIの作成・認識に失敗したページは pytesseract（実行ファイル）で処理するため、常に確認する
+    _configure_tesseract_cmd()
     try: pytesseract.get_tesseract_version()
     except Exception: raise Exception("Tesseract OCRが見つかりません。")
 
+# OCRの解像度と言語（キャッシュのキーにも含める）
+TESSERACT_DPI = 400
+TESSERACT_LANG = "jpn+jpn_vert+eng"
+# 平均信頼度がこれ未満のページは、確認を促すため処理結果の報告に列挙する
+LOW_CONFIDENCE_THRESHOLD = 60
+# 適応解像度: 文字の高さがTesseractの認識に最適な大きさ（概ね20〜40px）に収まる最小の解像度で描画する
+ADAPTIVE_TARGET_GLYPH_PX = 32
+ADAPTIVE_DPI_MIN = 150
+ADAPTIVE_DPI_STEP = 25
+# テキストレイヤーの無いページで文字の大きさを測るための低解像度描画
+ADAPTIVE_PROBE_DPI = 100
+# スキャン画像を直接OCRする最低解像度（これより粗い画像は、従来通り高解像度で描画して補間する）
+NATIVE_IMAGE_MIN_DPI = 200
+
+def choose_ocr_dpi(glyph_height_pt):
+    """文字の高さ(pt)から、目標のピクセル高さになる解像度を返す（ADAPTIVE_DPI_MIN〜TESSERACT_DPI、推定できない場合は TESSERACT_DPI）"""
+    if not glyph_height_pt or glyph_height_pt <= 0: return TESSERACT_DPI
+    dpi = ADAPTIVE_TARGET_GLYPH_PX * 72 / glyph_height_pt
+    dpi = -(-dpi // ADAPTIVE_DPI_STEP) * ADAPTIVE_DPI_STEP
+    return int(min(TESSERACT_DPI, max(ADAPTIVE_DPI_MIN, dpi)))
+
+def _estimate_glyph_height_pt(page_obj, crop_regions, has_text):
+    """
+    抽出範囲（指定が無い場合はページ全体）にある文字の代表的な高さ(pt)を推定する。推定できない場合は None。
+    テキストレイヤーがある場合はフォントサイズの中央値、無い場合は低解像度で描画した画像の文字らしい連結成分の高さの中央値を使う。
+    小さい文字を取りこぼさないよう、迷う場合は小さめ（高解像度寄り）に推定する。
+    """
+    rect = page_obj.rect
+    areas = [fitz.Rect(min(r[0], r[2]) * rect.width, min(r[1], r[3]) * rect.height, max(r[0], r[2]) * rect.width, max(r[1], r[3]) * rect.height)
+             for r in crop_regions] or [rect]
+    if has_text:
+        sizes = []
+        for block in page_obj.get_text("dict")["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    text = span["text"].strip()
+                    if not text: continue
+                    bbox = fitz.Rect(span["bbox"])
+                    if page_obj.rotation: bbox = bbox * page_obj.rotation_matrix
+                    if any(bbox.intersects(area) for area in areas): sizes.extend([span["size"]] * len(text))
+        if sizes: return float(np.median(sizes))
+
+    gray, _pix = render_page_cached(page_obj, dpi=ADAPTIVE_PROBE_DPI, gray=True)
+    img_h, img_w = gray.shape[:2]  # キャッシュから縮小した画像は Pixmap を伴わないため、大きさは画像配列から取る
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    _, _, comp_stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights, widths = comp_stats[1:, cv2.CC_STAT_HEIGHT], comp_stats[1:, cv2.CC_STAT_WIDTH]
+    cx, cy = centroids[1:, 0] * rect.width / img_w, centroids[1:, 1] * rect.height / img_h
+    in_area = np.zeros(len(heights), dtype=bool)
+    for area in areas: in_area |= (cx >= area.x0) & (cx < area.x1) & (cy >= area.y0) & (cy < area.y1)
+    # 罫線・図形・ノイズを除き、文字らしい大きさと縦横比の成分だけを使う
+    glyph_like = in_area & (heights >= 3) & (heights <= img_h * 0.1) & (widths <= heights * 3)
+    if not glyph_like.any(): return None
+    return float(np.median(heights[glyph_like])) * 72 / ADAPTIVE_PROBE_DPI
+
+# ==============================
+# OCRバックエンド (pytesseract / tesserocr)
+# ==============================
+# psm ごとに作成した tesserocr の API（プロセス内で使い回し、言語データの読み込みを1回にする）。作成に失敗した場合は None
+_TESSEROCR_APIS = {}
+
+def _import_tesserocr():
+    """
+    tesserocr（任意）を読み込む。無い場合は None。
+    OpenMPのスレッド数制限（OMP_THREAD_LIMIT）をワーカーの初期化後に反映させるため、モジュールの先頭ではなく使用時に読み込む。
+    """
+    try: import tesserocr
+    except ImportError: return None
+    return tesserocr
+
+def _tessdata_dir():
+    """pytesseract に設定された実行ファイルと同じ場所にある言語データのフォルダ（無ければ None で tesserocr の既定値を使う）"""
+    cmd = pytesseract.pytesseract.tesseract_cmd
+    if os.path.isabs(cmd):
+        path = os.path.join(os.path.dirname(cmd), "tessdata")
+        if os.path.isdir(path): return path + os.sep
+    return None
+
+def _tesserocr_api(psm):
+    if psm not in _TESSEROCR_APIS:
+        tesserocr = _import_tesserocr()
+        api = None
+        if tesserocr is not None:
+            kwargs = {"lang": TESSERACT_LANG, "psm": psm, "oem": tesserocr.OEM.DEFAULT}
+            if _tessdata_dir(): kwargs["path"] = _tessdata_dir()
+            try: api = tesserocr.PyTessBaseAPI(**kwargs)
+            except Exception: api = None
+        _TESSEROCR_APIS[psm] = api
+    return _TESSEROCR_APIS[psm]
+
+def resolve_tesseract_backend(name):
+    """
+    設定値からOCRバックエンドを決定する。tesserocr は任意の依存のため、明示的に選択され、
+    かつ読み込み・言語データの読み込みに成功した場合のみ使う（それ以外は pytesseract）。
+    """
+    _configure_tesseract_cmd()
+    if name == "tesserocr" and _import_tesserocr() is not None and _tesserocr_api(3) is not None: return "tesserocr"
+    return "pytesseract"
+
+def tesseract_engine_version(backend):
+    if backend == "tesserocr": return "tesserocr " + _import_tesserocr().tesseract_version().splitlines()[0]
+    return str(pytesseract.get_tesseract_version())
+
+def _ocr_image_to_string(pil_img, psm, backend):
+    api = _tesserocr_api(psm) if backend == "tesserocr" else None
+    if api is None: return pytesseract.image_to_string(pil_img, lang=TESSERACT_LANG, config=f'--oem 3 --psm {psm}')
+    api.SetImage(pil_img)
+    return api.GetUTF8Text()
+
+def _ocr_image_to_data(pil_img, psm, backend):
+    """単語ごとの文字・信頼度・位置・ブロック/段落/行番号を、pytesseract.image_to_data (Output.DICT) と同じ形式で返す"""
+    api = _tesserocr_api(psm) if backend == "tesserocr" else None
+    if api is None: return pytesseract.image_to_data(pil_img, lang=TESSERACT_LANG, config=f'--oem 3 --psm {psm}', output_type=pytesseract.Output.DICT)
+    RIL = _import_tesserocr().RIL
+    data = {k: [] for k in ("text", "conf", "left", "top", "width", "height", "block_num", "par_num", "line_num")}
+    api.SetImage(pil_img); api.Recognize()
+    iterator = api.GetIterator()
+    if iterator is None: return data
+    block = par = line = 0
+    for word in _import_tesserocr().iterate_level(iterator, RIL.WORD):
+        if word.IsAtBeginningOf(RIL.BLOCK): block, par, line = block + 1, 0, 0
+        if word.IsAtBeginningOf(RIL.PARA): par, line = par + 1, 0
+        if word.IsAtBeginningOf(RIL.TEXTLINE): line += 1
+        box = word.BoundingBox(RIL.WORD)
+        if box is None: continue
+        data["text"].append(word.GetUTF8Text(RIL.WORD) or ""); data["conf"].append(word.Confidence(RIL.WORD))
+        data["left"].append(box[0]); data["top"].append(box[1]); data["width"].append(box[2] - box[0]); data["height"].append(box[3] - box[1])
+        data["block_num"].append(block); data["par_num"].append(par); data["line_num"].append(line)
+    return data
+
+def _report_page_sources(ui, sources):
+    if not sum(sources.values()): return
+    ui.add_report(f"ハイブリッド抽出の内訳: テキストレイヤー {sources['text']:,} ページ ／ OCR {sources['ocr']:,} ページ"
+                  f" ／ 併用（文字の無い範囲のみOCR） {sources['mixed']:,} ページ")
+
+def _report_page_dpis(ui, page_dpis):
+    if not page_dpis: return
+    lines = []
+    for dpi in sorted(page_dpis, reverse=True):
+        pages = page_dpis[dpi]
+        listed = "、".join(pages[:20]) + (f" ほか{len(pages) - 20}ページ" if len(pages) > 20 else "")
+        lines.append(f"・{dpi}dpi ({len(pages):,}ページ): {listed}")
+    ui.add_report("OCRに使用した解像度（適応解像度）:\n" + "\n".join(lines))
+
+def _report_low_confidence_pages(ui, pages):
+    if not pages: return
+    lines = [f"・{name} P{page_no} (信頼度 {conf:.0f})" for name, page_no, conf in pages[:30]]
+    if len(pages) > 30: lines.append(f"・ほか {len(pages) - 30} ページ")
+    ui.add_report("以下のページはOCRの認識信頼度が低いため、結果の確認をお勧めします。\n" + "\n".join(lines))
+
+def _ocr_region_boxes(img_array, crop_regions, options):
+    """抽出範囲（相対座標）を、OCRに使う画像上のピクセル矩形 (x1, y1, x2, y2) のリストに変換する。範囲指定が無い場合はページ全体"""
+    h_img, w_img = img_array.shape[:2]
+    if not crop_regions: return [(0, 0, w_img, h_img)]
+    out_format = options.get("out_format", "xlsx")
+    boxes, object_boxes = [], None
+    for region in crop_regions:
+        rx1, ry1, rx2, ry2 = region[:4]
+        is_vert = region[4] if len(region) > 4 else False
+        is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
+        # 水平線モード、垂直線モード、またはテキスト抽出モードの場合は範囲拡張
+        if out_format not in ["xlsx", "csv"] or is_line or options.get("extract_mode") == "text":
+            # 輪郭の抽出はページごとに1回だけ行い、全ての範囲で共有する
+            if object_boxes is None: object_boxes = find_object_boxes(img_array)
+            boxes.append(expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2, object_boxes))
+        else:
+            boxes.append((int(min(rx1, rx2) * w_img), int(min(ry1, ry2) * h_img), int(max(rx1, rx2) * w_img), int(max(ry1, ry2) * h_img)))
+    return boxes
+
+def _ocr_regions_separately(img_array, boxes, is_digital, has_regions, backend="pytesseract", dpi=TESSERACT_DPI):
+    """抽出範囲ごとに切り出した画像を1回ずつOCRする（従来方式）"""
+    all_regions_data = []
+    for x1, y1, x2, y2 in boxes:
+        try:
+            # デジタルかスキャンかを渡して、最適な前処理を適用する
+            processed_img = preprocess_image_for_ocr(img_array[y1:y2, x1:x2], is_digital, dpi)
+            
+            # 【改善】範囲指定抽出(セル単位等)の場合は PSM 6 (均一なテキストブロック)、ページ全体の場合は PSM 3 を使用
+            psm_val = 6 if has_regions else 3
+            
+            text = normalize_text(_ocr_image_to_string(Image.fromarray(processed_img), psm_val, backend))
+            
+            lines = [l.strip() for l in text.split('\n') if l.strip()]
+            if lines: all_regions_data.append([[l] for l in lines])
+            else: all_regions_data.append([[""]])
+        except Exception: all_regions_data.append([["Error"]])
+    return all_regions_data, None
+
+def _ocr_regions_single_pass(img_array, boxes, is_digital, backend="pytesseract", dpi=TESSERACT_DPI):
+    """
+    全抽出範囲を囲む矩形を1回だけOCR（image_to_data）し、得られた単語を中心座標で各抽出範囲に振り分ける。
+    範囲の数に関わらずTesseractの起動・言語データの読み込みはページあたり1回で済む。
+    範囲が重なっている場合、重なり部分の単語は両方の範囲に含める（範囲ごとにOCRする従来方式と同じ扱い）。
+    戻り値: (抽出範囲ごとの表データのリスト, 範囲内の単語の平均信頼度 0〜100 または None)
+    """
+    ux1, uy1 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+    ux2, uy2 = max(b[2] for b in boxes), max(b[3] for b in boxes)
+    try:
+        processed_img = preprocess_image_for_ocr(img_array[uy1:uy2, ux1:ux2], is_digital, dpi)
+        data = _ocr_image_to_data(Image.fromarray(processed_img), 3, backend)
+    except Exception: return [[["Error"]] for _ in boxes], None
+
+    texts = [normalize_text(str(t)).strip() for t in data["text"]]
+    conf = np.asarray(data["conf"], dtype=float)
+    left, top = np.asarray(data["left"], dtype=float) + ux1, np.asarray(data["top"], dtype=float) + uy1
+    word_boxes = np.column_stack([left, top, left + np.asarray(data["width"], dtype=float), top + np.asarray(data["height"], dtype=float)])
+    line_ids = list(zip(data["block_num"], data["par_num"], data["line_num"]))
+    region_rows, inside = _assign_words_to_regions(word_boxes, texts, line_ids, boxes, valid=conf >= 0)
+    in_any = inside.any(axis=1)
+    confidence = float(conf[in_any].mean()) if in_any.any() else None
+    return [rows or [[""]] for rows in region_rows], confidence
+
+def _assign_words_to_regions(word_boxes, texts, line_ids, boxes, valid=None, overlap=None):
+    """
+    単語の矩形 (単語数×4) を抽出範囲 boxes に振り分け、範囲ごとの行データ（単語が無い範囲は空リスト）と、単語数×範囲数の所属行列を返す。
+    通常は単語の中心が範囲内にあるものを、overlap[範囲] が True の範囲（線モード等）は範囲に少しでも重なる単語を含める。
+    同じ行（line_ids が同じ）の単語は、入力順（読み順）のまま空白区切りで連結する（image_to_string と同じ形）。
+    """
+    word_boxes = np.asarray(word_boxes, dtype=float).reshape(-1, 4)
+    b = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    keep = np.array([bool(t) for t in texts], dtype=bool)
+    if valid is not None: keep &= valid
+    # 包含判定は、単語数×範囲数の行列で一括計算する
+    cx = (word_boxes[:, 0] + word_boxes[:, 2])[:, None] / 2
+    cy = (word_boxes[:, 1] + word_boxes[:, 3])[:, None] / 2
+    inside = (cx >= b[:, 0]) & (cx < b[:, 2]) & (cy >= b[:, 1]) & (cy < b[:, 3])
+    if overlap is not None and any(overlap):
+        touches = (word_boxes[:, 0:1] < b[:, 2]) & (word_boxes[:, 2:3] > b[:, 0]) & (word_boxes[:, 1:2] < b[:, 3]) & (word_boxes[:, 3:4] > b[:, 1])
+        inside = np.where(np.asarray(overlap, dtype=bool)[None, :], touches, inside)
+    inside &= keep[:, None]
+
+    region_rows = []
+    for r in range(len(b)):
+        lines = {}
+        for i in np.flatnonzero(inside[:, r]): lines.setdefault(line_ids[i], []).append(texts[i])
+        region_rows.append([[" ".join(words)] for words in lines.values()])
+    return region_rows, inside
+
+def _text_layer_regions(page_obj, crop_regions, options):
+    """
+    デジタルPDFのページについて、抽出範囲ごとの表データをテキストレイヤーから作る（OCRを行わない）。
+    テキストレイヤーに文字が無い範囲は None とし、呼び出し側でOCRする。
+    """
+    rect = page_obj.rect
+    words = page_obj.get_text("words")
+    if not words: return [None] * max(1, len(crop_regions))
+    word_boxes = np.array([w[:4] for w in words], dtype=float)
+    # テキストの座標は回転前のページ基準のため、画面表示（抽出範囲の指定）と同じ回転後の座標に変換する
+    if page_obj.rotation:
+        word_boxes = np.array([tuple(fitz.Rect(wb) * page_obj.rotation_matrix) for wb in word_boxes], dtype=float)
+    texts = [normalize_text(w[4]).strip() for w in words]
+    line_ids = [(w[5], w[6]) for w in words]
+    if crop_regions:
+        boxes = [(min(r[0], r[2]) * rect.width, min(r[1], r[3]) * rect.height, max(r[0], r[2]) * rect.width, max(r[1], r[3]) * rect.height) for r in crop_regions]
+        # 画像OCRで範囲を拡張する条件（線モード・テキスト抽出モード等）では、範囲に掛かる単語を途切れさせずに含める
+        out_format = options.get("out_format", "xlsx")
+        overlap = [out_format not in ["xlsx", "csv"] or options.get("extract_mode") == "text" or (r[4] if len(r) > 4 else False)
+                   or abs(r[3] - r[1]) < 0.03 or abs(r[2] - r[0]) < 0.03 for r in crop_regions]
+    else: boxes, overlap = [(rect.x0, rect.y0, rect.x1, rect.y1)], None
+    region_rows, _ = _assign_words_to_regions(word_boxes, texts, line_ids, boxes, overlap=overlap)
+    return [rows or None for rows in region_rows]
+
+def _ocr_page_regions(page_obj, crop_regions, options):
+    """
+    1ページを画像化してOCRし、{"regions": 抽出範囲ごとの表データ（行のリスト）のリスト, "confidence": 平均信頼度, "source": 抽出経路} を返す。
+    平均信頼度は単語単位の結果が得られる1回OCR方式（options["tesseract_single_pass"]）の場合のみ。
+    dpi はOCRに使った解像度（OCRを行わなかった場合は None）、native は埋め込み画像を直接OCRしたかどうか、
+    probed は適応解像度で文字の大きさを実際に調べて dpi を選んだかどうか。
+    ハイブリッド方式（options["tesseract_hybrid"]）では、デジタルPDFのページはテキストレイヤーから抽出し、
+    文字の無い範囲だけを画像化してOCRする。source は "text"（テキストレイヤーのみ）/ "ocr"（OCRのみ）/ "mixed"。
+    """
+    # 【改善】PDFページ自体にテキストデータが埋め込まれているか(デジタルPDFか)を自動判定
+    is_digital = bool(page_obj.get_text().strip())
+    
+    all_regions_data = [None] * max(1, len(crop_regions))
+    if options.get("tesseract_hybrid") and is_digital: all_regions_data = _text_layer_regions(page_obj, crop_regions, options)
+    ocr_targets = [idx for idx, region_data in enumerate(all_regions_data) if region_data is None]
+    confidence, dpi, native, probed = None, None, None, False
+    if ocr_targets:
+        # スキャンPDF（ページ全体が画像1枚）の場合は、埋め込み画像を元の解像度のまま取り出してOCRする（再描画しない）
+        if options.get("native_images", True) and not is_digital: native = native_page_image(page_obj, min_dpi=NATIVE_IMAGE_MIN_DPI)
+        if native:
+            dpi = int(round(native["dpi"]))
+            img_array, pix = native_page_array(page_obj, native, gray=True)
+        else:
+            # 【改善】DPIを300から400に引き上げ、Tesseractの認識精度を向上（文字が小さい表などに効果絶大）
+            # 適応解像度の場合は、OCRする範囲の文字の大きさから、認識精度を保てる最小の解像度を選ぶ
+            dpi = TESSERACT_DPI
+            if options.get("tesseract_adaptive_dpi"):
+                dpi = choose_ocr_dpi(_estimate_glyph_height_pt(page_obj, [crop_regions[idx] for idx in ocr_targets] if crop_regions else [], is_digital))
+                probed = True
+            # OCR・輪郭抽出はグレースケールで行うため、最初からグレースケールで描画する（色変換・複製を省く）
+            img_array, pix = render_page_cached(page_obj, dpi=dpi, gray=True)
+        
+        boxes = _ocr_region_boxes(img_array, [crop_regions[idx] for idx in ocr_targets] if crop_regions else [], options)
+        backend = options.get("tesseract_backend", "pytesseract")
+        if options.get("tesseract_single_pass"): ocr_data, confidence = _ocr_regions_single_pass(img_array, boxes, is_digital, backend, dpi)
+        else: ocr_data, confidence = _ocr_regions_separately(img_array, boxes, is_digital, bool(crop_regions), backend, dpi)
+        for idx, region_data in zip(ocr_targets, ocr_data): all_regions_data[idx] = region_data
+    source = "text" if not ocr_targets else "ocr" if len(ocr_targets) == len(all_regions_data) else "mixed"
+    return {"regions": all_regions_data, "confidence": confidence, "source": source, "dpi": dpi, "native": bool(native), "probed": probed}
+
+def _tesseract_page_rows(all_regions_data, page_num, total_pages, crop_regions, options):
+    """抽出範囲ごとのOCR結果を、ページ番号列付きの1ページ分の表データ（先頭行が見出し）にまとめる"""
+    header = ["ページ番号"] + ([f"範囲{idx+1}" for idx in range(len(all_regions_data))] if crop_regions else ["抽出テキスト"])
+    if options.get("extract_mode") == "text":
+        merged_row = []
+        for region_data in all_regions_data:
+            region_texts = []
+            for r in region_data:
+                for c in r:
+                    val = str(c).strip()
+                    if val and val != "Error": region_texts.append(val)
+            merged_row.append("\n".join(region_texts) if region_texts else "")
+        merged_data = [merged_row] if merged_row else [[""]]
+    else:
+        merged_data = merge_2d_arrays_horizontally(all_regions_data)
+    
+    final_data = [header]
+    for row in merged_data: final_data.append([f"{page_num+1}/{total_pages}"] + row)
+    return final_data
+
+def _tesseract_cache_key(digest, page_num, crop_regions, options, tesseract_version):
+    # 抽出範囲の拡張有無は出力形式・抽出モードで変わるため、それらもキーに含める
+    return ["tesseract", digest, page_num, crop_regions, options.get("extract_mode"), options.get("out_format", "xlsx") in ["xlsx", "csv"],
+            bool(options.get("tesseract_single_pass")), bool(options.get("tesseract_hybrid")), bool(options.get("tesseract_adaptive_dpi")), bool(options.get("native_images", True)), TESSERACT_DPI, TESSERACT_LANG, tesseract_version]
+
 def extract_tesseract_task(files, save_dir, options, ui):
     check_tesseract_installation()
+    backend = resolve_tesseract_backend(options.get("tesseract_backend", "pytesseract"))
     files = [f for f in files if f.lower().endswith(".pdf")]
     if not files: raise Exception("PDFが含まれていません。")
     out_format = options.get("out_format", "xlsx")
+    output = PageTableOutput(
+        save_dir, options.get("out_formats") or [out_format], options.get("output_grouping", "page"),
+        page_name=lambda base, page_num, total_pages: f"{base}_P{page_num}_OCR",
+        doc_suffix="_OCR", job_name=f"OCR結果_{time.strftime('%Y%m%d_%H%M%S')}", sheet_title="OCR")
+    cache = open_result_cache("tesseract", options)
+    stats = {"cached_pages": 0, "low_confidence_pages": [], "page_sources": collections.Counter(), "page_dpis": {}, "native_pages": 0}
+    try:
+        _extract_tesseract_files(files, options, ui, output, cache, stats, backend)
+    finally:
+        output.close()
+        if cache: cache.evict()
+    _report_cached_pages(ui, stats["cached_pages"])
+    _report_low_confidence_pages(ui, stats["low_confidence_pages"])
+    if options.get("tesseract_hybrid"): _report_page_sources(ui, stats["page_sources"])
+    if options.get("tesseract_adaptive_dpi"): _report_page_dpis(ui, stats["page_dpis"])
+    report_native_pages(ui, stats["native_pages"])
+
+# ワーカープロセス内で開いているPDF（同じファイルの連続したページでは開き直さない）
+_TESSERACT_WORKER_DOC = [None, None]
+
+def _tesseract_worker_init(tesseract_cmd, omp_thread_limit=None, render_cache=None):
+    """OCRワーカーの初期化（spawnで起動したプロセスにはメインプロセスの設定が引き継がれないため再設定する）"""
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    # 描画キャッシュの設定（ディスクへの保存を有効にしている場合、ワーカー間・次回の処理で描画結果を共有できる）
+    if render_cache: configure_render_cache(*render_cache)
+    # 複数プロセスで同時に実行する場合、Tesseract内部のスレッド並列がCPUを奪い合わないよう1スレッドに制限する
+    if omp_thread_limit: os.environ["OMP_THREAD_LIMIT"] = str(omp_thread_limit)
+
+def _tesseract_worker_document(pdf_path):
+    path, doc = _TESSERACT_WORKER_DOC
+    if path != pdf_path:
+        if doc is not None: doc.close()
+        doc = fitz.open(pdf_path)
+        _TESSERACT_WORKER_DOC[:] = [pdf_path, doc]
+    return doc
+
+def _close_tesseract_worker_document():
+    if _TESSERACT_WORKER_DOC[1] is not None: _TESSERACT_WORKER_DOC[1].close()
+    _TESSERACT_WORKER_DOC[:] = [None, None]
+
+def _tesseract_ocr_worker(pdf_path, page_num, crop_regions, options):
+    """1ページ分の描画・前処理・OCRを行うワーカー（プロセスプールから呼ばれるためモジュール直下に定義）"""
+    return _ocr_page_regions(_tesseract_worker_document(pdf_path)[page_num], crop_regions, options)
+
+def _extract_tesseract_files(files, options, ui, output, cache, stats, backend="pytesseract"):
     crop_regions = options.get("crop_regions", [])
-    
-    for i, f in enumerate(files, 1):
-        if ui.is_cancelled(): return
-        ui.update_overall(i, len(files), f"全体進捗 ( {i} / {len(files)} )")
-        base = os.path.splitext(os.path.basename(f))[0]
-        doc = fitz.open(f)
-        total_pages = len(doc)
+    workers = resolve_worker_count(options.get("tesseract_workers", 1))
+    # ワーカーに渡すのはOCR結果に影響する設定のみ（プロセス間の受け渡しを軽くする）
+    ocr_options = {"out_format": options.get("out_format", "xlsx"), "extract_mode": options.get("extract_mode"), "tesseract_single_pass": options.get("tesseract_single_pass", False),
+                   "tesseract_hybrid": options.get("tesseract_hybrid", False),
+                   "tesseract_adaptive_dpi": options.get("tesseract_adaptive_dpi", False),
+                   "native_images": options.get("native_images", True),
+                   "tesseract_backend": backend}
+    # バックエンドによって認識結果が異なる場合があるため、バージョン文字列（バックエンド名を含む）をキャッシュのキーに使う
+    tesseract_version = tesseract_engine_version(backend) if cache else None
+
+    # 全ファイルのページを1つの並びにし、キャッシュに無いページだけをワーカーに割り振る
+    pages = []
+    for f in files:
+        with fitz.open(f) as doc: total_pages = len(doc)
+        digest = file_digest(f) if cache else None
         for page_num in range(total_pages):
+            key = _tesseract_cache_key(digest, page_num, crop_regions, options, tesseract_version) if cache else None
+            pages.append((f, page_num, total_pages, key, bool(cache) and cache.contains(key)))
+    jobs = [(f, page_num, crop_regions, ocr_options) for f, page_num, _, _, hit in pages if not hit]
+    parallel = workers > 1 and len(jobs) > 1
+    results = iter_parallel_ordered(_tesseract_ocr_worker, jobs, workers, ui,
+                                    initializer=_tesseract_worker_init, initargs=(pytesseract.pytesseract.tesseract_cmd, 1 if parallel else None,
+                                              (options.get("render_cache_mb", 256), options.get("render_cache_spill", False), options.get("cache_max_mb", 1024))))
+    try:
+        current_file, file_no, done = None, 0, 0
+        for f, page_num, total_pages, key, hit in pages:
             if ui.is_cancelled(): return
-            ui.set_indeterminate(f"OCR解析中... ({page_num+1}/{total_pages}ページ)")
-            
-            # 【改善】PDFページ自体にテキストデータが埋め込まれているか(デジタルPDFか)を自動判定
-            page_obj = doc[page_num]
-            is_digital = bool(page_obj.get_text().strip())
-            
-            # 【改善】DPIを300から400に引き上げ、Tesseractの認識精度を向上（文字が小さい表などに効果絶大）
-            pix = page_obj.get_pixmap(dpi=400)
-            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-            if pix.n == 4: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-            elif pix.n == 1: img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-            
-            cropped_images = []
-            if crop_regions:
-                h_img, w_img = img_array.shape[:2]
-                for region in crop_regions:
-                    rx1, ry1, rx2, ry2 = region[:4]
-                    is_vert = region[4] if len(region) > 4 else False
-                    is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
-                    # 水平線モード、垂直線モード、またはテキスト抽出モードの場合は範囲拡張
-                    if out_format not in ["xlsx", "csv"] or is_line or options.get("extract_mode") == "text":
-                        x1, y1, x2, y2 = expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2)
-                    else:
-                        x1, y1 = int(min(rx1, rx2) * w_img), int(min(ry1, ry2) * h_img)
-                        x2, y2 = int(max(rx1, rx2) * w_img), int(max(ry1, ry2) * h_img)
-                    cropped_images.append(img_array[y1:y2, x1:x2])
-            else: cropped_images.append(img_array)
-                
-            all_regions_data = []
-            for crop_img in cropped_images:
-                try:
-                    # デジタルかスキャンかを渡して、最適な前処理を適用する
-                    processed_img = preprocess_image_for_ocr(crop_img, is_digital)
-                    
-                    # 【改善】範囲指定抽出(セル単位等)の場合は PSM 6 (均一なテキストブロック)、ページ全体の場合は PSM 3 を使用
-                    psm_val = 6 if crop_regions else 3
-                    custom_config = f'--oem 3 --psm {psm_val}'
-                    
-                    text = normalize_text(pytesseract.image_to_string(Image.fromarray(processed_img), lang="jpn+jpn_vert+eng", config=custom_config))
-                    
-                    lines = [l.strip() for l in text.split('\n') if l.strip()]
-                    if lines: all_regions_data.append([[l] for l in lines])
-                    else: all_regions_data.append([[""]])
-                except Exception: all_regions_data.append([["Error"]])
-                    
-            if options.get("extract_mode") == "text":
-                merged_row = []
-                for region_data in all_regions_data:
-                    region_texts = []
-                    for r in region_data:
-                        for c in r:
-                            val = str(c).strip()
-                            if val and val != "Error": region_texts.append(val)
-                    merged_row.append("\n".join(region_texts) if region_texts else "")
-                merged_data = [merged_row] if merged_row else [[""]]
-                final_data = [["ページ番号"] + ([f"範囲{idx+1}" for idx in range(len(cropped_images))] if crop_regions else ["抽出テキスト"])]
+            if f != current_file:
+                current_file, file_no = f, file_no + 1
+                ui.update_overall(file_no, len(files), f"全体進捗 ( {file_no} / {len(files)} )")
+            result = cache.get(key) if hit else None
+            from_cache = result is not None
+            if from_cache:
+                stats["cached_pages"] += 1
             else:
-                merged_data = merge_2d_arrays_horizontally(all_regions_data)
-                final_data = [["ページ番号"] + ([f"範囲{idx+1}" for idx in range(len(cropped_images))] if crop_regions else ["抽出テキスト"])]
-            
-            for row in merged_data: final_data.append([f"{page_num+1}/{total_pages}"] + row)
-            
-            save_path = os.path.join(save_dir, f"{base}_P{page_num+1}_OCR")
-            if out_format == "xlsx":
-                wb = Workbook(); ws = wb.active; ws.title = "OCR"
-                for r_idx, r_data in enumerate(final_data, 1):
-                    for c_idx, val in enumerate(r_data, 1): ws.cell(row=r_idx, column=c_idx, value=sanitize_excel_text(val))
-                auto_adjust_excel_column_width(ws); wb.save(f"{save_path}.xlsx")
-            elif out_format == "csv":
-                with open(f"{save_path}.csv", "w", encoding="utf-8-sig", newline="") as f_out: csv.writer(f_out).writerows(final_data)
-            elif out_format == "txt":
-                with open(f"{save_path}.txt", "w", encoding="utf-8") as f_out:
-                    for r in final_data: f_out.write("\t".join(r) + "\n")
-        doc.close(); gc.collect()
+                if parallel: ui.set_determinate(done, len(jobs), f"OCR解析中... ( {done} / {len(jobs)} ページ完了 ・ {workers}プロセス並列 )")
+                else: ui.set_indeterminate(f"OCR解析中... ({page_num+1}/{total_pages}ページ)")
+                # キャッシュが読めなかったページ（途中で削除された等）は、その場でOCRする
+                result = next(results, None) if not hit else _tesseract_ocr_worker(f, page_num, crop_regions, ocr_options)
+                if result is None: return
+                if not hit: done += 1
+                # 一時的な失敗（Error）を含むページは次回も処理し直すため保存しない
+                if cache and not any(region == [["Error"]] for region in result["regions"]): cache.set(key, result)
+            stats["page_sources"][result["source"]] += 1
+            if result["native"]: stats["native_pages"] += 1
+            # 解像度の内訳は、今回実際に文字の大きさを調べたページだけを数える（キャッシュから返したページ・埋め込み画像をOCRしたページは除く）
+            if result.get("probed") and not from_cache: stats["page_dpis"].setdefault(result["dpi"], []).append(f"{os.path.basename(f)} P{page_num + 1}")
+            if result["confidence"] is not None and result["confidence"] < LOW_CONFIDENCE_THRESHOLD:
+                stats["low_confidence_pages"].append((os.path.basename(f), page_num + 1, result["confidence"]))
+            output.write_page(f, page_num + 1, total_pages, _tesseract_page_rows(result["regions"], page_num, total_pages, crop_regions, options))
+    finally:
+        results.close()
+        _close_tesseract_worker_document(); gc.collect()
 
 # ==============================
 # データ集約タスク (ローカル)
@@ -786,10 +1537,9 @@ def aggregate_local_task(files, save_dir, options, ui):
         apply_text_inheritance(final_data)
         
         if search_ext == "xlsx":
-            wb = Workbook(); ws = wb.active; ws.title = "集約"
-            for r_idx, r_data in enumerate(final_data, 1):
-                for c_idx, val in enumerate(r_data, 1): ws.cell(row=r_idx, column=c_idx, value=sanitize_excel_text(val))
-            auto_adjust_excel_column_width(ws); wb.save(os.path.join(save_dir, f"データ集約_{run_timestamp}.xlsx"))
+            with ExcelStreamWriter(os.path.join(save_dir, f"データ集約_{run_timestamp}.xlsx")) as writer:
+                writer.add_sheet("集約")
+                writer.write_rows(final_data)
         elif search_ext == "csv":
             with open(os.path.join(save_dir, f"データ集約_{run_timestamp}.csv"), "w", encoding="utf-8-sig", newline="") as f_out:
                 csv.writer(f_out).writerows(final_data)
@@ -849,10 +1599,9 @@ def combine_local_task(files, save_dir, options, ui):
         
     if save_dir:
         if search_ext == "xlsx":
-            wb = Workbook(); ws = wb.active; ws.title = "単純結合"
-            for r_idx, r_data in enumerate(combined_rows, 1):
-                for c_idx, val in enumerate(r_data, 1): ws.cell(row=r_idx, column=c_idx, value=sanitize_excel_text(val))
-            auto_adjust_excel_column_width(ws); wb.save(os.path.join(save_dir, f"データ結合_{run_timestamp}.xlsx"))
+            with ExcelStreamWriter(os.path.join(save_dir, f"データ結合_{run_timestamp}.xlsx")) as writer:
+                writer.add_sheet("単純結合")
+                writer.write_rows(combined_rows)
         elif search_ext == "csv":
             with open(os.path.join(save_dir, f"データ結合_{run_timestamp}.csv"), "w", encoding="utf-8-sig", newline="") as f_out:
                 csv.writer(f_out).writerows(combined_rows)
\ No newline at end of file
@@ -1,26 +1,332 @@
 # -*- coding: utf-8 -*-
-import os, sys, cv2, csv, time, json, random, gc, re
-import threading
+import os, sys, time, json, random, gc, re, math, hashlib
+import threading, asyncio, queue
+import collections
 import concurrent.futures
 import numpy as np
 import fitz
-from openpyxl import Workbook
 from PIL import Image
 import google.generativeai as genai
 
-try:
-    from docx import Document
-except ImportError:
-    Document = None
-
 from common import (
-    auto_adjust_excel_column_width,
+    normalize_text,
     parse_row_data,
-    merge_2d_arrays_horizontally,
-    sanitize_excel_text
+    merge_2d_arrays_horizontally
 )
+from writers import PageTableOutput, PageJournal
+
+from engines import expand_crop_rect_for_intersecting_objects, find_object_boxes, report_native_pages, resolve_worker_count
+from rendering import render_page_cached, native_page_image, native_page_array
+from caches import open_result_cache, file_digest
+
+# ==============================
+# APIリクエストの流量制御
+# ==============================
+class RateScheduler:
+    """
+    1分あたりのリクエスト数（RPM）とトークン数（TPM）をトークンバケットで管理し、送信枠を要求順（先着順）に割り当てる。
+    待機は条件変数で行い、次の枠が空く時刻まで眠る（キャンセル確認のため最長0.5秒ごとに起きる）。
+    RPMのバケットは burst 件までまとめて送信でき、それ以降は 60/RPM 秒ごとに枠が補充される（既定の burst=1 では一定間隔で1件ずつ送信する）。
+    TPMは送信前に見積もったトークン数を確保し、応答後に実際の使用量で精算する（tpm=0 の場合は制限しない）。
+    """
+    def __init__(self, rpm, tpm=0, burst=1):
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._next_ticket = 0
+        self._updated = time.monotonic()
+        self.rpm, self.tpm, self.burst = 1, 0, 1
+        self._requests, self._tokens = 0.0, 0.0
+        self.configure(rpm, tpm, burst)
+        self._requests, self._tokens = float(self.burst), float(self.tpm)
+
+    def configure(self, rpm, tpm=0, burst=1):
+        """制限値を変更する（それまでの消費状況は引き継ぐ）"""
+        with self._cond:
+            self._refill(time.monotonic())
+            self.rpm, self.tpm = max(1, int(rpm)), max(0, int(tpm or 0))
+            self.burst = max(1, int(burst))
+            self._requests = min(self._requests, float(self.burst))
+            self._tokens = min(self._tokens, float(self.tpm))
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        elapsed, self._updated = now - self._updated, now
+        self._requests = min(float(self.burst), self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm: self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60.0)
+
+    def _wait_time(self, est_tokens):
+        wait = (1.0 - self._requests) * 60.0 / self.rpm
+        if self.tpm: wait = max(wait, (est_tokens - self._tokens) * 60.0 / self.tpm)
+        return wait
+
+    def acquire(self, est_tokens=0, should_abort=None, on_wait=None):
+        """
+        送信枠を1つ確保する（確保できた場合は True）。should_abort() が真になった場合は確保せずに False を返す。
+        on_wait(待機秒数) は、順番が来たが枠の補充を待つ場合に、待機時間の表示用に呼ばれる。
+        """
+        # 1回のリクエストがTPMの上限を超える見積もりでも、永久に待たないよう上限で打ち切る
+        est_tokens = min(est_tokens, self.tpm) if self.tpm else 0
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._queue.append(ticket)
+            try:
+                notified_wait = False
+                while True:
+                    if should_abort and should_abort(): return False
+                    self._refill(time.monotonic())
+                    wait = 0.5
+                    if self._queue[0] == ticket:
+                        wait = self._wait_time(est_tokens)
+                        if wait <= 0:
+                            self._requests -= 1.0
+                            self._tokens -= est_tokens
+                            return True
+                        if on_wait and not notified_wait and wait > 2.0:
+                            on_wait(wait); notified_wait = True
+                    self._cond.wait(timeout=min(wait, 0.5))
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    async def acquire_async(self, est_tokens=0, should_abort=None, on_wait=None):
+        """
+        acquire() の asyncio 版。条件変数では待たず、イベントループ上で眠って順番と枠の補充を待つ。
+        先頭の要求は枠が補充される時刻まで、それ以外は短い間隔で順番が来たかを確認する（スレッド版の要求とも同じ順番を共有する）。
+        """
+        est_tokens = min(est_tokens, self.tpm) if self.tpm else 0
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._queue.append(ticket)
+        try:
+            notified_wait = False
+            while True:
+                if should_abort and should_abort(): return False
+                with self._cond:
+                    self._refill(time.monotonic())
+                    wait = 0.1
+                    if self._queue[0] == ticket:
+                        wait = self._wait_time(est_tokens)
+                        if wait <= 0:
+                            self._requests -= 1.0
+                            self._tokens -= est_tokens
+                            return True
+                        if on_wait and not notified_wait and wait > 2.0:
+                            on_wait(wait); notified_wait = True
+                await asyncio.sleep(min(wait, 0.5))
+        finally:
+            with self._cond:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def settle(self, est_tokens, actual_tokens):
+        """確保時の見積もりトークン数を、実際の使用量で精算する"""
+        if not self.tpm: return
+        with self._cond:
+            self._tokens -= (actual_tokens - min(est_tokens, self.tpm))
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """API側から待機を要求された場合に、全ての送信を指定秒数止める"""
+        with self._cond:
+            self._refill(time.monotonic())
+            self._requests = min(self._requests, 1.0 - seconds * self.rpm / 60.0)
+
+# APIキー（のハッシュ）とモデルごとのスケジューラ。続けて実行した処理の間でも、直前の送信状況を引き継いで流量を守る
+_RATE_SCHEDULERS = {}
+_RATE_SCHEDULERS_LOCK = threading.Lock()
+
+# モデルごとの利用枠 (RPM, TPM)。プラン（無料枠 / 有料 Tier 1）ごとの公開値で、モデル名の前方一致（最も長いもの）で引く。
+# 設定値が 0（自動）の場合の既定値としてのみ使い、上位の Tier などで枠が大きい場合は設定値で引き上げられる
+MODEL_RATE_LIMITS = {
+    "free": {
+        "gemini-2.5-pro": (5, 250000), "gemini-2.5-flash": (10, 250000), "gemini-2.5-flash-lite": (15, 250000),
+        "gemini-2.0-flash": (15, 1000000), "gemini-2.0-flash-lite": (30, 1000000),
+    },
+    "paid": {
+        "gemini-2.5-pro": (150, 2000000), "gemini-2.5-flash": (1000, 1000000), "gemini-2.5-flash-lite": (4000, 4000000),
+        "gemini-2.0-flash": (2000, 4000000), "gemini-2.0-flash-lite": (4000, 4000000),
+    },
+}
+
+def model_rate_limits(model_name, plan, rpm=0, tpm=0):
+    """
+    モデルに適用する (RPM, TPM) を返す。0 以外の設定値はそのまま使い、0（自動）の場合はモデルごとの利用枠の表の値を使う。
+    表に無いモデルでは、RPM の自動は 1 RPM、TPM の自動は制限なし（0）とする。
+    """
+    name = model_name.split("/")[-1]
+    matches = [m for m in MODEL_RATE_LIMITS.get(plan, {}) if name.startswith(m)]
+    model_rpm, model_tpm = MODEL_RATE_LIMITS[plan][max(matches, key=len)] if matches else (1, 0)
+    return (rpm if rpm > 0 else model_rpm), (tpm if tpm > 0 else model_tpm)
+
+def get_rate_scheduler(api_key, model_name, rpm, tpm=0, plan="free"):
+    """APIキー・モデルごとのスケジューラを返す（制限値は model_rate_limits でモデルごとに決める）"""
+    rpm, tpm = model_rate_limits(model_name, plan, rpm, tpm)
+    key = (hashlib.sha256(api_key.encode("utf-8")).hexdigest(), model_name)
+    with _RATE_SCHEDULERS_LOCK:
+        scheduler = _RATE_SCHEDULERS.get(key)
+        if scheduler is None: scheduler = _RATE_SCHEDULERS[key] = RateScheduler(rpm, tpm)
+        else: scheduler.configure(rpm, tpm)
+    return scheduler
+
+def estimate_request_tokens(image_size, prompt, max_tokens):
+    """
+    1リクエストの入出力トークン数を見積もる（TPMの事前確保用。応答後に実際の使用量で精算する）。
+    画像は 384px 以下なら258トークン、それより大きい場合は 768px 四方のタイルごとに258トークンとして数える。
+    """
+    w, h = image_size
+    image_tokens = 258 if max(w, h) <= 384 else 258 * math.ceil(w / 768) * math.ceil(h / 768)
+    return image_tokens + len(prompt) // 2 + min(max_tokens, 2048)
+
+# ==============================
+# APIの応答キャッシュ
+# ==============================
+def _gemini_image_digest(image_part, image):
+    """送信する画像（元のJPEGデータ、またはPIL画像の画素）のSHA-256を返す。応答キャッシュのキーに使う"""
+    h = hashlib.sha256()
+    if image_part is not None:
+        h.update(image_part["mime_type"].encode("ascii")); h.update(image_part["data"])
+    else:
+        h.update(f"{image.mode}:{image.width}x{image.height}".encode("ascii")); h.update(image.tobytes())
+    return h.hexdigest()
+
+# ==============================
+# 中断したジョブの再開
+# ==============================
+# 出力先フォルダに保存する、完了済みページの記録のファイル名
+GEMINI_JOURNAL_NAME = "AI抽出_再開用記録.jsonl"
+
+def _report_resumed_pages(ui, resumed_pages):
+    if resumed_pages:
+        ui.add_report(f"前回中断した処理の記録から、完了済みの {resumed_pages:,} ページを飛ばして続きから再開しました。")
+
+def _report_unrecorded_pages(ui, tasks):
+    if not tasks: return
+    lines = [f"・{os.path.basename(task['file_path'])} P{task['page_num'] + 1}" for task in tasks[:30]]
+    if len(tasks) > 30: lines.append(f"・ほか {len(tasks) - 30} ページ")
+    ui.add_report(f"以下のページは抽出に失敗したため、再開用の記録（{GEMINI_JOURNAL_NAME}）を残しました。\n"
+                  "同じ設定で再実行すると、これらのページのみを再処理します。\n" + "\n".join(lines))
+
+def _report_blank_pages(ui, blank_pages):
+    if blank_pages:
+        ui.add_report(f"{blank_pages:,} ページはAIの応答に文字が含まれていなかったため、空欄として出力しました。")
+
+def _report_cached_responses(ui, cached_pages):
+    if cached_pages:
+        ui.add_report(f"前回のAI応答キャッシュを利用し、{cached_pages:,} ページのAPIリクエストを省略しました（利用枠・料金は消費していません）。")
+
+# ==============================
+# ページ処理のパイプライン
+# ==============================
+_STOP = object()  # 各段のスレッドに終了を伝える目印
+# 描画スレッド数の上限（スレッドごとにPDFを開くため、CPUコア数に比例させず少数に抑える）
+PIPELINE_MAX_RENDER_WORKERS = 4
+
+class StagePipeline:
+    """
+    ページの処理を「描画 → 送信 → パース・書き込み」の3段に分け、段ごとに別のスレッドで動かして上限付きのキューでつなぐ。
+    描画スレッドは送信中のリクエストと並行して次のページを準備し（送信待ちのキューが一杯になるまで先読み）、
+    書き込みは1つのスレッドで順に行うため、送信用のスレッドはCPU処理で送信枠を遊ばせない。
+    needs_send(job) が偽のもの（キャッシュにあった等）は送信の段を飛ばして書き込みの段へ送る。
+    各段のいずれかで例外が起きた場合、または should_abort() が真になった場合は全ての段を止める（例外は run() が送出する）。
+    """
+    def __init__(self, render, send, write, needs_send, render_workers, send_workers, prefetch, write_depth, should_abort):
+        self.render, self.send, self.write, self.needs_send = render, send, write, needs_send
+        self.render_workers, self.send_workers = max(1, render_workers), max(1, send_workers)
+        self.should_abort = should_abort
+        self.send_q = queue.Queue(maxsize=max(1, prefetch))
+        self.write_q = queue.Queue(maxsize=max(1, write_depth))
+        self.max_depths = {"send": 0, "write": 0}
+        self.error = None
+        self._lock = threading.Lock()
+
+    def depths(self):
+        """各段の待ち行列の {段: (現在の長さ, 上限)}（send: 描画済みで送信待ち、write: 送信済みで書き込み待ち）"""
+        return {"send": (self.send_q.qsize(), self.send_q.maxsize), "write": (self.write_q.qsize(), self.write_q.maxsize)}
+
+    def aborted(self):
+        """いずれかの段で例外が起きたか、should_abort() が真になったか（各段の処理の中で長く待つ場合にも確認する）"""
+        return self.error is not None or self.should_abort()
+
+    def _put(self, stage, item):
+        # 中断した場合は後段のスレッドも自分で止まるため、キューの空きを待たずに諦める
+        q = self.send_q if stage == "send" else self.write_q
+        while not self.aborted():
+            try: q.put(item, timeout=0.2)
+            except queue.Full: continue
+            if item is not _STOP:
+                with self._lock: self.max_depths[stage] = max(self.max_depths[stage], q.qsize())
+            return True
+        return False
+
+    def _get(self, q):
+        while True:
+            try: return q.get(timeout=0.2)
+            except queue.Empty:
+                if self.aborted(): return _STOP
+
+    def _guard(self, func):
+        def run_stage():
+            try: func()
+            except Exception as e:
+                with self._lock:
+                    if self.error is None: self.error = e
+        return run_stage
+
+    def run(self, items):
+        items = iter(items)
+        remaining = {"render": self.render_workers, "send": self.send_workers}
+
+        def finish_stage(stage):
+            # 段の最後のスレッドが終わったら、次の段のスレッドに終了を伝える
+            with self._lock:
+                remaining[stage] -= 1
+                last = remaining[stage] == 0
+            if not last: return
+            if stage == "render":
+                for _ in range(self.send_workers): self._put("send", _STOP)
+            else:
+                self._put("write", _STOP)
+
+        def render_loop():
+            try:
+                while not self.aborted():
+                    with self._lock: item = next(items, _STOP)
+                    if item is _STOP: return
+                    job = self.render(item)
+                    if job is None: continue
+                    if not self._put("send" if self.needs_send(job) else "write", job): return
+            finally:
+                finish_stage("render")
 
-from engines import expand_crop_rect_for_intersecting_objects
+        def send_loop():
+            try:
+                while True:
+                    job = self._get(self.send_q)
+                    if job is _STOP or self.aborted(): return
+                    if not self.send(job): return
+                    if not self._put("write", job): return
+            finally:
+                finish_stage("send")
+
+        def write_loop():
+            while True:
+                job = self._get(self.write_q)
+                if job is _STOP or self.aborted(): return
+                self.write(job)
+
+        threads = [threading.Thread(target=self._guard(render_loop), daemon=True) for _ in range(self.render_workers)]
+        threads += [threading.Thread(target=self._guard(send_loop), daemon=True) for _ in range(self.send_workers)]
+        threads.append(threading.Thread(target=self._guard(write_loop), daemon=True))
+        for th in threads: th.start()
+        for th in threads: th.join()
+        if self.error is not None: raise self.error
+
+def _report_pipeline_depths(ui, pipeline):
+    send_max, write_max = pipeline.max_depths["send"], pipeline.max_depths["write"]
+    ui.add_report(f"パイプラインの待ち行列（最大の長さ / 上限）: 送信待ち {send_max} / {pipeline.send_q.maxsize}、書き込み待ち {write_max} / {pipeline.write_q.maxsize}\n"
+                  "※送信待ちが常に0に近い場合は描画が追いついていません（先読み数・描画スレッド数を増やすと改善します）")
 
 # ==============================
 # Gemini API データ抽出タスク
@@ -129,15 +435,16 @@ def extract_gemini_task(files, save_dir, options, ui):
             {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}
         ]
 
-    MAX_RPM = api_rpm if api_rpm > 0 else 1
     max_workers = max(1, threads_setting)
 
     # グローバルな状態管理
-    request_timestamps = []
-    rate_limit_lock = threading.Lock()
+    # 送信枠はAPIキー・モデルごとのスケジューラで管理する（直前に実行した処理の送信状況も引き継ぐ）
+    schedulers = {m: get_rate_scheduler(api_key, m, api_rpm, options.get("api_tpm", 0), api_plan) for m in models_to_try}
     progress_lock = threading.Lock()
     completed_pages = 0
-    shared_context = {"fatal_error": None}
+    shared_context = {"fatal_error": None, "native_pages": 0, "cached_pages": 0, "resumed_pages": 0, "blank_pages": 0, "pipeline": None}
+    # 同じ画像・プロンプト・モデル・生成設定の応答を再利用し、再実行時の再送信（再課金）を避ける
+    response_cache = open_result_cache("gemini", options)
 
     # 全ファイル・全ページのタスクリストを事前に作成
     page_tasks = []
@@ -148,11 +455,15 @@ def extract_gemini_task(files, save_dir, options, ui):
             doc = fitz.open(f)
             total_pages = len(doc)
             doc.close()
+            # ファイル内容のハッシュ（再開用の記録の照合に使う。名前や場所が変わっても同じPDFとして扱う）
+            digest = file_digest(f) if options.get("gemini_resume", True) else None
             for page_num in range(total_pages):
                 page_tasks.append({
+                    "seq": len(page_tasks),
                     "file_path": f,
                     "page_num": page_num,
-                    "total_pages": total_pages
+                    "total_pages": total_pages,
+                    "digest": digest
                 })
         except Exception as e:
             print(f"Failed to scan {f}: {e}")
@@ -164,410 +475,576 @@ def extract_gemini_task(files, save_dir, options, ui):
         
     ui.update_overall(0, total_tasks, f"全体の進捗 ( 0 / {total_tasks} ページ完了 )")
 
-    def process_single_page_task(task_info):
-        """1ページ分の全領域を1回のAPIリクエストで処理するタスク"""
-        if shared_context["fatal_error"]: return
-        if ui.is_cancelled(): return
-        
+    # APIのモデルはモデルごとに1回だけ作成し、全てのページ・再試行で使い回す
+    models = {m: genai.GenerativeModel(m) for m in models_to_try}
+    should_abort = lambda: ui.is_cancelled() or bool(shared_context["fatal_error"])
+    show_wait = lambda sec: ui.set_indeterminate(f"通信間隔調整中... (約 {int(sec)}秒待機)")
+    MAX_RETRIES = 8
+
+    def prepare_page(task_info):
+        """
+        1ページ分の送信内容（全領域を1枚に結合・縮小した画像）を準備し、応答キャッシュを確認する。
+        戻り値の job を request_page（キャッシュにあった場合は不要）→ finish_page の順に渡す。
+        """
         f_path = task_info["file_path"]
         page_num = task_info["page_num"]
-        total_p = task_info["total_pages"]
-        base = os.path.splitext(os.path.basename(f_path))[0]
-        digits = max(2, len(str(total_p)))
-        
-        try:
-            # 1. ページ画像の抽出
-            doc = fitz.open(f_path)
-            pix = doc[page_num].get_pixmap(dpi=300)
-            doc.close()
-            
-            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-            if pix.n == 4: img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-            elif pix.n == 1: img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
 
-            # 複数の領域を1つの画像に結合するロジック
-            combined_img = None
-            cropped_info = [] # 結合後のパース用メタデータ
-            
-            if crop_regions:
-                h_img, w_img = img_array.shape[:2]
-                cropped_images = []
-                for region in crop_regions:
-                    rx1, ry1, rx2, ry2 = region[:4]
-                    is_vert = region[4] if len(region) > 4 else False
-                    is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
-                    
-                    if not is_table_format or is_line:
-                        x1, y1, x2, y2 = expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2)
-                    else:
-                        x1, y1 = int(min(rx1, rx2) * w_img), int(min(ry1, ry2) * h_img)
-                        x2, y2 = int(max(rx1, rx2) * w_img), int(max(ry1, ry2) * h_img)
-                        
-                    crop = img_array[y1:y2, x1:x2]
-                    cropped_images.append(crop)
-                    cropped_info.append(crop.shape)
+        # 1. ページ画像の抽出
+        max_size = 2048
+        image_part = None # 埋め込みJPEGをそのまま送信する場合のデータ
+        doc = fitz.open(f_path)
+        page = doc[page_num]
+        # スキャンPDF（ページ全体が画像1枚）の場合は、ページを再描画せずに埋め込み画像を元の解像度で使う
+        native = native_page_image(page) if options.get("native_images", True) else None
+        if native and native["jpeg"] and not crop_regions and max(native["width"], native["height"]) <= max_size:
+            # 切り出し・縮小が不要なJPEGは、デコード・再エンコードせず元のデータをそのまま送信する
+            image_part = {"mime_type": "image/jpeg", "data": native["jpeg"]}
+        elif native:
+            img_array, pix = native_page_array(page, native)
+        else:
+            # アルファ無しのRGBで直接描画し、画素データは複製せずに参照する（Pixmap は文書を閉じた後も有効）
+            img_array, pix = render_page_cached(page, dpi=300)
+        doc.close()
+        if native:
+            with progress_lock: shared_context["native_pages"] += 1
+
+        # 複数の領域を1つの画像に結合するロジック
+        combined_img = None
+        cropped_info = [] # 結合後のパース用メタデータ
+        
+        if image_part is not None:
+            cropped_info = [(native["height"], native["width"], 3)]
+        elif crop_regions:
+            h_img, w_img = img_array.shape[:2]
+            cropped_images = []
+            object_boxes = None # 輪郭の外接矩形（ページごとに1回だけ抽出し、全ての範囲で共有する）
+            for region in crop_regions:
+                rx1, ry1, rx2, ry2 = region[:4]
+                is_vert = region[4] if len(region) > 4 else False
+                is_line = is_vert or abs(ry2 - ry1) < 0.03 or abs(rx2 - rx1) < 0.03
                 
-                # 画像を縦に連結（間に少しの余白を入れる）
-                if cropped_images:
-                    max_w = max(img.shape[1] for img in cropped_images)
-                    total_h = sum(img.shape[0] for img in cropped_images) + (len(cropped_images) - 1) * 20
-                    
-                    combined_array = np.full((total_h, max_w, 3), 255, dtype=np.uint8) # 白背景
+                if not is_table_format or is_line:
+                    if object_boxes is None: object_boxes = find_object_boxes(img_array)
+                    x1, y1, x2, y2 = expand_crop_rect_for_intersecting_objects(img_array, rx1, ry1, rx2, ry2, object_boxes)
+                else:
+                    x1, y1 = int(min(rx1, rx2) * w_img), int(min(ry1, ry2) * h_img)
+                    x2, y2 = int(max(rx1, rx2) * w_img), int(max(ry1, ry2) * h_img)
                     
-                    current_y = 0
-                    for img in cropped_images:
-                        h_crop, w_crop = img.shape[:2]
-                        combined_array[current_y:current_y+h_crop, 0:w_crop] = img
-                        current_y += h_crop + 20
-                        
-                    combined_img = Image.fromarray(combined_array)
-            else:
-                combined_img = Image.fromarray(img_array)
-                cropped_info = [img_array.shape]
+                crop = img_array[y1:y2, x1:x2]
+                cropped_images.append(crop)
+                cropped_info.append(crop.shape)
             
-            # 画像リサイズ処理
-            max_size = 2048
-            if max(combined_img.width, combined_img.height) > max_size:
-                ratio = max_size / max(combined_img.width, combined_img.height)
-                new_size = (int(combined_img.width * ratio), int(combined_img.height * ratio))
-                combined_img = combined_img.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # 2. 1ページにつき1回のAPIリクエスト
-            max_retries = 8
-            extracted_text, success, last_error = "", False, ""
-            
-            for attempt in range(max_retries):
-                if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
-                if ui.is_cancelled(): return
-                required_sleep = 0.0
-                is_fatal_quota = False
-                
-                for model_name in models_to_try:
-                    if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
-                    if ui.is_cancelled(): return
-                    total_wait = 0.0
-                    
-                    with rate_limit_lock:
-                        now = time.time()
-                        nonlocal request_timestamps
-                        request_timestamps = [t for t in request_timestamps if now - t < 60.0]
-                        min_interval = 1.5
-                        
-                        if len(request_timestamps) >= MAX_RPM:
-                            expected_run_time = request_timestamps[0] + 60.0
-                            total_wait = expected_run_time - now
-                        else:
-                            if request_timestamps:
-                                last_planned_time = request_timestamps[-1]
-                                if now < last_planned_time + min_interval:
-                                    expected_run_time = last_planned_time + min_interval
-                                    total_wait = expected_run_time - now
-                                else:
-                                    expected_run_time = now
-                                    total_wait = 0.0
-                            else:
-                                expected_run_time = now
-                                total_wait = 0.0
-                        request_timestamps.append(expected_run_time)
-
-                    if total_wait > 0:
-                        if total_wait > 2.0:
-                            ui.set_indeterminate(f"通信間隔調整中... (約 {int(total_wait)}秒待機)")
-                        wait_step = 0.5
-                        while total_wait > 0:
-                            if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
-                            if ui.is_cancelled(): return
-                            time.sleep(min(wait_step, total_wait))
-                            total_wait -= wait_step
-                            
-                    ui.set_indeterminate(f"AI解析中... ( P.{page_num+1} )")
-                    
-                    try:
-                        model = genai.GenerativeModel(model_name)
-                        contents = [prompt, combined_img]
-                        if generation_config:
-                            response = model.generate_content(contents, generation_config=generation_config, safety_settings=safety_settings)
-                        else:
-                            response = model.generate_content(contents, safety_settings=safety_settings)
-                            
-                        if not response.parts: raise Exception("安全フィルタ等によりブロックされました。")
-                        extracted_text = normalize_text(response.text.strip())
-                        success = True
-                        break
-                    except Exception as api_err: 
-                        err_str = str(api_err)
-                        last_error = err_str
-                        if "429" in err_str or "Quota" in err_str:
-                            m = re.search(r'retry in ([\d\.]+)s', err_str, re.IGNORECASE | re.DOTALL)
-                            if not m: m = re.search(r'seconds:\s*(\d+)', err_str, re.IGNORECASE | re.DOTALL)
-                            if m:
-                                wait_sec = float(m.group(1))
-                                if wait_sec > 15.0:  # 長い待機時間を要求された場合は即座に打ち切る
-                                    msg = f"APIの利用枠（バースト制限）を超過しました（約{int(wait_sec)}秒の待機を要求されました）。\n処理全体を即時中断します。しばらく時間をおいてから再試行してください。"
-                                    shared_context["fatal_error"] = msg
-                                    raise Exception(msg)
-                                required_sleep = wait_sec + 2.0 
-                            else:
-                                if "per day" in err_str.lower() or "perday" in err_str.lower():
-                                    msg = "1日のAPI利用上限に到達しました。\n無料枠の場合は明日以降に再度お試しください。"
-                                    shared_context["fatal_error"] = msg
-                                    raise Exception(msg)
-                                else:
-                                    if attempt >= 2:
-                                        msg = "APIの利用枠（クォータ）を超過している可能性が高いです。\n回復しないため処理全体を即時中断します。プランや利用状況を確認してください。"
-                                        shared_context["fatal_error"] = msg
-                                        raise Exception(msg)
-                                    required_sleep = 4.0 + random.uniform(1.0, 3.0) 
-                        elif "404" in err_str: 
-                            msg = f"モデルが存在しないか、利用する権限がありません。\n詳細: {err_str}"
-                            shared_context["fatal_error"] = msg
-                            raise Exception(msg)
-                        continue
+            # 画像を縦に連結（間に少しの余白を入れる）
+            if cropped_images:
+                max_w = max(img.shape[1] for img in cropped_images)
+                total_h = sum(img.shape[0] for img in cropped_images) + (len(cropped_images) - 1) * 20
                 
-                if success or is_fatal_quota: break
-                if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
-                if ui.is_cancelled(): return
+                combined_array = np.full((total_h, max_w, 3), 255, dtype=np.uint8) # 白背景
                 
-                if required_sleep > 0: sleep_time = required_sleep
-                else: sleep_time = min(60.0, 4.0 * (2 ** attempt)) + random.uniform(1.0, 3.0)
+                current_y = 0
+                for img in cropped_images:
+                    h_crop, w_crop = img.shape[:2]
+                    combined_array[current_y:current_y+h_crop, 0:w_crop] = img
+                    current_y += h_crop + 20
                     
-                wait_step = 0.5
-                while sleep_time > 0:
+                combined_img = Image.fromarray(combined_array)
+        else:
+            combined_img = Image.fromarray(img_array)
+            cropped_info = [img_array.shape]
+        
+        # 画像リサイズ処理
+        if combined_img is not None and max(combined_img.width, combined_img.height) > max_size:
+            ratio = max_size / max(combined_img.width, combined_img.height)
+            new_size = (int(combined_img.width * ratio), int(combined_img.height * ratio))
+            combined_img = combined_img.resize(new_size, Image.Resampling.LANCZOS)
+
+        image_size = (combined_img.width, combined_img.height) if combined_img is not None else (native["width"], native["height"])
+        job = {"task": task_info, "image_part": image_part, "image": combined_img, "cropped_info": cropped_info,
+               "est_tokens": estimate_request_tokens(image_size, prompt, max_tokens), "cache_base": None,
+               "text": "", "success": False, "last_error": "", "model": None, "cached": False, "parsed": False, "has_content": False}
+
+        # 応答キャッシュの確認（送信枠を確保する前に行い、ヒットした場合は送信しない）
+        if response_cache is not None:
+            job["cache_base"] = ["gemini", _gemini_image_digest(image_part, combined_img), prompt, custom_prompt,
+                                 generation_config, bool(safety_settings)]
+            for model_name in models_to_try:
+                entry = response_cache.get(job["cache_base"] + [model_name])
+                if entry is not None:
+                    job["text"], job["success"], job["model"], job["cached"] = entry["text"], True, model_name, True
+                    with progress_lock: shared_context["cached_pages"] += 1
+                    break
+        return job
+
+    def accept_response(job, model_name, scheduler, response):
+        """応答を受け取り、TPMの精算を行う（ブロックされた応答は例外）。応答キャッシュへの保存はパースに成功した後に finish_page で行う"""
+        usage = getattr(response, "usage_metadata", None)
+        scheduler.settle(job["est_tokens"], getattr(usage, "total_token_count", 0) or job["est_tokens"])
+        if not response.parts: raise Exception("安全フィルタ等によりブロックされました。")
+        job["text"], job["success"], job["model"] = normalize_text(response.text.strip()), True, model_name
+
+    def api_error_wait(err_str, attempt, scheduler):
+        """
+        APIエラーの内容から、次の再試行までに必要な待機秒数を返す（0の場合は通常のバックオフ）。
+        処理全体を中断すべきエラー（長い待機の要求・1日の上限・モデル無し等）の場合は fatal_error を設定して例外を送出する。
+        """
+        if "429" in err_str or "Quota" in err_str:
+            m = re.search(r'retry in ([\d\.]+)s', err_str, re.IGNORECASE | re.DOTALL)
+            if not m: m = re.search(r'seconds:\s*(\d+)', err_str, re.IGNORECASE | re.DOTALL)
+            if m:
+                wait_sec = float(m.group(1))
+                if wait_sec > 15.0:  # 長い待機時間を要求された場合は即座に打ち切る
+                    msg = f"APIの利用枠（バースト制限）を超過しました（約{int(wait_sec)}秒の待機を要求されました）。\n処理全体を即時中断します。しばらく時間をおいてから再試行してください。"
+                    shared_context["fatal_error"] = msg
+                    raise Exception(msg)
+                # 同じモデルへの他のページの送信も、要求された時間だけ止める
+                scheduler.pause(wait_sec + 2.0)
+                return wait_sec + 2.0
+            if "per day" in err_str.lower() or "perday" in err_str.lower():
+                msg = "1日のAPI利用上限に到達しました。\n無料枠の場合は明日以降に再度お試しください。"
+                shared_context["fatal_error"] = msg
+                raise Exception(msg)
+            if attempt >= 2:
+                msg = "APIの利用枠（クォータ）を超過している可能性が高いです。\n回復しないため処理全体を即時中断します。プランや利用状況を確認してください。"
+                shared_context["fatal_error"] = msg
+                raise Exception(msg)
+            return 4.0 + random.uniform(1.0, 3.0)
+        if "404" in err_str:
+            msg = f"モデルが存在しないか、利用する権限がありません。\n詳細: {err_str}"
+            shared_context["fatal_error"] = msg
+            raise Exception(msg)
+        return 0.0
+
+    def backoff_seconds(attempt, required_sleep):
+        if required_sleep > 0: return required_sleep
+        return min(60.0, 4.0 * (2 ** attempt)) + random.uniform(1.0, 3.0)
+
+    def request_page(job, should_stop=should_abort):
+        """
+        2. 1ページにつき1回のAPIリクエスト（モデルの切り替え・再試行を含む）。
+        結果は job に格納する（全ての再試行に失敗した場合も True を返し、finish_page がエラーとして書き込む）。
+        キャンセルされた場合、または should_stop() が真になった場合（パイプラインの他の段の失敗等）は False。
+        """
+        contents = [prompt, job["image_part"] if job["image_part"] is not None else job["image"]]
+        for attempt in range(MAX_RETRIES):
+            if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+            if should_stop(): return False
+            required_sleep = 0.0
+
+            for model_name in models_to_try:
+                if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+                if should_stop(): return False
+                # 送信枠の確保（RPM / TPM の範囲内になるまで、要求順に待機する）
+                scheduler = schedulers[model_name]
+                if not scheduler.acquire(job["est_tokens"], should_abort=should_stop, on_wait=show_wait):
+                    if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+                    return False
+
+                ui.set_indeterminate(f"AI解析中... ( P.{job['task']['page_num']+1} )")
+                try:
+                    response = models[model_name].generate_content(contents, generation_config=generation_config, safety_settings=safety_settings)
+                    accept_response(job, model_name, scheduler, response)
+                    return True
+                except Exception as api_err:
+                    job["last_error"] = str(api_err)
+                    required_sleep = api_error_wait(job["last_error"], attempt, scheduler) or required_sleep
+
+            sleep_time = backoff_seconds(attempt, required_sleep)
+            wait_step = 0.5
+            while sleep_time > 0:
+                if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+                if should_stop(): return False
+                time.sleep(min(wait_step, sleep_time))
+                sleep_time -= wait_step
+        return True
+
+    async def request_page_async(job):
+        """request_page の asyncio 版。送信枠の待機・応答待ち・再試行の待機中にスレッドを占有しない"""
+        contents = [prompt, job["image_part"] if job["image_part"] is not None else job["image"]]
+        for attempt in range(MAX_RETRIES):
+            if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+            if ui.is_cancelled(): return False
+            required_sleep = 0.0
+
+            for model_name in models_to_try:
+                if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+                if ui.is_cancelled(): return False
+                scheduler = schedulers[model_name]
+                if not await scheduler.acquire_async(job["est_tokens"], should_abort=should_abort, on_wait=show_wait):
                     if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
-                    if ui.is_cancelled(): return
-                    time.sleep(min(wait_step, sleep_time))
-                    sleep_time -= wait_step
+                    return False
+
+                ui.set_indeterminate(f"AI解析中... ( P.{job['task']['page_num']+1} )")
+                try:
+                    response = await models[model_name].generate_content_async(contents, generation_config=generation_config, safety_settings=safety_settings)
+                    accept_response(job, model_name, scheduler, response)
+                    return True
+                except Exception as api_err:
+                    job["last_error"] = str(api_err)
+                    required_sleep = api_error_wait(job["last_error"], attempt, scheduler) or required_sleep
+
+            sleep_time = backoff_seconds(attempt, required_sleep)
+            wait_step = 0.5
+            while sleep_time > 0:
+                if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+                if ui.is_cancelled(): return False
+                await asyncio.sleep(min(wait_step, sleep_time))
+                sleep_time -= wait_step
+        return True
+
+    def finish_page(job):
+        """応答をパースしてページの表データを作り、出力・完了記録へ書き込む"""
+        task_info = job["task"]
+        f_path = task_info["file_path"]
+        page_num = task_info["page_num"]
+        total_p = task_info["total_pages"]
+        extracted_text, success, last_error, cropped_info = job["text"], job["success"], job["last_error"], job["cropped_info"]
+
+        # 3. 抽出データのパースと各領域への分配
+        all_regions_data = []
+        parsed = success
+        if success:
+            if is_table_format:
+                try:
+                    clean_text = extracted_text.strip()
+                    json_match = re.search(r'\{.*\}', clean_text, re.DOTALL)
+                    if json_match: clean_text = json_match.group(0)
                     
-            # 3. 抽出データのパースと各領域への分配
-            all_regions_data = []
-            if success:
-                if is_table_format:
-                    try:
-                        clean_text = extracted_text.strip()
-                        json_match = re.search(r'\{.*\}', clean_text, re.DOTALL)
-                        if json_match: clean_text = json_match.group(0)
-                        
-                        # データ量超過で途切れたJSONを強制的に修復する堅牢なロジック
-                        def _robust_json_parse(json_str):
+                    # データ量超過で途切れたJSONを強制的に修復する堅牢なロジック
+                    def _robust_json_parse(json_str):
+                        try:
+                            return json.loads(json_str)
+                        except json.JSONDecodeError as initial_err:
                             try:
-                                return json.loads(json_str)
-                            except json.JSONDecodeError as initial_err:
+                                s = json_str.strip()
+                                quote_count = len(re.findall(r'(?<!\\)"', s))
+                                if quote_count % 2 != 0: s += '"'
+                                s = re.sub(r',\s*$', '', s) # 末尾のカンマを削除
+                                open_brackets = s.count('[') - s.count(']')
+                                open_braces = s.count('{') - s.count('}')
+                                if open_brackets > 0: s += ']' * open_brackets
+                                if open_braces > 0: s += '}' * open_braces
+                                return json.loads(s)
+                            except Exception:
                                 try:
-                                    s = json_str.strip()
-                                    quote_count = len(re.findall(r'(?<!\\)"', s))
-                                    if quote_count % 2 != 0: s += '"'
-                                    s = re.sub(r',\s*$', '', s) # 末尾のカンマを削除
-                                    open_brackets = s.count('[') - s.count(']')
-                                    open_braces = s.count('{') - s.count('}')
-                                    if open_brackets > 0: s += ']' * open_brackets
-                                    if open_braces > 0: s += '}' * open_braces
-                                    return json.loads(s)
+                                    # カンマ以降の不完全な文字列を丸ごと削ってから閉じる
+                                    s2 = json_str.strip()
+                                    last_comma = s2.rfind(',')
+                                    if last_comma != -1:
+                                        s2 = s2[:last_comma]
+                                        quote_count = len(re.findall(r'(?<!\\)"', s2))
+                                        if quote_count % 2 != 0: s2 += '"'
+                                        ob = s2.count('[') - s2.count(']')
+                                        oc = s2.count('{') - s2.count('}')
+                                        if ob > 0: s2 += ']' * ob
+                                        if oc > 0: s2 += '}' * oc
+                                        return json.loads(s2)
                                 except Exception:
-                                    try:
-                                        # カンマ以降の不完全な文字列を丸ごと削ってから閉じる
-                                        s2 = json_str.strip()
-                                        last_comma = s2.rfind(',')
-                                        if last_comma != -1:
-                                            s2 = s2[:last_comma]
-                                            quote_count = len(re.findall(r'(?<!\\)"', s2))
-                                            if quote_count % 2 != 0: s2 += '"'
-                                            ob = s2.count('[') - s2.count(']')
-                                            oc = s2.count('{') - s2.count('}')
-                                            if ob > 0: s2 += ']' * ob
-                                            if oc > 0: s2 += '}' * oc
-                                            return json.loads(s2)
-                                    except Exception:
-                                        pass
-                                raise initial_err
-
-                        data = _robust_json_parse(clean_text)
-                        
-                        if crop_regions:
-                            # { "regions": [ [data1], [data2] ] } の形式を想定
-                            parsed_regions = data.get("regions", [])
-                            if not isinstance(parsed_regions, list):
-                                parsed_regions = [parsed_regions]
-                                
-                            # 抽出した領域数と設定された領域数が合わない場合のフォールバック
-                            for i in range(len(crop_regions)):
-                                if i < len(parsed_regions):
-                                    rows = parsed_regions[i]
-                                    if not isinstance(rows, list): rows = [rows]
-                                else:
-                                    rows = [f"領域{i+1}のデータ取得失敗"]
-                                    
-                                page_data_to_write = []
-                                h_crop, w_crop = cropped_info[i][:2]
-                                clean_rows = []
-                                for r in rows:
-                                    val = " ".join([str(x) for x in r]) if isinstance(r, list) else str(r)
-                                    if '\n' in val:
-                                        lines = [l.strip() for l in val.split('\n') if l.strip()]
-                                        if all(len(l) <= 2 for l in lines): val = "".join(lines)
-                                    clean_rows.append(val)
-                                    
-                                if h_crop > w_crop * 1.5 and all(len(x.strip()) <= 2 for x in clean_rows if x.strip()): 
-                                    page_data_to_write.append(["".join(clean_rows)])
-                                else:
-                                    # 改行で結合せず、そのままの配列を1行のデータとして扱う（セルごとに横並びに分割）
-                                    if clean_rows:
-                                        page_data_to_write.append(clean_rows)
-                                    else:
-                                        page_data_to_write.append([""])
-                                        
-                                all_regions_data.append(page_data_to_write)
-                        else:
-                            header = data.get("header", [])
-                            rows = data.get("rows", [])
-                            if not header and not rows and isinstance(data, list):
-                                if data: header, rows = (data[0] if isinstance(data[0], list) else [str(data[0])]), data[1:]
-                            safe_header = [str(x).strip() for x in header] if isinstance(header, list) else []
-                            page_col_count = len(safe_header)
-                            for r in rows:
-                                if isinstance(r, list) and len(r) > page_col_count: page_col_count = len(r)
-                            if not safe_header: safe_header = [f"列{idx+1}" for idx in range(page_col_count)]
-                            page_data_to_write = []
-                            padded_header = (safe_header + [""] * page_col_count)[:page_col_count]
-                            page_data_to_write.append(padded_header)
-                            for row_data in rows:
-                                parsed_r = parse_row_data(row_data)
-                                safe_row_local = []
-                                for val in (parsed_r + [""] * page_col_count)[:page_col_count]:
-                                    v_str = str(val)
-                                    if '\n' in v_str:
-                                        lines = [l.strip() for l in v_str.split('\n') if l.strip()]
-                                        if len(lines) > 1 and all(len(l) <= 2 for l in lines): v_str = "".join(lines)
-                                    safe_row_local.append(v_str)
-                                if any(v != "" for v in safe_row_local): page_data_to_write.append(safe_row_local)
-                            all_regions_data.append(page_data_to_write)
-                    except Exception as e:
-                        # パース失敗時は、領域ごとにエラーをセット
-                        for _ in range(len(crop_regions) if crop_regions else 1):
-                            all_regions_data.append([[f"JSONパースエラー (データ量超過の可能性): {e}"]])
-                else:
+                                    pass
+                            raise initial_err
+
+                    data = _robust_json_parse(clean_text)
+                    
                     if crop_regions:
-                        # テキストフォーマットでの複数領域パース（"---領域X---"で分割）
-                        raw_parts = re.split(r'---領域\d+---', extracted_text.strip())
-                        parts = [p.strip() for p in raw_parts if p.strip()]
+                        # { "regions": [ [data1], [data2] ] } の形式を想定
+                        parsed_regions = data.get("regions", [])
+                        if not isinstance(parsed_regions, list):
+                            parsed_regions = [parsed_regions]
+                            
+                        # 抽出した領域数と設定された領域数が合わない場合のフォールバック
                         for i in range(len(crop_regions)):
-                            if i < len(parts):
-                                val = parts[i].strip()
-                                if val:
+                            if i < len(parsed_regions):
+                                rows = parsed_regions[i]
+                                if not isinstance(rows, list): rows = [rows]
+                            else:
+                                rows = [f"領域{i+1}のデータ取得失敗"]
+                                
+                            page_data_to_write = []
+                            h_crop, w_crop = cropped_info[i][:2]
+                            clean_rows = []
+                            for r in rows:
+                                val = " ".join([str(x) for x in r]) if isinstance(r, list) else str(r)
+                                if '\n' in val:
                                     lines = [l.strip() for l in val.split('\n') if l.strip()]
-                                    all_regions_data.append([lines] if lines else [[""]])
-                                else:
-                                    all_regions_data.append([[""]])
+                                    if all(len(l) <= 2 for l in lines): val = "".join(lines)
+                                clean_rows.append(val)
+                                
+                            if h_crop > w_crop * 1.5 and all(len(x.strip()) <= 2 for x in clean_rows if x.strip()): 
+                                page_data_to_write.append(["".join(clean_rows)])
                             else:
-                                all_regions_data.append([[""]])
+                                # 改行で結合せず、そのままの配列を1行のデータとして扱う（セルごとに横並びに分割）
+                                if clean_rows:
+                                    page_data_to_write.append(clean_rows)
+                                else:
+                                    page_data_to_write.append([""])
+                                    
+                            all_regions_data.append(page_data_to_write)
                     else:
-                        lines = [line.strip() for line in extracted_text.strip().split('\n') if line.strip()]
-                        all_regions_data.append([lines] if lines else [[""]])
+                        header = data.get("header", [])
+                        rows = data.get("rows", [])
+                        if not header and not rows and isinstance(data, list):
+                            if data: header, rows = (data[0] if isinstance(data[0], list) else [str(data[0])]), data[1:]
+                        safe_header = [str(x).strip() for x in header] if isinstance(header, list) else []
+                        page_col_count = len(safe_header)
+                        for r in rows:
+                            if isinstance(r, list) and len(r) > page_col_count: page_col_count = len(r)
+                        if not safe_header: safe_header = [f"列{idx+1}" for idx in range(page_col_count)]
+                        page_data_to_write = []
+                        padded_header = (safe_header + [""] * page_col_count)[:page_col_count]
+                        page_data_to_write.append(padded_header)
+                        for row_data in rows:
+                            parsed_r = parse_row_data(row_data)
+                            safe_row_local = []
+                            for val in (parsed_r + [""] * page_col_count)[:page_col_count]:
+                                v_str = str(val)
+                                if '\n' in v_str:
+                                    lines = [l.strip() for l in v_str.split('\n') if l.strip()]
+                                    if len(lines) > 1 and all(len(l) <= 2 for l in lines): v_str = "".join(lines)
+                                safe_row_local.append(v_str)
+                            if any(v != "" for v in safe_row_local): page_data_to_write.append(safe_row_local)
+                        all_regions_data.append(page_data_to_write)
+                except Exception as e:
+                    # パース失敗時は、領域ごとにエラーをセット
+                    parsed = False
+                    for _ in range(len(crop_regions) if crop_regions else 1):
+                        all_regions_data.append([[f"JSONパースエラー (データ量超過の可能性): {e}"]])
             else:
-                for _ in range(len(crop_regions) if crop_regions else 1):
-                    all_regions_data.append([[f"AI抽出失敗: {last_error}"]])
-                    
-            # 4. ページデータの統合とファイル保存
-            if not is_table_format:
-                merged_row = []
-                for region_data in all_regions_data:
-                    for r in region_data:
-                        for c in r:
-                            if str(c).strip(): merged_row.append(str(c).strip())
-                merged_data = [merged_row] if merged_row else [[""]]
-            else:
-                merged_data = merge_2d_arrays_horizontally(all_regions_data)
-                
-            final_data = []
-            page_info_str = f"{page_num+1}/{total_p}"
-            
-            if not is_table_format:
-                max_cols = max((len(r) for r in merged_data), default=1)
-                header = ["ページ番号"] + [f"テキスト{i+1}" for i in range(max_cols)]
-                final_data.append(header)
-                for row in merged_data: final_data.append([page_info_str] + row)
-            elif crop_regions:
-                header = ["ページ番号"]
-                if all_regions_data and merged_data:
-                    # 分割されたセル数に合わせてヘッダーを動的に生成する
-                    for i, region_data in enumerate(all_regions_data):
-                        num_cols = len(region_data[0]) if region_data and len(region_data) > 0 else 1
-                        if num_cols == 1:
-                            header.append(f"抽出範囲{i+1}")
+                if crop_regions:
+                    # テキストフォーマットでの複数領域パース（"---領域X---"で分割）
+                    raw_parts = re.split(r'---領域\d+---', extracted_text.strip())
+                    parts = [p.strip() for p in raw_parts if p.strip()]
+                    for i in range(len(crop_regions)):
+                        if i < len(parts):
+                            val = parts[i].strip()
+                            if val:
+                                lines = [l.strip() for l in val.split('\n') if l.strip()]
+                                all_regions_data.append([lines] if lines else [[""]])
+                            else:
+                                all_regions_data.append([[""]])
                         else:
-                            for j in range(num_cols):
-                                header.append(f"抽出範囲{i+1}-{j+1}")
+                            all_regions_data.append([[""]])
                 else:
-                    header = ["ページ番号"] + [f"抽出範囲{idx+1}" for idx in range(len(crop_regions))]
-                
-                final_data.append(header)
-                for row in merged_data: final_data.append([page_info_str] + row)
+                    lines = [line.strip() for line in extracted_text.strip().split('\n') if line.strip()]
+                    all_regions_data.append([lines] if lines else [[""]])
+        else:
+            for _ in range(len(crop_regions) if crop_regions else 1):
+                all_regions_data.append([[f"AI抽出失敗: {last_error}"]])
+
+        # parsed は応答を正しく解釈できたか（再開用の記録に使う）、has_content は文字が1つ以上得られたか（出力・報告に使う）。
+        # 白紙のページは正しく解釈できていれば完了とし、再開のたびに再送信しない
+        job["parsed"] = parsed
+        job["has_content"] = any(str(c).strip() for region_data in all_regions_data for r in region_data for c in r)
+        if parsed and not job["has_content"]:
+            with progress_lock: shared_context["blank_pages"] += 1
+        # パースできた応答（白紙のページを含む）のみ応答キャッシュに保存し、再実行時に再送信・再課金しない
+        # （途切れた・壊れた応答を再実行のたびに再利用しないよう、キャッシュから得たパースできない応答は削除して次回は再送信させる）
+        if job["cache_base"] is not None and job["model"] is not None:
+            cache_key = job["cache_base"] + [job["model"]]
+            if parsed and not job["cached"]: response_cache.set(cache_key, {"text": extracted_text})
+            elif not parsed and job["cached"]: response_cache.delete(cache_key)
+
+        # 4. ページデータの統合とファイル保存
+        if not is_table_format:
+            merged_row = []
+            for region_data in all_regions_data:
+                for r in region_data:
+                    for c in r:
+                        if str(c).strip(): merged_row.append(str(c).strip())
+            merged_data = [merged_row] if merged_row else [[""]]
+        else:
+            merged_data = merge_2d_arrays_horizontally(all_regions_data)
+            
+        final_data = []
+        page_info_str = f"{page_num+1}/{total_p}"
+        
+        if not is_table_format:
+            max_cols = max((len(r) for r in merged_data), default=1)
+            header = ["ページ番号"] + [f"テキスト{i+1}" for i in range(max_cols)]
+            final_data.append(header)
+            for row in merged_data: final_data.append([page_info_str] + row)
+        elif crop_regions:
+            header = ["ページ番号"]
+            if all_regions_data and merged_data:
+                # 分割されたセル数に合わせてヘッダーを動的に生成する
+                for i, region_data in enumerate(all_regions_data):
+                    num_cols = len(region_data[0]) if region_data and len(region_data) > 0 else 1
+                    if num_cols == 1:
+                        header.append(f"抽出範囲{i+1}")
+                    else:
+                        for j in range(num_cols):
+                            header.append(f"抽出範囲{i+1}-{j+1}")
             else:
-                for r_idx, row in enumerate(merged_data):
-                    if r_idx == 0: final_data.append(["ページ番号"] + row)
-                    else: final_data.append([page_info_str] + row)
+                header = ["ページ番号"] + [f"抽出範囲{idx+1}" for idx in range(len(crop_regions))]
             
-            # 元のファイル名（_Page_XX_AI抽出）のみを使用する（タイムスタンプは付与しない）
-            save_path = os.path.join(save_dir, f"{base}_Page_{str(page_num+1).zfill(digits)}_AI抽出")
-            if out_format == "xlsx":
-                wb = Workbook(); ws = wb.active; ws.title = f"Page_{str(page_num+1).zfill(digits)}"
-                for r_idx, row_data in enumerate(final_data, 1):
-                    for c_idx, val in enumerate(row_data, 1): ws.cell(row=r_idx, column=c_idx, value=sanitize_excel_text(val))
-                auto_adjust_excel_column_width(ws); wb.save(f"{save_path}.xlsx")
-            elif out_format == "csv":
-                with open(f"{save_path}.csv", "w", encoding="utf-8-sig", newline="") as f_out: csv.writer(f_out).writerows(final_data)
-            elif out_format == "txt":
-                with open(f"{save_path}.txt", "w", encoding="utf-8") as f_out:
-                    for row_data in final_data: f_out.write("\t".join(row_data) + "\n")
-            elif out_format == "json":
-                with open(f"{save_path}.json", "w", encoding="utf-8") as f_out: json.dump(final_data, f_out, ensure_ascii=False, indent=2)
-            elif out_format == "md":
-                with open(f"{save_path}.md", "w", encoding="utf-8") as f_out:
-                    if final_data:
-                        f_out.write("| " + " | ".join(map(str, final_data[0])) + " |\n")
-                        f_out.write("|" + "|".join(["---"] * len(final_data[0])) + "|\n")
-                        for row in final_data[1:]: f_out.write("| " + " | ".join(map(lambda x: str(x).replace('\n', '<br>'), row)) + " |\n")
-            elif out_format == "docx":
-                if Document is None: raise Exception("python-docx ライブラリがインストールされていません。")
-                doc_out = Document()
-                if final_data:
-                    table = doc_out.add_table(rows=len(final_data), cols=max(len(r) for r in final_data))
-                    table.style = 'Table Grid'
-                    for r_idx, row_data in enumerate(final_data):
-                        row_cells = table.rows[r_idx].cells
-                        for c_idx, val in enumerate(row_data):
-                            if c_idx < len(row_cells):
-                                row_cells[c_idx].text = str(val)
-                doc_out.save(f"{save_path}.docx")
-                
-            # メモリ解放
-            gc.collect()
+            final_data.append(header)
+            for row in merged_data: final_data.append([page_info_str] + row)
+        else:
+            for r_idx, row in enumerate(merged_data):
+                if r_idx == 0: final_data.append(["ページ番号"] + row)
+                else: final_data.append([page_info_str] + row)
+
+        output.write_page(f_path, page_num + 1, total_p, final_data, seq=task_info["seq"])
+        # 応答をパースできたページのみ完了として記録する（白紙のページも含む。エラーのページは再開時に再処理する）
+        if journal is not None and job["parsed"]:
+            journal.record(task_info["digest"], page_num, f_path, output.output_paths(f_path, page_num + 1, total_p), final_data)
 
+        # メモリ解放
+        gc.collect()
+
+    def page_error(task_info, e):
+        if shared_context["fatal_error"]: return Exception(shared_context["fatal_error"])
+        return Exception(f"ページ {task_info['page_num']+1} の処理中にエラーが発生しました: {e}")
+
+    def page_done():
+        nonlocal completed_pages
+        with progress_lock:
+            completed_pages += 1
+            cached_note = f"、うちキャッシュ {shared_context['cached_pages']}" if shared_context["cached_pages"] else ""
+            if shared_context["pipeline"] is not None:
+                depths = shared_context["pipeline"].depths()
+                cached_note += f" ［送信待ち {depths['send'][0]}/{depths['send'][1]}・書き込み待ち {depths['write'][0]}/{depths['write'][1]}］"
+            ui.update_overall(completed_pages, total_tasks, f"全体の進捗 ( {completed_pages} / {total_tasks} ページ完了{cached_note} )")
+
+    def process_single_page_task(task_info):
+        """1ページ分の全領域を1回のAPIリクエストで処理するタスク（スレッドプール用）"""
+        if shared_context["fatal_error"]: return
+        if ui.is_cancelled(): return
+        try:
+            job = prepare_page(task_info)
+            if not job["success"] and not request_page(job): return
+            finish_page(job)
         except Exception as e:
-            if shared_context["fatal_error"]:
-                raise Exception(shared_context["fatal_error"])
-            raise Exception(f"ページ {page_num+1} の処理中にエラーが発生しました: {e}")
+            raise page_error(task_info, e)
 
-    # 完全にフラット化されたタスクリストをスレッドプールで一気に並列処理
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_single_page_task, task) for task in page_tasks]
-        
-        for future in concurrent.futures.as_completed(futures):
-            # 共有エラーフラグが立っている、またはキャンセルされた場合は全体をシャットダウン
-            if ui.is_cancelled() or shared_context["fatal_error"]:
-                executor.shutdown(wait=False, cancel_futures=True)
-                if shared_context["fatal_error"]:
-                    raise Exception(shared_context["fatal_error"])
-                return
-            
-            # タスク内で発生した例外（バースト制限など）をここでキャッチしてメインスレッドに投げる
+    def guarded(stage):
+        """パイプラインの各段で起きた例外を、ページ番号付きのエラーに変換する"""
+        def run_stage(job_or_task):
+            task_info = job_or_task.get("task", job_or_task)
+            try: return stage(job_or_task)
+            except Exception as e: raise page_error(task_info, e)
+        return run_stage
+
+    def send_stage(job):
+        # 他の段が失敗した時点で、送信待ちのページや再試行の待機中のページも送信せずに止める
+        if not request_page(job, should_stop=shared_context["pipeline"].aborted): return False
+        job["image"] = job["image_part"] = None  # 送信後の画像は書き込みの段では不要なため手放す
+        return True
+
+    def write_stage(job):
+        finish_page(job)
+        page_done()
+
+    async def run_pages_async(tasks, concurrency, render_workers):
+        """
+        非同期モード: 送信中のリクエストを最大 concurrency 件まで、リクエストごとにスレッドを使わずに扱う。
+        ページの描画・パース・書き込み（CPU処理）は render_workers 個のスレッドで実行し、イベントループを止めない。
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.BoundedSemaphore(concurrency)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=render_workers) as pool:
+            async def handle(task_info):
+                async with semaphore:
+                    if should_abort(): return
+                    try:
+                        job = await loop.run_in_executor(pool, prepare_page, task_info)
+                        if not job["success"] and not await request_page_async(job): return
+                        await loop.run_in_executor(pool, finish_page, job)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        raise page_error(task_info, e)
+                page_done()
+
+            futures = [asyncio.ensure_future(handle(task)) for task in tasks]
             try:
-                future.result()
-            except Exception as e:
-                executor.shutdown(wait=False, cancel_futures=True)
-                raise e
-            
-            with progress_lock:
-                completed_pages += 1
-                ui.update_overall(completed_pages, total_tasks, f"全体の進捗 ( {completed_pages} / {total_tasks} ページ完了 )")
+                for future in asyncio.as_completed(futures):
+                    await future
+                    if should_abort(): break
+            finally:
+                for future in futures: future.cancel()
+                await asyncio.gather(*futures, return_exceptions=True)
+
+
+    # 出力先（ページごと / PDFごと / 全体で1ファイル）
+    output = PageTableOutput(
+        save_dir, options.get("out_formats") or [out_format], options.get("output_grouping", "page"),
+        page_name=lambda base, page_num, total_pages: f"{base}_Page_{str(page_num).zfill(max(2, len(str(total_pages))))}_AI抽出",
+        doc_suffix="_AI抽出", job_name=f"AI抽出結果_{time.strftime('%Y%m%d_%H%M%S')}", sheet_title="AI抽出",
+        page_sheet_title=lambda page_num, total_pages: f"Page_{str(page_num).zfill(max(2, len(str(total_pages))))}")
+
+    # 完了済みページの記録（抽出結果を左右する設定が同じ場合のみ再開の対象にする）
+    journal = None
+    if options.get("gemini_resume", True):
+        config_hash = hashlib.sha256(json.dumps(
+            [prompt, models_to_try, generation_config, bool(safety_settings), crop_regions, is_table_format, options.get("native_images", True)],
+            ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        journal = PageJournal(os.path.join(save_dir, GEMINI_JOURNAL_NAME), config_hash)
+    pending_tasks = page_tasks
+    if journal is not None and len(journal):
+        # 完了済みのページは送信せず、記録した表データから出力し直す（ページごとの出力が残っている場合は何もしない）
+        pending_tasks = []
+        for task in page_tasks:
+            entry = journal.lookup(task["digest"], task["page_num"]) if task["digest"] else None
+            if entry is None: pending_tasks.append(task); continue
+            f_path, total_p = task["file_path"], task["total_pages"]
+            if output.grouping != "page" or not all(os.path.exists(p) for p in output.output_paths(f_path, task["page_num"] + 1, total_p)):
+                output.write_page(f_path, task["page_num"] + 1, total_p, entry["rows"], seq=task["seq"])
+        shared_context["resumed_pages"] = completed_pages = total_tasks - len(pending_tasks)
+        ui.update_overall(completed_pages, total_tasks, f"全体の進捗 ( {completed_pages} / {total_tasks} ページ完了 )")
+
+    completed_all = False
+    unrecorded_pages = []
+    # 描画スレッド数（非同期モード・パイプラインで共通。スレッドごとにPDFと画像を保持するため上限を設ける）
+    render_workers = min(PIPELINE_MAX_RENDER_WORKERS, resolve_worker_count(options.get("gemini_render_workers", 2)))
+    try:
+        if options.get("gemini_async"):
+            # 非同期モード: 多数のリクエストを少ないスレッドで同時に送信する（有料プラン向け）
+            asyncio.run(run_pages_async(pending_tasks, max(1, int(options.get("gemini_async_concurrency", 50))), render_workers))
+            if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+            if ui.is_cancelled(): return
+        elif options.get("gemini_pipeline", False):
+            # 描画 → 送信 → パース・書き込み を段ごとのスレッドに分け、送信中に次のページを先読みして描画する
+            pipeline = StagePipeline(
+                guarded(prepare_page), guarded(send_stage), guarded(write_stage), needs_send=lambda job: not job["success"],
+                render_workers=render_workers, send_workers=max_workers,
+                prefetch=options.get("gemini_prefetch", 4), write_depth=options.get("gemini_write_queue", 8), should_abort=should_abort)
+            shared_context["pipeline"] = pipeline
+            pipeline.run(pending_tasks)
+            if shared_context["fatal_error"]: raise Exception(shared_context["fatal_error"])
+            if ui.is_cancelled(): return
+        else:
+            # 完全にフラット化されたタスクリストをスレッドプールで一気に並列処理
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(process_single_page_task, task) for task in pending_tasks]
+
+                for future in concurrent.futures.as_completed(futures):
+                    # 共有エラーフラグが立っている、またはキャンセルされた場合は全体をシャットダウン
+                    if ui.is_cancelled() or shared_context["fatal_error"]:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        if shared_context["fatal_error"]:
+                            raise Exception(shared_context["fatal_error"])
+                        return
+
+                    # タスク内で発生した例外（バースト制限など）をここでキャッチしてメインスレッドに投げる
+                    try:
+                        future.result()
+                    except Exception as e:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise e
+
+                    page_done()
+        completed_all = not ui.is_cancelled()
+    finally:
+        output.close()
+        if journal is not None:
+            # 記録の無い（エラーになった）ページが残る場合は、次回そのページだけを再処理できるよう記録を残す
+            if completed_all: unrecorded_pages = [task for task in page_tasks if journal.lookup(task["digest"], task["page_num"]) is None]
+            journal.close(completed=completed_all and not unrecorded_pages)
+        if response_cache: response_cache.evict()
 
+    report_native_pages(ui, shared_context["native_pages"])
+    _report_resumed_pages(ui, shared_context["resumed_pages"])
+    _report_unrecorded_pages(ui, unrecorded_pages)
+    _report_cached_responses(ui, shared_context["cached_pages"])
+    _report_blank_pages(ui, shared_context["blank_pages"])
+    if shared_context["pipeline"] is not None: _report_pipeline_depths(ui, shared_context["pipeline"])
     ui.set_determinate(total_tasks, total_tasks, "すべての処理が完了しました")
\ No newline at end of file
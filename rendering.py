@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import os, collections, threading
+import cv2
+import numpy as np
+import fitz  # PyMuPDF
+
+from caches import DiskCache, file_digest
+
+# ==============================
+# ページの画像化 (共通)
+# ==============================
+def pixmap_array(pix):
+    """
+    Pixmap の画素データを複製せずに参照する NumPy 配列 (高さ, 幅, チャンネル数) を返す。
+    配列は Pixmap のメモリを直接指すため、配列を使い終わるまで Pixmap を保持しておくこと（読み取り専用）。
+    """
+    # samples は呼ぶたびに bytes へ複製されるため、複製しない memoryview（samples_mv）を優先する
+    buf = pix.samples_mv if hasattr(pix, "samples_mv") else pix.samples
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    if pix.stride != pix.w * pix.n:
+        # 行末に詰め物がある場合のみ、行ごとの有効部分を切り出す
+        return arr.reshape(pix.h, pix.stride)[:, :pix.w * pix.n].reshape(pix.h, pix.w, pix.n)
+    return arr.reshape(pix.h, pix.w, pix.n)
+
+def render_page_array(page, dpi=None, zoom=None, gray=False):
+    """
+    ページを、利用側が必要とする色空間で直接描画し、(画像配列, Pixmap) を返す。
+    gray=True の場合はグレースケール (高さ, 幅)、それ以外はアルファ無しのRGB (高さ, 幅, 3)。
+    OCR・輪郭抽出はグレースケール、Gemini への送信やプレビューはRGBを使い、描画後の色変換・複製を省く。
+    画像配列は Pixmap を直接参照するため、戻り値の Pixmap は配列を使い終わるまで保持すること。
+    """
+    colorspace = fitz.csGRAY if gray else fitz.csRGB
+    if zoom is not None: pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False)
+    else: pix = page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+    arr = pixmap_array(pix)
+    return (arr[:, :, 0] if gray else arr), pix
+
+# ==============================
+# スキャン画像の直接取り出し
+# ==============================
+# 画像がページ全体を覆っているとみなす、ページ端とのずれの許容量（ページの幅・高さに対する割合）
+NATIVE_IMAGE_TOLERANCE = 0.01
+
+def native_page_image(page, min_dpi=0):
+    """
+    スキャンPDFのように「ページ全体を覆う画像1枚だけ」で構成されたページから、埋め込み画像の情報を返す。
+    該当しないページ（文字・図形・注釈がある、画像が回転・反転して配置されている、透過マスクがある等）は None。
+    画像の画素がそのままページの相対座標に対応するため、抽出範囲の座標を変換せずに使える。
+    戻り値: {"xref": 画像のxref, "width", "height", "dpi": ページ上での解像度, "jpeg": 元のJPEGデータ（RGB/グレーのJPEGの場合のみ、それ以外は None）}
+    """
+    images = page.get_images(full=True)
+    if len(images) != 1 or page.rotation: return None
+    xref, smask = images[0][0], images[0][1]
+    if smask or page.first_annot is not None: return None
+    if page.get_text("text").strip() or page.get_drawings(): return None
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1: return None
+    bbox, matrix = placements[0]
+    # 回転・反転せずに配置されている場合のみ（画像の向きとページの向きが一致する）
+    if abs(matrix.b) > 1e-6 or abs(matrix.c) > 1e-6 or matrix.a <= 0 or matrix.d <= 0: return None
+    rect = page.rect
+    tol_x, tol_y = rect.width * NATIVE_IMAGE_TOLERANCE, rect.height * NATIVE_IMAGE_TOLERANCE
+    if abs(bbox.x0 - rect.x0) > tol_x or abs(bbox.x1 - rect.x1) > tol_x or abs(bbox.y0 - rect.y0) > tol_y or abs(bbox.y1 - rect.y1) > tol_y: return None
+
+    info = page.parent.extract_image(xref)
+    if not info or not info.get("width"): return None
+    dpi = info["width"] * 72 / rect.width
+    if dpi < min_dpi: return None
+    is_plain_jpeg = info.get("ext") in ("jpeg", "jpg") and info.get("colorspace") in (1, 3)
+    return {"xref": xref, "width": info["width"], "height": info["height"], "dpi": dpi, "jpeg": info["image"] if is_plain_jpeg else None}
+
+def native_page_array(page, info, gray=False):
+    """
+    native_page_image で見つけた埋め込み画像を、元の解像度のまま (画像配列, Pixmap) として返す（再描画・拡大縮小を行わない）。
+    gray=True の場合はグレースケール、それ以外はアルファ無しのRGB。
+    """
+    pix = fitz.Pixmap(page.parent, info["xref"])
+    if pix.alpha: pix = fitz.Pixmap(pix, 0)
+    if gray and pix.n != 1: pix = fitz.Pixmap(fitz.csGRAY, pix)
+    elif not gray and pix.n != 3: pix = fitz.Pixmap(fitz.csRGB, pix)
+    arr = pixmap_array(pix)
+    return (arr[:, :, 0] if gray else arr), pix
+
+# ==============================
+# 描画結果のキャッシュ
+# ==============================
+class RenderCache:
+    """
+    描画済みのページ画像を (ファイル内容のハッシュ, ページ, 解像度, グレースケールか) をキーに保持する、容量上限付きのLRUキャッシュ。
+    同じページの、より高い解像度の描画結果があれば縮小して使う（グレースケールはRGBの描画結果からも作れる）。
+    spill に DiskCache を渡すと描画結果をディスクにも保存し、別のプロセス（OCRのワーカー等）や次回の処理でも再利用する。
+    保持している画像配列は共有されるため、読み取り専用にしている。
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024, spill=None):
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._entries = collections.OrderedDict()  # キー -> (画像配列, 画素データの持ち主の Pixmap または None)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, digest, page_idx, dpi, gray):
+        key = (digest, page_idx, dpi, gray)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            # 同じページの、より高い解像度の描画結果のうち最も近いもの（同じ色空間を優先）を探す
+            source = None
+            for (d, p, src_dpi, src_gray), e in self._entries.items():
+                if d != digest or p != page_idx or src_dpi <= dpi or (src_gray and not gray): continue
+                rank = (src_dpi, src_gray != gray)
+                if source is None or rank < source[0]: source = (rank, src_dpi, e)
+        if source is not None:
+            # e（画像配列と Pixmap の組）を保持したまま変換し、途中で手放されても画素データが解放されないようにする
+            _, src_dpi, (arr, _owner) = source
+            if gray and arr.ndim == 3: arr = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+            scale = dpi / src_dpi
+            arr = cv2.resize(arr, (max(1, round(arr.shape[1] * scale)), max(1, round(arr.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+            self.store(key, arr, None, spill=False)
+            return arr, None
+        if self.spill is not None:
+            path = self.spill.file_path(list(key), ".npy")
+            try:
+                arr = np.load(path, allow_pickle=False)
+                os.utime(path, None)  # 使用されたものを新しい扱いにし、容量超過時に削除されにくくする
+            except (OSError, ValueError): return None
+            self.store(key, arr, None, spill=False)
+            return arr, None
+        return None
+
+    def store(self, key, arr, owner, spill=True):
+        arr.flags.writeable = False
+        if self.spill is not None and spill:
+            path = self.spill.file_path(list(key), ".npy")
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f: np.save(f, arr, allow_pickle=False)
+                os.replace(tmp_path, path)
+            except OSError:
+                try: os.remove(tmp_path)
+                except OSError: pass
+        if arr.nbytes > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: return
+            self._entries[key] = (arr, owner)
+            self._bytes += arr.nbytes
+            # 上限を超えた分は、最も長く使われていないものから手放す
+            while self._bytes > self.max_bytes:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+RENDER_CACHE = RenderCache()
+
+def configure_render_cache(max_mb=256, spill=False, spill_max_mb=2048):
+    """描画キャッシュの容量とディスクへの保存の有無を設定する（0MBでメモリには保持しない）"""
+    RENDER_CACHE.max_bytes = max(0, int(max_mb)) * 1024 * 1024
+    RENDER_CACHE.spill = DiskCache("render", max_bytes=max(1, int(spill_max_mb)) * 1024 * 1024) if spill else None
+    if RENDER_CACHE.spill is not None: RENDER_CACHE.spill.evict()
+    if RENDER_CACHE.max_bytes == 0: RENDER_CACHE.clear()
+
+def render_page_cached(page, dpi=None, zoom=None, gray=False):
+    """
+    render_page_array と同じ (画像配列, Pixmap または None) を返すが、描画キャッシュにあればそれを使う。
+    縮小・ディスクから得た画像は Pixmap を伴わない（None）ため、画像の大きさは必ず画像配列の shape から取ること。
+    ファイルから開いたページのみ対象（メモリ上の文書等はキャッシュせずに描画する）。
+    """
+    if zoom is not None: dpi = 72 * zoom
+    dpi = round(float(dpi), 2)
+    path = page.parent.name
+    try: digest = file_digest(path) if path and os.path.isfile(path) else None
+    except OSError: digest = None
+    if digest is None: return render_page_array(page, dpi=dpi, gray=gray)
+    entry = RENDER_CACHE.lookup(digest, page.number, dpi, gray)
+    if entry is not None: return entry
+    arr, pix = render_page_array(page, dpi=dpi, gray=gray)
+    RENDER_CACHE.store((digest, page.number, dpi, gray), arr, pix)
+    return arr, pix
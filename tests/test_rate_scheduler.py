@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import os, sys, time, asyncio, threading
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+pytest.importorskip("jaconv")
+pytest.importorskip("openpyxl")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("google.generativeai")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gemini_engine
+from gemini_engine import RateScheduler, model_rate_limits
+
+
+def test_bucket_refills_at_rpm_rate_up_to_burst():
+    scheduler = RateScheduler(rpm=60, burst=2)
+    assert scheduler.acquire() and scheduler.acquire()
+    assert scheduler._requests == pytest.approx(0.0, abs=0.05)
+    # 60 RPM では1秒ごとに1件分補充され、burst を超えては溜まらない
+    scheduler._refill(scheduler._updated + 0.5)
+    assert scheduler._requests == pytest.approx(0.5, abs=0.05)
+    scheduler._refill(scheduler._updated + 10)
+    assert scheduler._requests == 2.0
+
+
+def test_requests_are_spaced_by_rpm():
+    scheduler = RateScheduler(rpm=600)  # 0.1秒間隔
+    started = time.monotonic()
+    for _ in range(4): assert scheduler.acquire()
+    # 最初の1件は即時、残りの3件はそれぞれ約0.1秒待つ
+    assert time.monotonic() - started >= 0.28
+
+
+def test_tpm_budget_is_reserved_and_settled():
+    scheduler = RateScheduler(rpm=6000, tpm=600)
+    assert scheduler.acquire(est_tokens=600)
+    # 予算を使い切ったため、次の600トークンは1分分の補充を待つ
+    assert scheduler._wait_time(600) == pytest.approx(60.0, abs=0.5)
+    # 実際の使用量が見積もりより少なければ、差分が戻る
+    scheduler.settle(600, 300)
+    assert scheduler._wait_time(600) == pytest.approx(30.0, abs=0.5)
+    # TPM を超える見積もりは上限で打ち切り、予算が満たされていれば待たずに送信できる
+    fresh = RateScheduler(rpm=6000, tpm=600)
+    started = time.monotonic()
+    assert fresh.acquire(est_tokens=10 ** 9)
+    assert time.monotonic() - started < 0.5
+
+
+def test_grants_in_request_order():
+    scheduler = RateScheduler(rpm=1200)  # 0.05秒間隔
+    assert scheduler.acquire()
+    granted = []
+    threads = []
+    for n in range(5):
+        th = threading.Thread(target=lambda n=n: scheduler.acquire() and granted.append(n))
+        th.start(); threads.append(th)
+        # 前のスレッドが順番待ちの列に並んでから次のスレッドを開始し、要求順を確定させる
+        while len(scheduler._queue) < n + 1 and th.is_alive(): time.sleep(0.001)
+    for th in threads: th.join(timeout=5)
+    assert granted == list(range(5))
+
+
+def test_abort_releases_the_turn():
+    scheduler = RateScheduler(rpm=1)
+    assert scheduler.acquire()
+    assert scheduler.acquire(should_abort=lambda: True) is False
+    # 待機中に中断された要求は列から外れ、後の要求の順番を塞がない
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    started = time.monotonic()
+    assert scheduler.acquire(should_abort=stop.is_set) is False
+    assert time.monotonic() - started < 2.0
+    assert not scheduler._queue
+
+
+def test_async_acquire_shares_order_and_abort():
+    scheduler = RateScheduler(rpm=1)
+    assert scheduler.acquire()
+    assert asyncio.run(scheduler.acquire_async(should_abort=lambda: True)) is False
+    assert not scheduler._queue
+
+
+def test_explicit_setting_wins_over_model_table():
+    # 上位の Tier の利用者は設定値で表の値を超えて引き上げられる
+    assert model_rate_limits("gemini-2.5-pro", "paid", rpm=1000, tpm=8000000) == (1000, 8000000)
+    # 0（自動）の場合は表の値を使う
+    assert model_rate_limits("gemini-2.5-pro", "paid") == gemini_engine.MODEL_RATE_LIMITS["paid"]["gemini-2.5-pro"]
+    # 前方一致は最も長いものを使う
+    assert model_rate_limits("models/gemini-2.5-flash-lite-preview", "free") == gemini_engine.MODEL_RATE_LIMITS["free"]["gemini-2.5-flash-lite"]
+    # 表に無いモデルの自動は 1 RPM・TPM 制限なし
+    assert model_rate_limits("unknown-model", "free") == (1, 0)
+    assert model_rate_limits("unknown-model", "free", rpm=30) == (30, 0)
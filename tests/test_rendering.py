@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os, sys
+import pytest
+
+np = pytest.importorskip("numpy")
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+pytest.importorskip("jaconv")
+pytest.importorskip("openpyxl")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rendering
+
+
+@pytest.fixture
+def pdf_page(tmp_path):
+    path = str(tmp_path / "sample.pdf")
+    doc = fitz.open()
+    page = doc.new_page(width=216, height=288)  # 3×4インチ（どの解像度でも画素数が割り切れる）
+    page.insert_text((20, 50), "Sample", fontsize=24)
+    doc.save(path)
+    doc.close()
+    doc = fitz.open(path)
+    yield doc[0]
+    doc.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_render_cache():
+    rendering.configure_render_cache(max_mb=64, spill=False)
+    rendering.RENDER_CACHE.clear()
+    yield
+    rendering.RENDER_CACHE.clear()
+
+
+def test_downsampled_hit_has_real_dimensions(pdf_page):
+    # 高倍率で描画してキャッシュに保持したあと、低倍率で取り出す（プレビューの拡大→縮小と同じ流れ）
+    high, high_pix = rendering.render_page_cached(pdf_page, zoom=2.0)
+    assert high.shape[:2] == (high_pix.height, high_pix.width)
+
+    low, low_pix = rendering.render_page_cached(pdf_page, zoom=1.0)
+    expected, expected_pix = rendering.render_page_array(pdf_page, zoom=1.0)
+    # 縮小して得た画像は Pixmap を伴わないが、利用側が使う大きさは画像配列から正しく取れる
+    assert low_pix is None
+    assert low.shape == expected.shape
+    assert low.shape[:2] == (expected_pix.height, expected_pix.width)
+
+
+def test_downsampled_gray_hit_matches_probe_dimensions(pdf_page):
+    # 適応解像度の下見（グレースケール・低解像度）が、RGBの高解像度の描画結果から作られる場合
+    rendering.render_page_cached(pdf_page, dpi=300)
+    gray, _pix = rendering.render_page_cached(pdf_page, dpi=100, gray=True)
+    expected, _ = rendering.render_page_array(pdf_page, dpi=100, gray=True)
+    assert gray.ndim == 2
+    assert gray.shape == expected.shape
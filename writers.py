@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+import os, csv, json
+import threading
+from openpyxl import Workbook
+from openpyxl.styles import Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    from docx import Document
+except ImportError:
+    Document = None
+
+from common import sanitize_excel_text, excel_text_width
+
+# Excelの1セルに格納できる最大文字数
+EXCEL_MAX_CELL_CHARS = 32767
+
+# ==============================
+# Excel 逐次書き込みシンク
+# ==============================
+class ExcelStreamWriter:
+    """
+    xlsxファイルへ行単位で逐次書き込むシンク。
+    xlsxwriter がインストールされている場合は constant_memory モード（書き込み済みの行を即座に一時ファイルへ退避）で動作し、
+    メモリ使用量が行数に依存しない。無い場合は openpyxl で同じインターフェースを提供する。
+    罫線は共有の1スタイルを使い回し、列幅は書き込み時に逐次計算するため保存前にセルを再走査しない。
+    """
+    def __init__(self, path):
+        self.path = path
+        self._ws = None
+        self._row = 0
+        self._widths = {}
+        if xlsxwriter is not None:
+            self._wb = xlsxwriter.Workbook(path, {
+                "constant_memory": True,
+                "strings_to_numbers": False,
+                "strings_to_formulas": False,
+                "strings_to_urls": False,
+            })
+            self._border_format = self._wb.add_format({"border": 1, "border_color": "#000000"})
+        else:
+            self._wb = Workbook(); self._wb.remove(self._wb.active)
+            side = Side(border_style="thin", color="000000")
+            self._border_format = NamedStyle(name="pdfeditmiya_border", border=Border(left=side, right=side, top=side, bottom=side))
+            self._wb.add_named_style(self._border_format)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_sheet(self, title):
+        """新しいシートを追加し、以降の書き込み先にする"""
+        self._apply_widths()
+        if xlsxwriter is not None: self._ws = self._wb.add_worksheet(title)
+        else: self._ws = self._wb.create_sheet(title)
+        self._row = 0
+        self._widths = {}
+
+    def write_row(self, values, bordered=False):
+        """1行分の値を書き込む（制御文字の除去・全角半角の正規化は自動で行う）"""
+        if self._ws is None: self.add_sheet("Sheet1")
+        for col, val in enumerate(values):
+            text = sanitize_excel_text(val)[:EXCEL_MAX_CELL_CHARS]
+            width = excel_text_width(text)
+            if width > self._widths.get(col, -1): self._widths[col] = width
+            if xlsxwriter is not None:
+                if bordered: self._ws.write_string(self._row, col, text, self._border_format)
+                elif text: self._ws.write_string(self._row, col, text)
+            else:
+                cell = self._ws.cell(row=self._row + 1, column=col + 1, value=text)
+                if bordered: cell.style = self._border_format.name
+        self._row += 1
+
+    def write_rows(self, rows, bordered=False):
+        for row in rows: self.write_row(row, bordered)
+
+    def skip_rows(self, count):
+        """空行を挟む"""
+        self._row += count
+
+    def _apply_widths(self):
+        if self._ws is None: return
+        for col, width in self._widths.items():
+            width = min(width + 2, 60)
+            if xlsxwriter is not None: self._ws.set_column(col, col, width)
+            else: self._ws.column_dimensions[get_column_letter(col + 1)].width = width
+
+    def close(self):
+        if self._wb is None: return
+        if self._ws is None: self.add_sheet("Sheet1")
+        self._apply_widths()
+        if xlsxwriter is not None: self._wb.close()
+        else: self._wb.save(self.path)
+        self._wb = None
+
+# ==============================
+# 表データのファイル出力
+# ==============================
+def _write_docx_table(path, rows):
+    if Document is None: raise Exception("python-docx ライブラリがインストールされていません。")
+    doc_out = Document()
+    if rows:
+        table = doc_out.add_table(rows=len(rows), cols=max(len(r) for r in rows))
+        table.style = 'Table Grid'
+        for r_idx, row_data in enumerate(rows):
+            row_cells = table.rows[r_idx].cells
+            for c_idx, val in enumerate(row_data):
+                if c_idx < len(row_cells):
+                    row_cells[c_idx].text = str(val)
+    doc_out.save(path)
+
+def _md_row(row):
+    return "| " + " | ".join(map(lambda x: str(x).replace('\n', '<br>'), row)) + " |\n"
+
+def write_table_file(path_base, out_format, rows, sheet_title="Sheet1"):
+    """2次元配列（先頭行が見出し）を、指定形式の1ファイルとして保存する"""
+    if out_format == "xlsx":
+        with ExcelStreamWriter(f"{path_base}.xlsx") as writer:
+            writer.add_sheet(sheet_title)
+            writer.write_rows(rows)
+    elif out_format == "csv":
+        with open(f"{path_base}.csv", "w", encoding="utf-8-sig", newline="") as f_out: csv.writer(f_out).writerows(rows)
+    elif out_format == "txt":
+        with open(f"{path_base}.txt", "w", encoding="utf-8") as f_out:
+            for row_data in rows: f_out.write("\t".join(map(str, row_data)) + "\n")
+    elif out_format == "json":
+        with open(f"{path_base}.json", "w", encoding="utf-8") as f_out: json.dump(rows, f_out, ensure_ascii=False, indent=2)
+    elif out_format == "md":
+        with open(f"{path_base}.md", "w", encoding="utf-8") as f_out:
+            if rows:
+                f_out.write("| " + " | ".join(map(str, rows[0])) + " |\n")
+                f_out.write("|" + "|".join(["---"] * len(rows[0])) + "|\n")
+                for row in rows[1:]: f_out.write(_md_row(row))
+    elif out_format == "docx":
+        _write_docx_table(f"{path_base}.docx", rows)
+
+class ConsolidatedTableSink:
+    """
+    複数ページの表データを1つのファイルへまとめて逐次書き込むシンク。
+    write_page() はスレッドセーフで、並列処理でページが順不同に完了しても連番(seq)の順に並べ替えてから書き込む。
+    見出し行は直前に書き込んだ見出しと異なる場合のみ出力する。json形式は1ページ1行のJSONL（.jsonl）として出力する。
+    """
+    def __init__(self, path_base, out_format, sheet_title="Data", first_seq=0):
+        self.out_format = out_format
+        self.path = f"{path_base}.{'jsonl' if out_format == 'json' else out_format}"
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_seq = first_seq
+        self._last_header = None
+        self._closed = False
+        self._excel = self._file = self._csv = self._docx_rows = None
+        if out_format == "xlsx":
+            self._excel = ExcelStreamWriter(self.path)
+            self._excel.add_sheet(sheet_title)
+        elif out_format == "docx":
+            if Document is None: raise Exception("python-docx ライブラリがインストールされていません。")
+            self._docx_rows = []
+        elif out_format == "csv":
+            self._file = open(self.path, "w", encoding="utf-8-sig", newline="")
+            self._csv = csv.writer(self._file)
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+
+    def write_page(self, seq, rows, meta=None):
+        """seq番目のページの表データを登録し、書き込み順が来ているページをまとめて書き出す"""
+        with self._lock:
+            if self._closed: return  # 中断後に完了したページは書き込まない
+            self._pending[seq] = (rows, meta)
+            while self._next_seq in self._pending:
+                self._write(*self._pending.pop(self._next_seq))
+                self._next_seq += 1
+
+    def _write(self, rows, meta):
+        if not rows: return
+        header, body = rows[0], rows[1:]
+        if self.out_format == "json":
+            self._file.write(json.dumps({**(meta or {}), "header": header, "rows": body}, ensure_ascii=False) + "\n")
+            return
+        new_header = header != self._last_header
+        self._last_header = header
+        if self._excel:
+            self._excel.write_rows([header] + body if new_header else body)
+        elif self._csv:
+            self._csv.writerows([header] + body if new_header else body)
+        elif self._docx_rows is not None:
+            self._docx_rows.extend([header] + body if new_header else body)
+        elif self.out_format == "md":
+            if new_header:
+                if self._file.tell() > 0: self._file.write("\n")
+                self._file.write("| " + " | ".join(map(str, header)) + " |\n")
+                self._file.write("|" + "|".join(["---"] * len(header)) + "|\n")
+            for row in body: self._file.write(_md_row(row))
+        else:
+            for row_data in ([header] + body if new_header else body): self._file.write("\t".join(map(str, row_data)) + "\n")
+
+    def close(self):
+        """未書き込みのページ（中断等で連番が欠けたもの）を順に書き出してファイルを閉じる"""
+        with self._lock:
+            if self._closed: return
+            self._closed = True
+            for seq in sorted(self._pending): self._write(*self._pending[seq])
+            self._pending.clear()
+            if self._excel: self._excel.close(); self._excel = None
+            if self._file: self._file.close(); self._file = None
+            if self._docx_rows is not None:
+                _write_docx_table(self.path, self._docx_rows); self._docx_rows = None
+
+# ==============================
+# 出力単位（ページ / PDF / 全体）の振り分け
+# ==============================
+OUTPUT_GROUPINGS = ["page", "document", "job"]
+
+class PageTableOutput:
+    """
+    OCR・AI抽出のページごとの表データを、出力単位の設定に従って書き込み先へ振り分ける。
+      page     : 1ページ1ファイル（従来の動作）
+      document : PDFファイルごとに1ファイル
+      job      : 処理全体で1ファイル（先頭列に元ファイル名を追加）
+    out_formats に複数の形式を渡すと、同じ表データを全ての形式へ同時に書き込む（抽出は1回で済む）。
+    並列実行中の複数スレッドから write_page() を呼び出してよい。
+    """
+    def __init__(self, save_dir, out_formats, grouping, page_name, doc_suffix, job_name, sheet_title, page_sheet_title=None):
+        self.save_dir = save_dir
+        self.out_formats = [out_formats] if isinstance(out_formats, str) else list(dict.fromkeys(out_formats))
+        self.grouping = grouping if grouping in OUTPUT_GROUPINGS else "page"
+        self.page_name = page_name              # (base, page_num, total_pages) -> ページ単位のファイル名
+        self.doc_suffix = doc_suffix            # PDF単位のファイル名に付ける接尾辞
+        self.job_name = job_name                # 全体で1ファイルの場合のファイル名
+        self.sheet_title = sheet_title
+        self.page_sheet_title = page_sheet_title or (lambda page_num, total_pages: sheet_title)
+        self._lock = threading.Lock()
+        self._doc_sinks = {}
+        self._doc_written = {}
+        self._job_sinks = None
+        self._job_seq = 0
+
+    def write_page(self, file_path, page_num, total_pages, rows, seq=None):
+        """
+        1ページ分の表データ(rows)を書き込む。page_num は1始まり。
+        seq は全体で1ファイルにまとめる場合の並び順（省略時は書き込み順）。
+        """
+        base = os.path.splitext(os.path.basename(file_path))[0]
+        if self.grouping == "page":
+            path_base = os.path.join(self.save_dir, self.page_name(base, page_num, total_pages))
+            for fmt in self.out_formats:
+                write_table_file(path_base, fmt, rows, self.page_sheet_title(page_num, total_pages))
+            return
+
+        meta = {"file": os.path.basename(file_path), "page": page_num}
+        if self.grouping == "job":
+            with self._lock:
+                if self._job_sinks is None:
+                    self._job_sinks = [ConsolidatedTableSink(os.path.join(self.save_dir, self.job_name), fmt, self.sheet_title) for fmt in self.out_formats]
+                if seq is None: seq = self._job_seq; self._job_seq += 1
+            job_rows = rows
+            if rows: job_rows = [["元ファイル名"] + list(rows[0])] + [[os.path.basename(file_path)] + list(r) for r in rows[1:]]
+            for sink in self._job_sinks:
+                sink.write_page(seq, rows if sink.out_format == "json" else job_rows, meta)
+            return
+
+        with self._lock:
+            sinks = self._doc_sinks.get(file_path)
+            if sinks is None:
+                sinks = [ConsolidatedTableSink(os.path.join(self.save_dir, f"{base}{self.doc_suffix}"), fmt, self.sheet_title, first_seq=1) for fmt in self.out_formats]
+                self._doc_sinks[file_path] = sinks
+        for sink in sinks: sink.write_page(page_num, rows, meta)
+        with self._lock:
+            # 全ページが揃ったPDFは、その時点でファイルを閉じる
+            self._doc_written[file_path] = self._doc_written.get(file_path, 0) + 1
+            if self._doc_written[file_path] >= total_pages:
+                for sink in self._doc_sinks.pop(file_path): sink.close()
+
+    def output_paths(self, file_path, page_num, total_pages):
+        """write_page() でそのページを書き込むファイルのパス一覧（まとめて出力する場合は共有のファイル）"""
+        base = os.path.splitext(os.path.basename(file_path))[0]
+        if self.grouping == "page": path_base = os.path.join(self.save_dir, self.page_name(base, page_num, total_pages))
+        elif self.grouping == "job": path_base = os.path.join(self.save_dir, self.job_name)
+        else: path_base = os.path.join(self.save_dir, f"{base}{self.doc_suffix}")
+        return [f"{path_base}.{'jsonl' if fmt == 'json' and self.grouping != 'page' else fmt}" for fmt in self.out_formats]
+
+    def close(self):
+        with self._lock:
+            for sinks in self._doc_sinks.values():
+                for sink in sinks: sink.close()
+            self._doc_sinks.clear()
+            if self._job_sinks:
+                for sink in self._job_sinks: sink.close()
+                self._job_sinks = None
+
+# ==============================
+# ページ単位の完了記録（中断したジョブの再開用）
+# ==============================
+class PageJournal:
+    """
+    完了したページを1行1ページのJSONLに追記していく記録。出力先フォルダに保存し、中断したジョブを再実行した際に完了済みのページを飛ばす。
+    各行は (ファイル内容のハッシュ, ページ番号, 設定のハッシュ) と、出力先のパス・表データを持つ。設定のハッシュが異なる行は読み込まない。
+    表データも記録するため、まとめて出力する場合（PDFごと / 全体で1ファイル）や出力形式を変えた場合も、再送信せずに出力し直せる。
+    強制終了などで最終行が書きかけになっていても、その行だけを無視する。record() は複数スレッドから呼び出してよい。
+    """
+    def __init__(self, path, config_hash):
+        self.path = path
+        self.config_hash = config_hash
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._file = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: entry = json.loads(line)
+                    except ValueError: continue
+                    if isinstance(entry, dict) and entry.get("config") == config_hash:
+                        self._entries[(entry.get("digest"), entry.get("page"))] = entry
+        except OSError: pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, digest, page_num):
+        """完了済みのページの記録（{"file", "page", "outputs", "rows", ...}）を返す。未完了なら None"""
+        return self._entries.get((digest, page_num))
+
+    def record(self, digest, page_num, file_path, outputs, rows):
+        entry = {"config": self.config_hash, "digest": digest, "page": page_num, "file": os.path.basename(file_path), "outputs": outputs, "rows": rows}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._entries[(digest, page_num)] = entry
+            try:
+                if self._file is None: self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+                os.fsync(self._file.fileno())  # 強制終了されても、完了したページの記録が失われないようにする
+            except OSError: pass
+
+    def close(self, completed=False):
+        """記録を閉じる。completed=True（全てのページが記録済みで、再開用の記録が不要）の場合は削除する"""
+        with self._lock:
+            if self._file is not None: self._file.close(); self._file = None
+            if completed:
+                try: os.remove(self.path)
+                except OSError: pass